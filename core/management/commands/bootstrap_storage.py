@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.storage import storage
+
+
+class Command(BaseCommand):
+    help = ('Подготовка хранилища STORAGE_BACKEND: для S3 - создание корзины S3_BUCKET_NAME и установка правил '
+            'жизненного цикла объектов, для local - создание папки. Выполняется один раз при развёртывании, '
+            'а не при каждом запуске процесса')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='только проверить доступность хранилища и наличие корзины')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            try:
+                storage.bootstrap()
+            except Exception as err:
+                raise CommandError(f'Не удалось подготовить хранилище: {err}')
+        if not storage.health_check():
+            raise CommandError('Хранилище недоступно')
+        self.stdout.write(f'Хранилище {settings.STORAGE_BACKEND} доступно')
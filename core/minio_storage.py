@@ -1,18 +1,213 @@
+import io
+import logging
+import os
+import queue
+import random
+import socket
+import threading
+import time
 from datetime import timedelta
 
+import certifi
+import urllib3
+from urllib3.connection import HTTPConnection
+from urllib3.util import Retry, Timeout
+
 from core.settings import (
     ACCESS_KEY,
     BUCKET_NAME,
     ENDPOINT_URL,
     MINIO_SECURE,
     OUTER_ENDPOINT_URL,
+    S3_CONNECT_TIMEOUT,
+    S3_HEALTH_CHECK_INTERVAL,
+    S3_HEALTH_CHECK_TIMEOUT,
+    S3_IMAGE_PROCESSING_RETENTION_DAYS,
+    S3_KEEPALIVE,
+    S3_POOL_SIZE,
+    S3_READ_TIMEOUT,
+    S3_RETRY_ATTEMPTS,
+    S3_RETRY_BACKOFF_BASE,
+    S3_RETRY_BACKOFF_MAX,
+    S3_UPLOAD_PARALLEL,
+    S3_UPLOAD_PART_SIZE,
     SECRET_KEY,
 )
 from minio import Minio
+from minio.datatypes import Part
+from minio.error import S3Error
 from minio.lifecycleconfig import Expiration, Filter, LifecycleConfig, Rule
 
+from core.storage_backends import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+# размер части multipart-загрузки (минимально допустимый S3 - 5 МБ)
+UPLOAD_PART_SIZE = S3_UPLOAD_PART_SIZE
+# кол-во частей одного объекта, загружаемых параллельно
+UPLOAD_PARALLEL = S3_UPLOAD_PARALLEL
+# максимальное кол-во готовых частей в очереди на загрузку: память потоковой загрузки ограничена
+# (UPLOAD_MAX_PARTS_IN_FLIGHT + UPLOAD_PARALLEL + 1) * UPLOAD_PART_SIZE - очередь, загружаемые
+# и заполняемая части
+UPLOAD_MAX_PARTS_IN_FLIGHT = 2
+# повторы операций с хранилищем: кол-во попыток, базовая и максимальная задержка, сек
+UPLOAD_ATTEMPTS = S3_RETRY_ATTEMPTS
+UPLOAD_BACKOFF_BASE = S3_RETRY_BACKOFF_BASE
+UPLOAD_BACKOFF_MAX = S3_RETRY_BACKOFF_MAX
+# повторы на уровне HTTP-клиента (ошибки соединения и 5xx); повтор операций целиком - RetryPolicy
+HTTP_RETRIES = 2
+# ошибки S3, при которых повтор бесполезен
+NON_RETRYABLE_S3_CODES = (
+    "AccessDenied",
+    "InvalidAccessKeyId",
+    "NoSuchBucket",
+    "NoSuchKey",
+    "SignatureDoesNotMatch",
+)
+
+# правила жизненного цикла объектов корзины: префикс объекта -> срок хранения, дней
+LIFECYCLE_RULES = {
+    "zipfiles/": 1,
+    "images/": 1,
+}
+if S3_IMAGE_PROCESSING_RETENTION_DAYS:
+    # результаты обработчика изображений; срок ограничивает и время жизни записей кэша результатов
+    LIFECYCLE_RULES["image_processing/"] = S3_IMAGE_PROCESSING_RETENTION_DAYS
+# префикс идентификаторов правил, устанавливаемых bootstrap: остальные правила корзины сохраняются
+LIFECYCLE_RULE_ID_PREFIX = "cleanup_dir_"
+
+
+class RetryPolicy:
+    """
+    Повтор операции с хранилищем с экспоненциально растущей задержкой и случайным разбросом (full jitter):
+    одновременно упавшие загрузки не повторяются синхронно
+    """
+
+    def __init__(
+        self,
+        attempts: int = UPLOAD_ATTEMPTS,
+        base_delay: float = UPLOAD_BACKOFF_BASE,
+        max_delay: float = UPLOAD_BACKOFF_MAX,
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        :param attempt: номер неудачной попытки, начиная с 0
+        :return: задержка перед следующей попыткой, сек
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def is_retryable(err: Exception) -> bool:
+        return not (isinstance(err, S3Error) and err.code in NON_RETRYABLE_S3_CODES)
+
+    def call(self, func, *args, description: str = "Операция с хранилищем", on_error=None, **kwargs):
+        """
+        Вызов func(*args, **kwargs) с повторами
+        :param description: описание операции для логов
+        :param on_error: функция, вызываемая с исключением каждой неудачной попытки
+        :return: результат func
+        """
+        for attempt in range(self.attempts):
+            try:
+                return func(*args, **kwargs)
+            except Exception as err:
+                if on_error:
+                    on_error(err)
+                if attempt == self.attempts - 1 or not self.is_retryable(err):
+                    raise
+                delay = self.get_delay(attempt)
+                logger.warning(f"{description}: ошибка {err}, повтор через {delay:.1f} сек...")
+                time.sleep(delay)
+
+
+# общая политика повторов операций с хранилищем для всех модулей
+STORAGE_RETRY_POLICY = RetryPolicy()
+
+
+def make_http_client(pool_size: int, connect_timeout: float, read_timeout: float,
+                     keepalive: bool, retries: bool = True) -> urllib3.PoolManager:
+    """
+    HTTP-клиент minio с настраиваемым пулом соединений (аналог клиента minio по-умолчанию)
+    :param pool_size: максимальное кол-во соединений пула, переиспользуемых между запросами
+    :param connect_timeout: таймаут подключения, сек
+    :param read_timeout: таймаут чтения ответа, сек
+    :param keepalive: TCP keep-alive: простаивающие соединения пула не закрываются сетевым оборудованием
+    :param retries: повторы запросов при ошибках соединения и 5xx (HTTP_RETRIES)
+    :return:
+    """
+    socket_options = list(HTTPConnection.default_socket_options)
+    if keepalive:
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    return urllib3.PoolManager(
+        timeout=Timeout(connect=connect_timeout, read=read_timeout),
+        maxsize=pool_size,
+        cert_reqs='CERT_REQUIRED',
+        ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+        retries=(
+            Retry(total=HTTP_RETRIES, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]) if retries else False
+        ),
+        socket_options=socket_options,
+    )
+
+
+class MultipartApi:
+    """
+    Адаптер multipart-загрузки по частям. Публичный API minio (put_object) загружает части
+    последовательно из одного потока чтения, поэтому потоковая загрузка (StreamingUpload) использует
+    внутренние методы клиента minio. Они не входят в публичный API: версия minio закреплена точно
+    в requirements.txt, наличие методов проверяется при создании адаптера, все обращения
+    к внутренним методам minio выполняются только через этот класс
+    """
+
+    REQUIRED_METHODS = (
+        "_create_multipart_upload",
+        "_upload_part",
+        "_complete_multipart_upload",
+        "_abort_multipart_upload",
+    )
+
+    def __init__(self, client: Minio):
+        missing = [name for name in self.REQUIRED_METHODS if not callable(getattr(client, name, None))]
+        if missing:
+            raise RuntimeError(
+                f"Установленная версия minio не поддерживает потоковую загрузку (нет {', '.join(missing)}), "
+                f"установите версию из requirements.txt"
+            )
+        self._client = client
+
+    def create(self, bucket_name: str, object_name: str) -> str:
+        """
+        :return: идентификатор multipart-загрузки
+        """
+        return self._client._create_multipart_upload(
+            bucket_name, object_name, {"Content-Type": "application/octet-stream"}
+        )
+
+    def upload_part(self, bucket_name: str, object_name: str, upload_id: str, part_number: int, data: bytes) -> Part:
+        etag = self._client._upload_part(bucket_name, object_name, data, None, upload_id, part_number)
+        return Part(part_number, etag)
+
+    def complete(self, bucket_name: str, object_name: str, upload_id: str, parts: list[Part]):
+        self._client._complete_multipart_upload(bucket_name, object_name, upload_id, parts)
+
+    def abort(self, bucket_name: str, object_name: str, upload_id: str):
+        self._client._abort_multipart_upload(bucket_name, object_name, upload_id)
+
+
+class MyStorage(BaseStorage):
+    """
+    Клиент S3-хранилища. Подключение создаётся при первом обращении к client (импорт модуля
+    не обращается к сети) и переиспользуется всеми потоками процесса: пул соединений urllib3
+    клиента minio общий. Соединения клиента проверяются раз в health_check_interval и после сетевой
+    ошибки операции, не прошедший проверку клиент пересоздаётся. Создание корзины и правил жизненного
+    цикла - явный шаг bootstrap (команда manage.py bootstrap_storage). Операции с хранилищем
+    повторяются по retry_policy
+    """
 
-class MyStorage:
     def __init__(
         self,
         endpoint: str,
@@ -20,36 +215,176 @@ class MyStorage:
         secret_key: str,
         bucket_name,
         secure: bool = False,
+        pool_size: int = S3_POOL_SIZE,
+        connect_timeout: float = S3_CONNECT_TIMEOUT,
+        read_timeout: float = S3_READ_TIMEOUT,
+        keepalive: bool = S3_KEEPALIVE,
+        part_size: int = UPLOAD_PART_SIZE,
+        parallel_uploads: int = UPLOAD_PARALLEL,
+        retry_policy: RetryPolicy = STORAGE_RETRY_POLICY,
+        health_check_interval: float = S3_HEALTH_CHECK_INTERVAL,
+        health_check_timeout: float = S3_HEALTH_CHECK_TIMEOUT,
     ):
-        self.client = Minio(
-            endpoint=endpoint,
-            access_key=access_key,
-            secret_key=secret_key,
-            secure=secure,  # отключение подключения по HTTPS
+        """
+        :param pool_size: размер пула соединений (не меньше parallel_uploads)
+        :param connect_timeout: таймаут подключения, сек
+        :param read_timeout: таймаут чтения ответа, сек
+        :param keepalive: TCP keep-alive соединений пула
+        :param part_size: размер части multipart-загрузки
+        :param parallel_uploads: кол-во частей одного объекта, загружаемых параллельно
+        :param retry_policy: политика повторов операций
+        :param health_check_interval: интервал проверки соединения при обращении к клиенту, сек
+        (0 - только после сетевых ошибок)
+        :param health_check_timeout: таймаут проверки соединения, сек
+        """
+        self.endpoint = endpoint
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.bucket_name = bucket_name
+        self.secure = secure
+        self.pool_size = max(pool_size, parallel_uploads)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive = keepalive
+        self.part_size = part_size
+        self.parallel_uploads = parallel_uploads
+        self.retry_policy = retry_policy
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self._client: Minio | None = None
+        # клиент проверки соединения: короткий таймаут, без повторов
+        self._probe_client: Minio | None = None
+        self._client_lock = threading.Lock()
+        # время последней проверки соединения (time.monotonic) и признак сетевой ошибки после неё
+        self._checked_at = 0.0
+        self._check_required = False
+
+    @property
+    def client(self) -> Minio:
+        """
+        Клиент minio, создаётся при первом обращении. Переиспользуемый клиент проверяется,
+        если после прошлой проверки была сетевая ошибка или прошло health_check_interval.
+        Проверку выполняет один поток вне _client_lock, остальные потоки продолжают работать
+        с текущим клиентом; блокировка берётся только для замены клиента
+        """
+        with self._client_lock:
+            client = self._client
+            check_due = client is not None and self._is_check_due()
+            if check_due:
+                self._check_required = False
+                self._checked_at = time.monotonic()
+        stale_client = None
+        if check_due and not self._check_client():
+            stale_client, client = client, None
+        if client is None:
+            new_client = self._create_client(
+                self.pool_size, self.connect_timeout, self.read_timeout, retries=True
+            )
+            with self._client_lock:
+                # клиент мог быть уже пересоздан другим потоком
+                if self._client is None or self._client is stale_client:
+                    self._client = new_client
+                    self._checked_at = time.monotonic()
+                client = self._client
+        return client
+
+    def _create_client(self, pool_size: int, connect_timeout: float, read_timeout: float, retries: bool) -> Minio:
+        return Minio(
+            endpoint=self.endpoint,
+            access_key=self.access_key,
+            secret_key=self.secret_key,
+            secure=self.secure,  # отключение подключения по HTTPS
+            http_client=make_http_client(pool_size, connect_timeout, read_timeout, self.keepalive, retries=retries),
         )
 
-        if not self.client.bucket_exists(bucket_name):
-            self.client.make_bucket(bucket_name)
-            print('Создан тестовый bucket')
-
-            config = LifecycleConfig(
-                [
-                    Rule(
-                        rule_id="cleanup_dir_zipfiles",
-                        status="Enabled",
-                        expiration=Expiration(days=1),
-                        rule_filter=Filter(prefix="zipfiles/"),
-                    ),
-                    Rule(
-                        rule_id="cleanup_dir_images",
-                        status="Enabled",
-                        expiration=Expiration(days=1),
-                        rule_filter=Filter(prefix="images/"),
-                    ),
-                ]
+    @property
+    def multipart(self) -> MultipartApi:
+        """
+        Multipart-загрузка по частям через текущий клиент
+        """
+        return MultipartApi(self.client)
+
+    def _is_check_due(self) -> bool:
+        if self._check_required:
+            return True
+        return bool(self.health_check_interval) and time.monotonic() - self._checked_at >= self.health_check_interval
+
+    def _check_client(self) -> bool:
+        """
+        Проверка соединения с хранилищем отдельным клиентом с коротким таймаутом и без повторов:
+        недоступное хранилище не задерживает проверку на таймаут чтения и повторы основного клиента
+        :return: True - проверка пройдена, иначе клиент создаётся заново с новым пулом соединений
+        """
+        if self._probe_client is None:
+            self._probe_client = self._create_client(
+                1, self.health_check_timeout, self.health_check_timeout, retries=False
             )
-            self.client.set_bucket_lifecycle(BUCKET_NAME, config)
-        print("Подключение к хранилищу успешно")
+        try:
+            self._probe_client.bucket_exists(self.bucket_name)
+        except Exception as err:
+            logger.warning(f"Проверка соединения с хранилищем {self.endpoint} не пройдена: {err}, "
+                           f"клиент создаётся заново")
+            return False
+        return True
+
+    def report_error(self, err: Exception):
+        """
+        Учёт ошибки операции с хранилищем: после сетевой ошибки (не ответа S3 с кодом ошибки)
+        соединение проверяется при следующем обращении к клиенту
+        :param err: исключение операции
+        """
+        if not isinstance(err, S3Error):
+            self._check_required = True
+
+    def reset(self):
+        """
+        Сброс клиента: следующее обращение создаст новый клиент с новым пулом соединений
+        """
+        with self._client_lock:
+            self._client = None
+            self._check_required = False
+
+    def health_check(self) -> bool:
+        """
+        Проверка доступности хранилища и корзины. При ошибке клиент сбрасывается,
+        чтобы не переиспользовать соединения к недоступному хранилищу
+        :return: True, если хранилище доступно и корзина существует
+        """
+        try:
+            exists = self.client.bucket_exists(self.bucket_name)
+        except Exception as err:
+            logger.error(f"Хранилище {self.endpoint} недоступно: {err}")
+            self.reset()
+            return False
+        if not exists:
+            logger.error(f"Корзина {self.bucket_name} не найдена, выполните manage.py bootstrap_storage")
+        return exists
+
+    def bootstrap(self):
+        """
+        Создание корзины (если отсутствует) и установка правил жизненного цикла объектов (LIFECYCLE_RULES).
+        Правила, установленные bootstrap ранее, заменяются, остальные правила корзины сохраняются
+        """
+        if not self.client.bucket_exists(self.bucket_name):
+            self.client.make_bucket(self.bucket_name)
+            logger.info(f"Создана корзина {self.bucket_name}")
+
+        current_config = self.client.get_bucket_lifecycle(self.bucket_name)
+        rules = [
+            rule for rule in (current_config.rules if current_config else [])
+            if not (rule.rule_id or "").startswith(LIFECYCLE_RULE_ID_PREFIX)
+        ]
+        rules += [
+            Rule(
+                rule_id=f"{LIFECYCLE_RULE_ID_PREFIX}{prefix.strip('/')}",
+                status="Enabled",
+                expiration=Expiration(days=days),
+                rule_filter=Filter(prefix=prefix),
+            )
+            for prefix, days in LIFECYCLE_RULES.items()
+        ]
+        self.client.set_bucket_lifecycle(self.bucket_name, LifecycleConfig(rules))
+        logger.info(f"Правила жизненного цикла корзины {self.bucket_name} установлены")
 
     def create_bucket(self, bucket_name=BUCKET_NAME):
         self.client.make_bucket(bucket_name)
@@ -61,13 +396,94 @@ class MyStorage:
         self, file_name: str, file_path: str, bucket_name: str = BUCKET_NAME
     ):
         """
-        Загрузка файла в S3-хранилище
+        Загрузка файла в S3-хранилище. Файл больше части загружается multipart-загрузкой
+        с параллельной загрузкой parallel_uploads частей, при ошибке загрузка повторяется
         :param bucket_name:
         :param file_name:
         :param file_path:
         :return: None
         """
-        self.client.fput_object(bucket_name, file_name, file_path)
+        self.retry_policy.call(
+            lambda: self.client.fput_object(
+                bucket_name, file_name, file_path,
+                part_size=self.part_size, num_parallel_uploads=self.parallel_uploads,
+            ),
+            description=f"Загрузка файла {file_name}", on_error=self.report_error,
+        )
+
+    def get_object(self, file_name: str, bucket_name: str = BUCKET_NAME) -> bytes:
+        """
+        Чтение объекта из S3-хранилища целиком, при ошибке чтение повторяется
+        :param file_name: имя объекта в хранилище
+        :param bucket_name:
+        :return: содержимое объекта
+        """
+        def read():
+            response = self.client.get_object(bucket_name, file_name)
+            try:
+                return response.read()
+            finally:
+                response.close()
+                response.release_conn()
+
+        return self.retry_policy.call(read, description=f"Чтение файла {file_name}", on_error=self.report_error)
+
+    def put_object(
+        self, file_name: str, data, length: int = -1, bucket_name: str = BUCKET_NAME,
+        part_size: int = None
+    ):
+        """
+        Загрузка данных из файлового объекта в S3-хранилище
+        :param file_name: имя объекта в хранилище
+        :param data: файловый объект с методом read
+        :param length: размер данных, -1 - неизвестен (multipart-загрузка частями по part_size)
+        :param bucket_name:
+        :param part_size: размер части multipart-загрузки, по-умолчанию part_size хранилища
+        :return: None
+        """
+        try:
+            self.client.put_object(bucket_name, file_name, data, length=length, part_size=part_size or self.part_size)
+        except Exception as err:
+            self.report_error(err)
+            raise
+
+    def open_upload(self, file_name: str, bucket_name: str = BUCKET_NAME) -> 'StreamingUpload':
+        """
+        Открывает поток для записи объекта в S3-хранилище: готовые части загружаются фоновыми
+        потоками по мере записи (параллельно с формированием следующих частей), без сохранения на диск
+        :param file_name: имя объекта в хранилище
+        :param bucket_name:
+        :return: файловый объект, доступный для записи
+        """
+        return StreamingUpload(self, file_name, bucket_name, self.part_size, self.retry_policy, self.parallel_uploads)
+
+    def object_exists(self, file_name: str, bucket_name: str = BUCKET_NAME) -> bool:
+        """
+        Проверка наличия объекта в S3-хранилище
+        :param file_name: имя объекта в хранилище
+        :param bucket_name:
+        :return:
+        """
+        try:
+            self.client.stat_object(bucket_name, file_name)
+            return True
+        except S3Error as err:
+            if err.code in ("NoSuchKey", "NoSuchObject"):
+                return False
+            raise
+        except Exception as err:
+            self.report_error(err)
+            raise
+
+    @staticmethod
+    def object_expiration(file_name: str):
+        """
+        Срок хранения объекта согласно правилам жизненного цикла корзины (LIFECYCLE_RULES)
+        :param file_name: имя объекта в хранилище
+        :return: timedelta или None, если объект хранится бессрочно
+        """
+        days = [days for prefix, days in LIFECYCLE_RULES.items() if file_name.startswith(prefix)]
+        return timedelta(days=min(days)) if days else None
 
     def share_file_from_bucket(
         self, file_name, expire=timedelta(seconds=60), bucket_name=BUCKET_NAME
@@ -83,4 +499,188 @@ class MyStorage:
         return f"http{'s' if MINIO_SECURE else ''}://{OUTER_ENDPOINT_URL}/minio/{bucket_name}/{file_name}"
 
 
+class StreamingUpload(io.RawIOBase):
+    """
+    Файловый объект для потоковой записи в S3-хранилище. Записанные данные собираются в части
+    по part_size. Объект из одной части загружается одним запросом без фоновых потоков. Когда
+    появляется вторая часть, запускаются фоновые потоки (parallel_uploads): готовые части через
+    ограниченную очередь передаются им и загружаются multipart-загрузкой параллельно (MultipartApi).
+    Каждая часть повторяется отдельно по retry_policy.
+    Поддерживает протокол контекстного менеджера: при выходе с исключением загрузка отменяется
+    """
+
+    def __init__(
+        self,
+        storage: MyStorage,
+        file_name: str,
+        bucket_name: str = BUCKET_NAME,
+        part_size: int = UPLOAD_PART_SIZE,
+        retry_policy: RetryPolicy = STORAGE_RETRY_POLICY,
+        parallel_uploads: int = UPLOAD_PARALLEL,
+    ):
+        super().__init__()
+        self.file_name = file_name
+        self._storage = storage
+        self._bucket_name = bucket_name
+        self._part_size = part_size
+        self._retry_policy = retry_policy
+        self._parallel_uploads = max(parallel_uploads, 1)
+        # очередь частей (номер части, данные), None - завершение потока загрузки
+        self._parts = queue.Queue(maxsize=UPLOAD_MAX_PARTS_IN_FLIGHT)
+        self._buffer = bytearray()
+        # первая часть удерживается до появления второй: объект из одной части загружается одним запросом
+        self._first_part: bytes | None = None
+        self._parts_count = 0
+        self._uploaded_parts: list[Part] = []
+        self._error = None
+        self._upload_id = None
+        self._upload_id_lock = threading.Lock()
+        # объём записанных данных, байт
+        self.bytes_written = 0
+        # потоки загрузки частей, запускаются при появлении второй части
+        self._threads: list[threading.Thread] = []
+
+    def _start_threads(self):
+        self._threads = [threading.Thread(target=self._upload, daemon=True) for _ in range(self._parallel_uploads)]
+        for thread in self._threads:
+            thread.start()
+
+    def _upload(self):
+        while True:
+            item = self._parts.get()
+            if item is None:
+                return
+            if self._error:
+                # загрузка уже не удалась или отменена - оставшиеся части пропускаются
+                continue
+            part_number, data = item
+            try:
+                self._uploaded_parts.append(self._upload_part(part_number, data))
+            except BaseException as err:
+                self._error = self._error or err
+
+    def _get_upload_id(self) -> str:
+        with self._upload_id_lock:
+            if self._upload_id is None:
+                self._upload_id = self._retry_policy.call(
+                    lambda: self._storage.multipart.create(self._bucket_name, self.file_name),
+                    description=f"Начало загрузки файла {self.file_name}", on_error=self._storage.report_error,
+                )
+            return self._upload_id
+
+    def _upload_part(self, part_number: int, data: bytes) -> Part:
+        upload_id = self._get_upload_id()
+        return self._retry_policy.call(
+            lambda: self._storage.multipart.upload_part(self._bucket_name, self.file_name, upload_id, part_number, data),
+            description=f"Загрузка части {part_number} файла {self.file_name}", on_error=self._storage.report_error,
+        )
+
+    def _abort_multipart_upload(self):
+        if self._upload_id is None:
+            return
+        try:
+            self._storage.multipart.abort(self._bucket_name, self.file_name, self._upload_id)
+        except Exception as err:
+            logger.error(f"Не удалось отменить загрузку файла {self.file_name}: {err}")
+
+    def _put(self, item):
+        # ожидание места в очереди с проверкой, что загрузка частей не завершилась ошибкой
+        while True:
+            if self._error:
+                raise IOError(f"Не удалось загрузить файл {self.file_name} в хранилище: {self._error}")
+            try:
+                self._parts.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _put_part(self, data: bytes):
+        self._parts_count += 1
+        if self._parts_count == 1:
+            self._first_part = data
+            return
+        if self._parts_count == 2:
+            # объект не помещается в одну часть - запуск multipart-загрузки
+            self._start_threads()
+            first_part, self._first_part = self._first_part, None
+            self._put((1, first_part))
+        self._put((self._parts_count, data))
+
+    def _stop_threads(self):
+        for _ in self._threads:
+            self._parts.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self._part_size:
+            self._put_part(bytes(self._buffer[:self._part_size]))
+            del self._buffer[:self._part_size]
+        return len(data)
+
+    def close(self):
+        """
+        Завершение записи и ожидание окончания загрузки
+        """
+        if self.closed:
+            return
+        try:
+            try:
+                if self._parts_count and self._buffer:
+                    # остаток - последняя часть multipart-загрузки
+                    self._put_part(bytes(self._buffer))
+            finally:
+                self._stop_threads()
+            if self._parts_count <= 1:
+                # объект помещается в одну часть - загрузка одним запросом
+                data = self._first_part if self._first_part is not None else bytes(self._buffer)
+                self._retry_policy.call(
+                    lambda: self._storage.put_object(
+                        self.file_name, io.BytesIO(data), length=len(data), bucket_name=self._bucket_name
+                    ),
+                    description=f"Загрузка файла {self.file_name}",
+                )
+                return
+            if self._error:
+                raise IOError(f"Не удалось загрузить файл {self.file_name} в хранилище: {self._error}")
+            parts = sorted(self._uploaded_parts, key=lambda part: part.part_number)
+            self._retry_policy.call(
+                lambda: self._storage.multipart.complete(self._bucket_name, self.file_name, self._upload_id, parts),
+                description=f"Завершение загрузки файла {self.file_name}", on_error=self._storage.report_error,
+            )
+        except BaseException:
+            self._abort_multipart_upload()
+            raise
+        finally:
+            self._buffer.clear()
+            self._first_part = None
+            super().close()
+
+    def abort(self, reason: BaseException = None):
+        """
+        Отмена загрузки: незавершённая multipart-загрузка прерывается
+        """
+        if self.closed:
+            return
+        try:
+            self._error = self._error or reason or IOError("загрузка отменена")
+            self._stop_threads()
+            self._abort_multipart_upload()
+        finally:
+            self._buffer.clear()
+            self._first_part = None
+            super().close()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort(exc_val)
+
+
 storage = MyStorage(ENDPOINT_URL, ACCESS_KEY, SECRET_KEY, BUCKET_NAME)
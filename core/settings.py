@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
     'drf_spectacular',
+    "core",
     "image_processing_api.apps.ImageProcessingApiConfig",
     "statistics_pp.apps.ProviderStatisticConfig",
     "products_report_generator_api.apps.ProductsReportGeneratorConfig",
@@ -103,6 +104,16 @@ DATABASES = {
     }
 }
 
+# Кэш django - в памяти процесса: у каждого процесса (воркера) свой кэш, записи и попадания
+# в кэш не разделяются между процессами. Кэш результатов обработки изображений занимает
+# до CACHE_MAX_ENTRIES записей по IMAGE_PROCESSING_CACHE_ENTRY_MAX_SIZE в памяти каждого процесса
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 300))},
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -188,3 +199,71 @@ MINIO_SECURE = (
 
 YM_AUTH_TOKEN = os.getenv('YM_AUTH_TOKEN')
 YD_AUTH_TOKEN = os.getenv('YD_AUTH_TOKEN')
+
+# Настройки обработчика изображений (image_processing_api)
+# кол-во процессов для параллельной обработки файлов zip-архива (1 - последовательная обработка в потоке запроса)
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', os.cpu_count() or 1))
+# потоковая загрузка результата обработки в S3-хранилище без сохранения во временный файл
+IMAGE_PROCESSING_STREAM_UPLOAD = os.getenv('IMAGE_PROCESSING_STREAM_UPLOAD', 'True') == 'True'
+# кол-во потоков для выполнения асинхронных задач обработки изображений
+IMAGE_PROCESSING_JOB_WORKERS = int(os.getenv('IMAGE_PROCESSING_JOB_WORKERS', 2))
+# кэш результатов обработки (ключ - хэш входного файла и параметров обработки), хранится в кэше django
+# (CACHES, в памяти процесса)
+IMAGE_PROCESSING_CACHE = os.getenv('IMAGE_PROCESSING_CACHE', 'True') == 'True'
+# время жизни записей кэша, сек (ограничивается сроком хранения объектов по правилам жизненного цикла корзины)
+IMAGE_PROCESSING_CACHE_TTL = int(os.getenv('IMAGE_PROCESSING_CACHE_TTL', 60 * 60 * 24))
+# максимальный размер обработанного файла zip-архива, сохраняемого в кэш, байт
+IMAGE_PROCESSING_CACHE_ENTRY_MAX_SIZE = int(os.getenv('IMAGE_PROCESSING_CACHE_ENTRY_MAX_SIZE', 256 * 1024))
+# режим уменьшения растровых изображений: quality - без ускорения, balanced - уменьшенное декодирование JPEG
+# и пошаговое уменьшение без видимой потери качества, fast - максимальная скорость
+IMAGE_PROCESSING_DOWNSCALE_MODE = os.getenv('IMAGE_PROCESSING_DOWNSCALE_MODE', 'balanced')
+# копирование исходного файла без пересохранения, если результат обработки был бы эквивалентен
+# (формат и размер не меняются, качество JPEG не выше запрошенного)
+IMAGE_PROCESSING_PASS_THROUGH = os.getenv('IMAGE_PROCESSING_PASS_THROUGH', 'True') == 'True'
+# сбор гистограмм длительности стадий обработки (хранятся в БД, общие для процессов; endpoint metrics/)
+IMAGE_PROCESSING_METRICS = os.getenv('IMAGE_PROCESSING_METRICS', 'True') == 'True'
+# контроль допуска задач обработки: бюджет пикселей декодированных изображений одновременных задач процесса
+# (оценка по заголовкам файлов), 0 - без ограничения
+IMAGE_PROCESSING_MAX_PIXELS_IN_FLIGHT = int(os.getenv('IMAGE_PROCESSING_MAX_PIXELS_IN_FLIGHT', 200_000_000))
+# кол-во одновременных тяжёлых задач на узле (для всех процессов), 0 - без ограничения
+IMAGE_PROCESSING_NODE_SLOTS = int(os.getenv('IMAGE_PROCESSING_NODE_SLOTS', 2))
+# максимальное время ожидания допуска задачи, сек; по истечении - ответ 429 с заголовком Retry-After
+IMAGE_PROCESSING_ADMISSION_TIMEOUT = float(os.getenv('IMAGE_PROCESSING_ADMISSION_TIMEOUT', 30))
+# быстрая полоса для одиночных изображений не более заданного кол-ва пикселей (не ждут обработки архивов)
+IMAGE_PROCESSING_FAST_LANE_PIXELS = int(os.getenv('IMAGE_PROCESSING_FAST_LANE_PIXELS', 4_000_000))
+# кол-во одновременных задач быстрой полосы процесса
+IMAGE_PROCESSING_FAST_LANE_SLOTS = int(os.getenv('IMAGE_PROCESSING_FAST_LANE_SLOTS', os.cpu_count() or 1))
+# максимальный размер результата обработки одиночного изображения, возвращаемого в ответе (inline=true), байт
+IMAGE_PROCESSING_INLINE_MAX_SIZE = int(os.getenv('IMAGE_PROCESSING_INLINE_MAX_SIZE', 1024 * 1024))
+
+# хранилище файлов результатов (core.storage): minio - S3-хранилище, memory - в памяти процесса,
+# local - локальная папка STORAGE_LOCAL_DIR
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'minio')
+# папка хранилища local
+STORAGE_LOCAL_DIR = os.getenv('STORAGE_LOCAL_DIR', str(BASE_DIR / 'media' / 'storage'))
+# адрес, по которому раздаётся папка STORAGE_LOCAL_DIR (по-умолчанию ссылки file://)
+STORAGE_LOCAL_URL = os.getenv('STORAGE_LOCAL_URL')
+
+# Настройки клиента S3-хранилища (core.minio_storage)
+# размер пула HTTP-соединений к хранилищу (не меньше S3_UPLOAD_PARALLEL)
+S3_POOL_SIZE = int(os.getenv('S3_POOL_SIZE', 10))
+# таймауты подключения и чтения ответа, сек
+S3_CONNECT_TIMEOUT = float(os.getenv('S3_CONNECT_TIMEOUT', 10))
+S3_READ_TIMEOUT = float(os.getenv('S3_READ_TIMEOUT', 300))
+# TCP keep-alive для соединений пула
+S3_KEEPALIVE = os.getenv('S3_KEEPALIVE', 'True') == 'True'
+# интервал проверки соединения с хранилищем при обращении к клиенту, сек (0 - только после сетевых ошибок)
+S3_HEALTH_CHECK_INTERVAL = float(os.getenv('S3_HEALTH_CHECK_INTERVAL', 60))
+# таймаут проверки соединения с хранилищем (подключение и чтение ответа), сек; проверка не повторяется
+S3_HEALTH_CHECK_TIMEOUT = float(os.getenv('S3_HEALTH_CHECK_TIMEOUT', 3))
+# срок хранения результатов обработчика изображений (image_processing/) в корзине, дней (0 - бессрочно).
+# Правило жизненного цикла устанавливается командой bootstrap_storage
+S3_IMAGE_PROCESSING_RETENTION_DAYS = int(os.getenv('S3_IMAGE_PROCESSING_RETENTION_DAYS', 0))
+# размер части multipart-загрузки, байт (не менее 5 МБ)
+S3_UPLOAD_PART_SIZE = int(os.getenv('S3_UPLOAD_PART_SIZE', 10 * 1024 * 1024))
+# кол-во частей одного объекта, загружаемых параллельно
+S3_UPLOAD_PARALLEL = int(os.getenv('S3_UPLOAD_PARALLEL', 4))
+# повторы операций с хранилищем: кол-во попыток, базовая и максимальная задержка между попытками, сек
+S3_RETRY_ATTEMPTS = int(os.getenv('S3_RETRY_ATTEMPTS', 5))
+S3_RETRY_BACKOFF_BASE = float(os.getenv('S3_RETRY_BACKOFF_BASE', 0.5))
+S3_RETRY_BACKOFF_MAX = float(os.getenv('S3_RETRY_BACKOFF_MAX', 10))
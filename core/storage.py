@@ -0,0 +1,28 @@
+"""
+Хранилище файлов результатов, выбираемое настройкой STORAGE_BACKEND:
+- minio - S3-хранилище MinIO (core.minio_storage.MyStorage);
+- memory - объекты в памяти процесса (нагрузочное тестирование без сети);
+- local - файлы в локальной папке STORAGE_LOCAL_DIR (работа без MinIO).
+Модули приложений используют объект storage этого модуля
+"""
+from core.minio_storage import storage as minio_storage
+from core.settings import STORAGE_BACKEND, STORAGE_LOCAL_DIR, STORAGE_LOCAL_URL
+from core.storage_backends import BaseStorage, InMemoryStorage, LocalStorage
+
+
+def create_storage(backend: str) -> BaseStorage:
+    """
+    Хранилище по названию реализации (настройка STORAGE_BACKEND)
+    :param backend: minio, memory или local
+    :return:
+    """
+    if backend == 'minio':
+        return minio_storage
+    if backend == 'memory':
+        return InMemoryStorage()
+    if backend == 'local':
+        return LocalStorage(STORAGE_LOCAL_DIR, STORAGE_LOCAL_URL)
+    raise ValueError(f'Неизвестное хранилище STORAGE_BACKEND={backend}: ожидается minio, memory или local')
+
+
+storage = create_storage(STORAGE_BACKEND)
@@ -0,0 +1,249 @@
+"""
+Интерфейс хранилища файлов BaseStorage и реализации без S3: в памяти процесса (нагрузочное
+тестирование без сети) и в локальной папке (работа без MinIO). Реализация для MinIO -
+core.minio_storage.MyStorage, выбор реализации - core.storage
+"""
+import io
+import logging
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from pathlib import Path
+
+from core.settings import BUCKET_NAME
+
+logger = logging.getLogger(__name__)
+
+
+class BaseStorage(ABC):
+    """
+    Интерфейс хранилища файлов. Объект адресуется именем (путь внутри корзины) и корзиной.
+    Реализация без любого из абстрактных методов не может быть создана
+    """
+
+    @abstractmethod
+    def upload_file(self, file_name: str, file_path: str, bucket_name: str = BUCKET_NAME):
+        """
+        Загрузка файла с диска
+        :param file_name: имя объекта в хранилище
+        :param file_path: путь к файлу
+        :param bucket_name:
+        """
+
+    @abstractmethod
+    def put_object(self, file_name: str, data, length: int = -1, bucket_name: str = BUCKET_NAME,
+                   part_size: int = None):
+        """
+        Загрузка данных из файлового объекта
+        :param file_name: имя объекта в хранилище
+        :param data: файловый объект с методом read
+        :param length: размер данных, -1 - неизвестен
+        :param bucket_name:
+        :param part_size: размер части multipart-загрузки (для S3)
+        """
+
+    @abstractmethod
+    def get_object(self, file_name: str, bucket_name: str = BUCKET_NAME) -> bytes:
+        """
+        Чтение объекта целиком
+        :param file_name: имя объекта в хранилище
+        :param bucket_name:
+        :return: содержимое объекта
+        """
+
+    @abstractmethod
+    def open_upload(self, file_name: str, bucket_name: str = BUCKET_NAME):
+        """
+        Поток для записи объекта: файловый объект с атрибутом bytes_written и методом abort,
+        объект сохраняется при закрытии, при выходе из контекста с исключением - отменяется
+        :param file_name: имя объекта в хранилище
+        :param bucket_name:
+        """
+
+    @abstractmethod
+    def object_exists(self, file_name: str, bucket_name: str = BUCKET_NAME) -> bool:
+        """
+        Проверка наличия объекта
+        :param file_name: имя объекта в хранилище
+        :param bucket_name:
+        """
+
+    @staticmethod
+    def object_expiration(file_name: str):
+        """
+        Срок хранения объекта
+        :param file_name: имя объекта в хранилище
+        :return: timedelta или None, если объект хранится бессрочно
+        """
+        return None
+
+    @abstractmethod
+    def share_file_from_bucket(self, file_name, expire=timedelta(seconds=60), bucket_name=BUCKET_NAME):
+        """
+        Ссылка на скачивание объекта
+        :param file_name: имя объекта в хранилище
+        :param expire: срок действия ссылки
+        :param bucket_name:
+        """
+
+    def health_check(self) -> bool:
+        """
+        Проверка доступности хранилища
+        """
+        return True
+
+    def bootstrap(self):
+        """
+        Подготовка хранилища при развёртывании
+        """
+
+
+class MemoryUpload(io.BytesIO):
+    """
+    Поток записи объекта InMemoryStorage: объект сохраняется при закрытии
+    """
+
+    def __init__(self, storage: 'InMemoryStorage', file_name: str):
+        super().__init__()
+        self._storage = storage
+        self._file_name = file_name
+        self.bytes_written = 0
+
+    def write(self, data) -> int:
+        self.bytes_written += len(data)
+        return super().write(data)
+
+    def abort(self, reason: BaseException = None):
+        super().close()
+
+    def close(self):
+        if not self.closed:
+            self._storage.objects[self._file_name] = self.getvalue()
+        super().close()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort(exc_val)
+
+
+class InMemoryStorage(BaseStorage):
+    """
+    Хранилище в памяти процесса: исключает сеть из замеров. Корзины не различаются,
+    объекты не видны другим процессам и теряются при перезапуске
+    """
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+
+    def upload_file(self, file_name: str, file_path: str, bucket_name: str = None):
+        with open(file_path, 'rb') as file:
+            self.objects[file_name] = file.read()
+
+    def put_object(self, file_name: str, data, length: int = -1, bucket_name: str = None, part_size: int = None):
+        self.objects[file_name] = data.read()
+
+    def get_object(self, file_name: str, bucket_name: str = None) -> bytes:
+        try:
+            return self.objects[file_name]
+        except KeyError:
+            raise FileNotFoundError(f'Объект {file_name} не найден')
+
+    def open_upload(self, file_name: str, bucket_name: str = None) -> MemoryUpload:
+        return MemoryUpload(self, file_name)
+
+    def object_exists(self, file_name: str, bucket_name: str = None) -> bool:
+        return file_name in self.objects
+
+    def share_file_from_bucket(self, file_name, expire=None, bucket_name=None):
+        return f'memory://{file_name}'
+
+
+class LocalUpload(io.FileIO):
+    """
+    Поток записи объекта LocalStorage: данные пишутся во временный файл рядом с объектом,
+    который при закрытии заменяет объект (читатели не видят недописанный файл)
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, self._temp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+        super().__init__(fd, 'wb')
+        self._path = path
+        self.bytes_written = 0
+
+    def write(self, data) -> int:
+        written = super().write(data)
+        self.bytes_written += written
+        return written
+
+    def abort(self, reason: BaseException = None):
+        if not self.closed:
+            super().close()
+            os.remove(self._temp_path)
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            os.replace(self._temp_path, self._path)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort(exc_val)
+
+
+class LocalStorage(BaseStorage):
+    """
+    Хранилище в локальной папке: корзина - подпапка root, объект - файл внутри неё
+    """
+
+    def __init__(self, root: str, base_url: str = None):
+        """
+        :param root: корневая папка хранилища
+        :param base_url: адрес, по которому раздаётся папка root (для ссылок на скачивание),
+        по-умолчанию - ссылки file://
+        """
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip('/') if base_url else None
+
+    def _get_path(self, file_name: str, bucket_name: str = None) -> Path:
+        path = (self.root / (bucket_name or '') / file_name).resolve()
+        if not path.is_relative_to(self.root):
+            raise ValueError(f'Недопустимое имя объекта: {file_name}')
+        return path
+
+    def upload_file(self, file_name: str, file_path: str, bucket_name: str = BUCKET_NAME):
+        with open(file_path, 'rb') as file, self.open_upload(file_name, bucket_name) as output_file:
+            shutil.copyfileobj(file, output_file)
+
+    def put_object(self, file_name: str, data, length: int = -1, bucket_name: str = BUCKET_NAME,
+                   part_size: int = None):
+        with self.open_upload(file_name, bucket_name) as output_file:
+            shutil.copyfileobj(data, output_file)
+
+    def get_object(self, file_name: str, bucket_name: str = BUCKET_NAME) -> bytes:
+        return self._get_path(file_name, bucket_name).read_bytes()
+
+    def open_upload(self, file_name: str, bucket_name: str = BUCKET_NAME) -> LocalUpload:
+        return LocalUpload(self._get_path(file_name, bucket_name))
+
+    def object_exists(self, file_name: str, bucket_name: str = BUCKET_NAME) -> bool:
+        return self._get_path(file_name, bucket_name).is_file()
+
+    def share_file_from_bucket(self, file_name, expire=timedelta(seconds=60), bucket_name=BUCKET_NAME):
+        path = self._get_path(file_name, bucket_name)
+        if self.base_url:
+            return f'{self.base_url}/{path.relative_to(self.root).as_posix()}'
+        return path.as_uri()
+
+    def health_check(self) -> bool:
+        return self.root.is_dir() and os.access(self.root, os.W_OK)
+
+    def bootstrap(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        logger.info(f'Папка хранилища {self.root} создана')
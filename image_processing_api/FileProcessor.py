@@ -1,18 +1,35 @@
+import copy
+import hashlib
 import io
+import mmap
+import multiprocessing
 import os
+import shutil
+import threading
+import time
 import traceback
-from zipfile import ZipFile
+from zipfile import ZipFile, ZipInfo
 import logging
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from datetime import date, datetime
+from types import SimpleNamespace
+from typing import NamedTuple
 
 from django.core.files.uploadedfile import TemporaryUploadedFile
 from django.conf import settings
 from dotenv import load_dotenv
 from PIL import Image
-from cairosvg import svg2png, svg2svg
+from cairosvg.helpers import node_format
 from cairosvg.parser import Tree
+from cairosvg.surface import PNGSurface, SVGSurface
 
-from core.minio_storage import storage
+from core.storage import storage
+from .admission import admission
+from .cache import result_cache
+from .metrics import JobMetrics, StageTimings, record_histograms
 from .serializers import ALLOWED_EXTENSIONS
 
 load_dotenv()
@@ -21,27 +38,157 @@ logger = logging.getLogger(__file__)
 # папка для сохранения результатов обработки
 RESULTS_DIR = os.path.join(settings.BASE_DIR, 'media', 'image_processing_results')
 
+# режимы уменьшения растровых изображений (IMAGE_PROCESSING_DOWNSCALE_MODE) -> параметр reducing_gap pillow:
+# quality - полное декодирование и масштабирование за один проход (без ускорения);
+# balanced - визуально неотличимый от quality результат; fast - максимальная скорость
+DOWNSCALE_REDUCING_GAPS = {
+    'quality': None,
+    'balanced': 3.0,
+    'fast': 2.0,
+}
+
+# форматы, исходный файл которых может быть сохранён без пересохранения (IMAGE_PROCESSING_PASS_THROUGH)
+PASS_THROUGH_FORMATS = ('png', 'jpeg')
+# стандартная таблица квантования яркости JPEG (ITU-T T.81, приложение K), по ней libjpeg масштабирует качество
+JPEG_STD_LUMINANCE_QUANT_TABLE = (
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+)
+
+# параметры поверхности cairosvg для перевода длин svg с единицами измерения (pt, mm, em...) в пиксели:
+# dpi и размер шрифта по-умолчанию cairosvg, проценты не разрешаются (размеры берутся из viewBox)
+SVG_LENGTH_REFERENCE = SimpleNamespace(dpi=96, font_size=16, context_width=None, context_height=None)
+
+# форматы с регулируемым качеством, для которых подбирается качество под max_file_size
+QUALITY_SEARCH_FORMATS = ('jpeg', 'webp')
+# минимальное качество при подборе под max_file_size
+QUALITY_SEARCH_MIN = 5
+
+# размер блока потокового копирования файлов архива, не требующих обработки
+ZIP_COPY_CHUNK_SIZE = 1024 * 1024
+
+# пулы процессов для параллельной обработки zip-архивов (ключ - кол-во процессов), создаются при первом обращении
+_process_pools: dict[int, ProcessPoolExecutor] = {}
+_process_pools_lock = threading.Lock()
+# способ запуска процессов пула: процесс django уже выполняет потоки запросов, задач и загрузки в хранилище,
+# fork копирует захваченные ими блокировки и может привести к взаимной блокировке процесса пула
+PROCESS_POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def init_pool_process():
+    """
+    Инициализация процесса пула: процесс запускается без копирования памяти родителя,
+    django настраивается заново
+    """
+    import django
+    django.setup()
+
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Возвращает общий для всех запросов пул процессов заданного размера
+    :param workers: кол-во процессов
+    :return:
+    """
+    with _process_pools_lock:
+        if workers not in _process_pools:
+            _process_pools[workers] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(PROCESS_POOL_START_METHOD),
+                initializer=init_pool_process,
+            )
+        return _process_pools[workers]
+
+
+def discard_process_pool(workers: int, pool: ProcessPoolExecutor):
+    """
+    Удаляет аварийно завершившийся пул: новый пул создаётся при следующем обращении
+    :param workers: кол-во процессов
+    :param pool: пул, в котором произошла ошибка
+    """
+    with _process_pools_lock:
+        if _process_pools.get(workers) is pool:
+            del _process_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def estimate_jpeg_quality(quantization) -> int | None:
+    """
+    Оценка качества JPEG (шкала libjpeg 1-100) по таблице квантования яркости из заголовка файла
+    :param quantization: таблицы квантования (атрибут quantization открытого JPEG)
+    :return: качество или None, если таблица отсутствует
+    """
+    if not quantization or 0 not in quantization:
+        return None
+    scale = sum(quantization[0]) * 100 / sum(JPEG_STD_LUMINANCE_QUANT_TABLE)
+    if scale <= 0:
+        return None
+    return round((200 - scale) / 2 if scale <= 100 else 5000 / scale)
+
 
 class ImageProcessor:
-    def __init__(self, image_file: bytes, filename: str, request_data):
+    def __init__(self, image_file: bytes | memoryview | mmap.mmap, filename: str, request_data):
         """
         Класс для обработки одиночного изображения
-        :param image_file: файл изображения
+        :param image_file: содержимое файла изображения (буфер не копируется)
         :param filename: имя файла
         :param request_data:
         """
-        self.__image_file: io.BytesIO = io.BytesIO(image_file)
+        self.__image_data = image_file
         self.filename: str = filename
         self.__request_data = request_data
+        self.__svg_tree: Tree | None = None
+        # кол-во предстоящих отрисовок разобранного svg (вариантов обработки)
+        self.__svg_renders_left = 1
+        # длительности и объёмы данных стадий обработки
+        self.timings = StageTimings()
 
         # pillow не имеет формата jpg, меняем  на jpeg
         if self.__request_data['format'] == 'jpg':
             self.__request_data['format'] = 'jpeg'
 
     @property
-    def image_file(self):
-        self.__image_file.seek(0)
-        return self.__image_file
+    def image_file(self) -> 'BufferReader':
+        """
+        Файловый объект для чтения исходного изображения без копирования содержимого
+        :return:
+        """
+        return BufferReader(self.__image_data)
+
+    def _copy_source(self) -> io.BytesIO:
+        """
+        Исходный файл как результат обработки (сохранение без изменений)
+        :return:
+        """
+        return io.BytesIO(bytes(self.__image_data))
+
+    @property
+    def svg_tree(self) -> Tree:
+        """
+        Разобранный svg-документ. Разбирается один раз и используется для определения размеров
+        и отрисовки (сохранение в svg и растеризация, _render_tree)
+        :return:
+        """
+        if self.__svg_tree is None:
+            # cairosvg разбирает только bytes - копия исходного svg неизбежна
+            with self.timings.stage('svg_parse', len(self.__image_data)):
+                self.__svg_tree = Tree(bytestring=bytes(self.__image_data))
+        return self.__svg_tree
+
+    def _render_tree(self) -> Tree:
+        """
+        Документ для одной отрисовки. cairosvg изменяет дерево при отрисовке (шаблоны заливки и маски),
+        поэтому, пока предстоят другие отрисовки (варианты), отрисовывается копия, последняя отрисовка
+        (в т.ч. единственная) - по самому разобранному документу
+        :return:
+        """
+        self.__svg_renders_left -= 1
+        if self.__svg_renders_left <= 0:
+            return self.svg_tree
+        with self.timings.stage('svg_copy'):
+            return copy.deepcopy(self.svg_tree)
 
     def process_image(self) -> io.BytesIO:
         """
@@ -51,22 +198,105 @@ class ImageProcessor:
         logger.info(f'Обработка изображения {self.filename}...')
         if self.filename.endswith('.svg'):
             if self.__request_data.get('vector'):
-                logger.info(f'Сохранение без изменений...')
-                return self.image_file
+                logger.info('Сохранение без изменений...')
+                return self._copy_source()
             elif self.__request_data['format'] != 'original':
-                processed_file = self._vector2rastr(self.image_file)
-                processed_file = self._rastr_process(processed_file)
-                return processed_file
+                with self._vector2rastr() as image:
+                    return self._save_rastr(image)
 
             processed_file = self._vector_process()
             return processed_file
         elif self.filename.endswith(('.ai', '.eps')):
-            logger.info(f'Сохранение без изменений...')
-            return self.image_file
+            logger.info('Сохранение без изменений...')
+            return self._copy_source()
         else:
             processed_file = self._rastr_process(self.image_file)
             return processed_file
 
+    def process_variants(self, variants: list[dict]) -> list[tuple[str, io.BytesIO]]:
+        """
+        Обработка изображения в несколько вариантов (размер, формат, качество). Изображение декодируется
+        (svg - разбирается) один раз, каждый вариант получается из изображения в памяти
+        :param variants: варианты обработки (сериализатор Variant), незаданные параметры берутся из запроса
+        :return: список кортежей (имя файла варианта, обработанный файл)
+        """
+        logger.info(f'Обработка изображения {self.filename}, вариантов: {len(variants)}...')
+        is_vector_copy = self.filename.endswith('.svg') and self.__request_data.get('vector')
+        if self.filename.endswith(('.ai', '.eps')) or is_vector_copy:
+            logger.info('Сохранение без изменений...')
+            return [(self.filename, self._copy_source())]
+
+        request_data, filename = self.__request_data, self.filename
+        variants_params = [self._get_variant_params(variant) for variant in variants]
+        image = original_size = None
+        results = []
+        try:
+            if filename.endswith('.svg'):
+                self.__svg_renders_left = len(variants_params)
+            else:
+                image, original_size = self._decode_for_variants(variants_params)
+
+            for params in variants_params:
+                self.__request_data, self.filename = params, filename
+                if image is None:
+                    # размер определяется до отрисовки: последний вариант отрисовывается по самому документу
+                    size = self._get_target_size(*self._get_svg_size(self.svg_tree))
+                    processed_file = self.process_image()
+                else:
+                    size = self._get_target_size(*original_size)
+                    if self._can_pass_through(image, size, original_size):
+                        processed_file = self._pass_through()
+                    else:
+                        processed_file = self._save_rastr(self._resize(image, size) if size else image)
+                results.append((self._get_variant_filename(size, results), processed_file))
+        finally:
+            self.__request_data, self.filename = request_data, filename
+            if image is not None:
+                image.close()
+        return results
+
+    def _get_variant_params(self, variant: dict) -> dict:
+        params = {**self.__request_data, **variant}
+        if params['format'] == 'jpg':
+            params['format'] = 'jpeg'
+        return params
+
+    def _decode_for_variants(self, variants_params: list[dict]) -> tuple[Image.Image, tuple[int, int]]:
+        """
+        Декодирование растрового изображения для всех вариантов. Если все варианты уменьшают изображение,
+        JPEG декодируется сразу в масштабе наибольшего из них (draft)
+        :param variants_params: параметры вариантов
+        :return: кортеж (декодированное изображение, исходный размер изображения)
+        """
+        image = Image.open(self.image_file)
+        original_size = image.size
+        sizes = []
+        for params in variants_params:
+            self.__request_data = params
+            sizes.append(self._get_target_size(*original_size))
+
+        reducing_gap = DOWNSCALE_REDUCING_GAPS[settings.IMAGE_PROCESSING_DOWNSCALE_MODE]
+        if reducing_gap is not None and all(sizes):
+            width, height = max(width for width, _ in sizes), max(height for _, height in sizes)
+            image.draft(None, (int(width * reducing_gap), int(height * reducing_gap)))
+        with self.timings.stage('decode', len(self.__image_data)):
+            image.load()
+        return image, original_size
+
+    def _get_variant_filename(self, size, results: list) -> str:
+        """
+        Имя файла варианта: к имени добавляется итоговый размер, при совпадении имён - номер варианта
+        :param size: итоговый размер или None, если разрешение сохраняется
+        :param results: уже обработанные варианты
+        :return:
+        """
+        name, extension = self.filename.rsplit('.', 1)
+        suffix = f'{size[0]}x{size[1]}' if size else 'original'
+        variant_filename = f'{name}_{suffix}.{extension}'
+        if any(variant_filename == result_filename for result_filename, _ in results):
+            variant_filename = f'{name}_{suffix}_{len(results) + 1}.{extension}'
+        return variant_filename
+
     def _vector_process(self) -> io.BytesIO:
         """
         Обработка вектороной графики
@@ -74,23 +304,19 @@ class ImageProcessor:
         """
         logger.info('Обработка векторного изображения...')
         output_file = io.BytesIO()
+        new_width, new_height = self._get_target_size(*self._get_svg_size(self.svg_tree)) or (None, None)
 
-        if not self.__request_data['resolution']:
-            if self.__request_data['proportion']:
-                svg_data = Tree(bytestring=self.image_file.read())
-                # МОЖНО ВОСПОЛЬЗОВАТЬСЯ СВОЙСТВОМ ЧТОБЫ КАЖДЫЙ РАЗ ПРИ ЧТЕНИИ ВЫЗВАЛСЯ SEEK(0)
-                self.image_file.seek(0)
-                new_width, new_height = self._get_proportion_size(svg_data.get('width'), svg_data.get('height'))
-            else:
-                new_width = self.__request_data['width']
-                new_height = self.__request_data['height']
-
+        if new_width:
             logger.info(f'Сохранение с изменением размеров {new_width}x{new_height}...')
-            svg2svg(file_obj=self.image_file, output_width=new_width, output_height=new_height, write_to=output_file)
-
         else:
-            logger.info(f'Сохранение без изменений...')
-            svg2svg(file_obj=self.image_file, write_to=output_file)
+            logger.info('Сохранение без изменений...')
+
+        # аналог svg2svg по уже разобранному документу (dpi по-умолчанию cairosvg)
+        with self.timings.stage('encode'):
+            surface = SVGSurface(self._render_tree(), output_file, 96, output_width=new_width,
+                                 output_height=new_height)
+            surface.finish()
+        self.timings.add_bytes('encode', output_file.tell())
         output_file.seek(0)
         return output_file
 
@@ -101,48 +327,178 @@ class ImageProcessor:
         :return:
         """
         logger.info('Обработка растрового изображения...')
+        with Image.open(image_file) as image:
+            size = self._get_target_size(*image.size)
+            if self._can_pass_through(image, size):
+                return self._pass_through()
+            if size:
+                return self._save_rastr(self._resize(image, size))
+            with self.timings.stage('decode', len(self.__image_data)):
+                image.load()
+            return self._save_rastr(image)
+
+    def _save_rastr(self, image: Image.Image) -> io.BytesIO:
+        """
+        Сохранение растрового изображения в запрошенном формате и качестве. При заданном max_file_size
+        для форматов с потерями подбирается наибольшее качество (не выше запрошенного), при котором
+        файл не превышает заданный размер
+        :param image: изображение в итоговом размере
+        :return:
+        """
+        save_fmt = self._rename_to_output_format()
+        quality = int(self.__request_data.get('quality'))
+        max_file_size = self.__request_data.get('max_file_size')
+
+        if image.mode == "RGBA" and save_fmt.lower() == "jpeg":
+            image = image.convert("RGB")
+
+        output_file = self._encode(image, save_fmt, quality)
+        if max_file_size and output_file.getbuffer().nbytes > max_file_size:
+            if save_fmt.lower() in QUALITY_SEARCH_FORMATS:
+                output_file = self._search_quality(image, save_fmt, quality, max_file_size) or output_file
+            else:
+                logger.warning(f'Размер файла {self.filename} превышает {max_file_size} байт, '
+                               f'формат {save_fmt} сохраняется без потерь')
+        return output_file
+
+    def _encode(self, image: Image.Image, save_fmt: str, quality: int) -> io.BytesIO:
+        """
+        Кодирование декодированного изображения (один проход кодировщика)
+        """
+        logger.info(f'Сохранение в формате {save_fmt}, качестве {quality}% ...')
         output_file = io.BytesIO()
-        image = Image.open(image_file)
+        with self.timings.stage('encode'):
+            image.save(output_file, quality=quality, format=save_fmt)
+        self.timings.add_bytes('encode', output_file.tell())
+        output_file.seek(0)
+        return output_file
+
+    def _search_quality(self, image: Image.Image, save_fmt: str, max_quality: int,
+                        max_file_size: int) -> io.BytesIO | None:
+        """
+        Бинарный поиск наибольшего качества, при котором файл не превышает max_file_size.
+        Кодируется одно и то же декодированное изображение, не более log2(max_quality) проходов
+        :param image: изображение в итоговом размере
+        :param save_fmt: формат сохранения
+        :param max_quality: запрошенное качество (для него размер уже превышен)
+        :param max_file_size: максимальный размер файла, байт
+        :return: файл наибольшего подходящего качества или, если не подходит и минимальное качество, -
+        файл минимального качества
+        """
+        low, high = QUALITY_SEARCH_MIN, max_quality - 1
+        best = smallest = None
+        while low <= high:
+            quality = (low + high) // 2
+            output_file = self._encode(image, save_fmt, quality)
+            if output_file.getbuffer().nbytes <= max_file_size:
+                best, low = output_file, quality + 1
+            else:
+                smallest, high = output_file, quality - 1
+        if best is None:
+            logger.warning(f'Размер файла {self.filename} превышает {max_file_size} байт '
+                           f'при минимальном качестве {QUALITY_SEARCH_MIN}%')
+        return best or smallest
 
+    def _get_save_format(self) -> str:
+        """
+        Формат сохранения: запрошенный или, для format=original, по расширению файла
+        :return:
+        """
+        fmt = self.__request_data.get('format')
+        save_fmt = fmt if fmt.lower() != 'original' else self.filename.split('.')[-1]
+        return 'jpeg' if save_fmt.lower() == 'jpg' else save_fmt
+
+    def _rename_to_output_format(self) -> str:
+        """
+        Замена расширения имени файла на запрошенный формат
+        :return: формат сохранения
+        """
         fmt = self.__request_data.get('format')
         if fmt != 'original':
             current_extension = self.filename.split('.')[-1]
             self.filename = self.filename.replace(f'.{current_extension}', f'.{fmt}')
+        return self._get_save_format()
 
-        quality = self.__request_data.get('quality')
-
-        if not self.__request_data.get('resolution'):
-            if self.__request_data.get('proportion'):
-                width, height = self._get_proportion_size(*image.size)
-            else:
-                width, height = self.__request_data.get('width'), self.__request_data.get('height')
-            image = image.resize((width, height))
-
-        save_fmt = fmt if fmt.lower() != 'original' else self.filename.split('.')[-1]
+    def _can_pass_through(self, image: Image.Image, size, original_size=None) -> bool:
+        """
+        Проверка по заголовку изображения (без декодирования), что результат обработки был бы эквивалентен
+        исходному файлу: формат и размер не меняются, качество JPEG не выше запрошенного
+        :param image: открытое изображение
+        :param size: итоговый размер или None, если разрешение сохраняется
+        :param original_size: исходный размер, если изображение декодировано в уменьшенном масштабе
+        :return:
+        """
+        if not settings.IMAGE_PROCESSING_PASS_THROUGH:
+            return False
+        source_fmt = (image.format or '').lower()
+        if source_fmt not in PASS_THROUGH_FORMATS or self._get_save_format().lower() != source_fmt:
+            return False
+        if size and tuple(size) != (original_size or image.size):
+            return False
+        max_file_size = self.__request_data.get('max_file_size')
+        if max_file_size and len(self.__image_data) > max_file_size:
+            return False
+        if source_fmt == 'jpeg':
+            source_quality = estimate_jpeg_quality(getattr(image, 'quantization', None))
+            return source_quality is not None and source_quality <= int(self.__request_data.get('quality'))
+        return True
 
-        logger.info(f'Сохранение в формате {save_fmt}, качестве {quality}% ...')
+    def _pass_through(self) -> io.BytesIO:
+        logger.info('Изображение не требует изменений, сохранение исходного файла...')
+        self._rename_to_output_format()
+        with self.timings.stage('pass_through', len(self.__image_data)):
+            return self._copy_source()
 
-        if image.mode == "RGBA" and save_fmt.lower() == "jpeg":
-            image = image.convert("RGB")
+    def _resize(self, image: Image.Image, size: tuple[int, int]) -> Image.Image:
+        """
+        Изменение размера изображения. При уменьшении (кроме режима quality) JPEG декодируется сразу
+        в уменьшенном масштабе (draft), затем изображение уменьшается целочисленным усреднением (reduce)
+        и только после этого - финальной интерполяцией до нужного размера
+        :param image: открытое, но ещё не декодированное изображение
+        :param size: новый размер (ширина, высота)
+        :return:
+        """
+        reducing_gap = DOWNSCALE_REDUCING_GAPS[settings.IMAGE_PROCESSING_DOWNSCALE_MODE]
+        width, height = size
+        if reducing_gap is None or width >= image.width or height >= image.height:
+            reducing_gap = None
+        else:
+            # draft срабатывает только для JPEG, для остальных форматов - без изменений
+            image.draft(None, (int(width * reducing_gap), int(height * reducing_gap)))
 
-        image.save(output_file, quality=int(quality), format=save_fmt)
-        image.close()
-        output_file.seek(0)
+        if getattr(image, 'tile', None):
+            with self.timings.stage('decode', len(self.__image_data)):
+                image.load()
+        with self.timings.stage('resize'):
+            return image.resize(size, reducing_gap=reducing_gap)
 
-        return output_file
+    def _get_target_size(self, original_width, original_height):
+        """
+        Итоговый размер изображения согласно параметрам запроса
+        :param original_width:
+        :param original_height:
+        :return: кортеж (ширина, высота) или None, если разрешение сохраняется
+        """
+        if self.__request_data.get('resolution'):
+            return None
+        if self.__request_data.get('proportion'):
+            return self._get_proportion_size(original_width, original_height)
+        return self.__request_data['width'], self.__request_data['height']
 
     def _get_proportion_size(self, original_width, original_height):
         """
         Расчёт размеров изображения с сохранением пропорций
-        :param original_width:
-        :param original_height:
+        :param original_width: исходная ширина, пикселей
+        :param original_height: исходная высота, пикселей
         :return:
         """
-        original_height = ''.join(filter(lambda x: x.isdigit(), str(original_height)))
-        original_width = ''.join(filter(lambda x: x.isdigit(), str(original_width)))
+        if not original_width or not original_height:
+            # у svg без width, height и viewBox пропорции не определены
+            logger.warning('Исходный размер изображения не задан, используются ширина и высота из запроса')
+            return self.__request_data['width'], self.__request_data['height']
 
         logger.info('Меняю разрешение с сохранением пропорций...')
-        aspect_ratio = int(original_width) / int(original_height)  # пропорции
+        aspect_ratio = original_width / original_height  # пропорции
         # если False редактируется высота (считаем ширину)
         if not self.__request_data["toggle_switch"]:
             new_width = int(self.__request_data['height'] * aspect_ratio)
@@ -155,19 +511,148 @@ class ImageProcessor:
         logger.info(f'Новый размер: {new_width}x{new_height}')
         return new_width, new_height
 
-    def _vector2rastr(self, image_file):
+    def _vector2rastr(self) -> Image.Image:
         """
-        Конвертирование svg-формата в растровый тип изображения
-        :return:
+        Конвертирование svg-формата в растровый тип изображения. Svg растеризуется сразу
+        в итоговом размере, без промежуточного PNG в 300 DPI и последующего уменьшения
+        :return: изображение в итоговом размере
         """
         logger.info('Конвертация векторного изображения в растровое...')
-        if self.__request_data.get('vector'):
-            return image_file
-        else:
-            png_file = io.BytesIO()
-            svg2png(file_obj=image_file, write_to=png_file, dpi=300)
-            png_file.seek(0)
-            return png_file
+        output_width, output_height = self._get_target_size(*self._get_svg_size(self.svg_tree)) or (None, None)
+        tree = self._render_tree()
+
+        with self.timings.stage('rasterize'):
+            # поверхность отрисовывается при создании; без output PNG не кодируется
+            surface = PNGSurface(tree, None, 300, output_width=output_width, output_height=output_height)
+            surface.cairo.flush()
+            # cairo хранит пиксели в формате ARGB32 с предумноженной альфой (BGRa в порядке байт little-endian)
+            image = Image.frombytes('RGBA', (surface.width, surface.height), surface.cairo.get_data(),
+                                    'raw', 'BGRa', surface.cairo.get_stride())
+            surface.finish()
+        return image
+
+    @staticmethod
+    def _get_svg_size(tree: Tree) -> tuple[float, float]:
+        """
+        Исходные размеры svg в пикселях: атрибуты width и height (дробные, с единицами измерения),
+        при их отсутствии или заданных в процентах - размеры viewBox
+        :param tree: разобранный svg-документ
+        :return: кортеж (ширина, высота), 0 - размер не задан
+        """
+        width, height, _ = node_format(SVG_LENGTH_REFERENCE, tree, reference=False)
+        return width, height
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Файловый объект только для чтения поверх буфера (bytes, memoryview, mmap). Буфер не копируется,
+    копируются только прочитанные блоки
+    """
+
+    def __init__(self, data: bytes | memoryview | mmap.mmap):
+        super().__init__()
+        self._data = data
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._data)
+        self._position = max(offset, 0)
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._data) if size is None or size < 0 else self._position + size
+        chunk = self._data[self._position:end]
+        self._position += len(chunk)
+        return bytes(chunk)
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def process_zip_entry(image_file: bytes, filename: str, request_data: dict) -> tuple[list[tuple[str, bytes]], dict]:
+    """
+    Обработка одного файла zip-архива, выполняется в процессе пула
+    :param image_file: файл изображения
+    :param filename: имя файла внутри архива
+    :param request_data: параметры обработки (без загруженного файла)
+    :return: кортеж (список кортежей (имя обработанного файла, содержимое обработанного файла),
+    при обработке в несколько вариантов - по одному на вариант; стадии обработки StageTimings.stages)
+    """
+    image_processor = ImageProcessor(image_file, filename, request_data)
+    if request_data.get('variants'):
+        files = [(name, file.getvalue()) for name, file in image_processor.process_variants(request_data['variants'])]
+    else:
+        processed_file = image_processor.process_image()
+        files = [(image_processor.filename, processed_file.getvalue())]
+    return files, image_processor.timings.stages
+
+
+class ZipEntryCopy(NamedTuple):
+    """
+    Файл входного архива, копируемый в выходной архив без изменений
+    """
+    zipfile: ZipFile
+    info: ZipInfo
+
+
+class DuplicateEntries:
+    """
+    Поиск одинаковых файлов zip-архива. Первичный ключ - CRC, размер и расширение из ZipInfo (без чтения
+    содержимого), совпадение подтверждается хэшем содержимого. Результат обработки хранится до последнего
+    файла с тем же первичным ключом
+    """
+
+    def __init__(self, infolist: list[ZipInfo]):
+        self._remaining = Counter(self._get_key(info) for info in infolist)
+        # первичный ключ -> {хэш содержимого: (имя файла, Future или результат обработки)}
+        self._results: dict[tuple, dict[str, tuple]] = {}
+
+    @staticmethod
+    def _get_key(info: ZipInfo) -> tuple:
+        return info.CRC, info.file_size, info.filename.rsplit('.', 1)[-1]
+
+    def find(self, info: ZipInfo, data: bytes):
+        """
+        Поиск ранее обработанного файла с тем же содержимым
+        :param info: файл архива
+        :param data: содержимое файла
+        :return: кортеж (ключ для add или None, (имя файла, результат обработки) или None)
+        """
+        key = self._get_key(info)
+        self._remaining[key] -= 1
+        if key not in self._results and self._remaining[key] <= 0:
+            # файлов с таким CRC и размером больше нет
+            return None, None
+
+        digest = hashlib.sha256(data).hexdigest()
+        found = self._results.get(key, {}).get(digest)
+        if self._remaining[key] <= 0:
+            self._results.pop(key, None)
+        return (key, digest), found
+
+    def add(self, key, filename: str, entry):
+        """
+        Сохранение результата обработки для последующих одинаковых файлов
+        :param key: ключ, полученный из find
+        :param filename: имя файла внутри архива
+        :param entry: Future или результат обработки
+        """
+        if key and self._remaining[key[0]] > 0:
+            self._results.setdefault(key[0], {})[key[1]] = (filename, entry)
 
 
 class FileProcessor:
@@ -175,16 +660,78 @@ class FileProcessor:
     Получает на вход файл, обрабатывает в зависимости от типа (zip или одиночное изображение)
     """
 
-    def __init__(self, request_data):
+    def __init__(self, request_data, workers: int = None, stream_upload: bool = None, use_cache: bool = None):
+        """
+        :param request_data: проверенные параметры запроса (сериализатор Request)
+        :param workers: кол-во процессов для обработки zip-архива, по-умолчанию settings.IMAGE_PROCESSING_WORKERS
+        :param stream_upload: потоковая загрузка результата в хранилище без временного файла,
+        по-умолчанию settings.IMAGE_PROCESSING_STREAM_UPLOAD
+        :param use_cache: использование кэша результатов, по-умолчанию settings.IMAGE_PROCESSING_CACHE
+        """
         self.file: TemporaryUploadedFile = request_data.get('file')
         self.output_filename = None
+        self.s3path = None
         self.request_data = request_data
+        self.workers = workers or settings.IMAGE_PROCESSING_WORKERS
+        self.stream_upload = settings.IMAGE_PROCESSING_STREAM_UPLOAD if stream_upload is None else stream_upload
+        self.use_cache = settings.IMAGE_PROCESSING_CACHE if use_cache is None else use_cache
+        # параметры обработки для передачи в процессы пула (загруженный файл не сериализуется)
+        self.processing_params = {key: value for key, value in request_data.items() if key != 'file'}
+        # варианты обработки каждого изображения (сериализатор Variant)
+        self.variants = request_data.get('variants') or []
+        # замеры стадий обработки задачи и файлов архива
+        self.metrics = JobMetrics()
+        # возврат небольшого результата обработки одиночного изображения в ответе без загрузки в хранилище
+        self.inline = bool(request_data.get('inline'))
+        # результат обработки для ответа (при inline и размере не более IMAGE_PROCESSING_INLINE_MAX_SIZE)
+        self.inline_result: io.BytesIO | None = None
+        # максимальное время ожидания допуска к обработке, сек (None - без ограничения)
+        self.admission_timeout = settings.IMAGE_PROCESSING_ADMISSION_TIMEOUT
+        # функция обратного вызова progress_callback(done, total) для отслеживания прогресса обработки
+        self.progress_callback = None
+        self.entries_total = 0
+        self.entries_done = 0
 
     def start_processing(self):
         """
         Центральный метод для старта обработки
         :return:
         """
+        with self.metrics.stage('total', self.file.size or 0):
+            file_url = self._process_with_cache()
+        record_histograms(self.metrics)
+        return file_url
+
+    def _process_with_cache(self):
+        result_key = None
+        if self.use_cache:
+            with self.metrics.stage('cache_lookup'):
+                result_key = result_cache.result_key(self.file, self.request_data)
+                cached_result = result_cache.get_result(result_key)
+            if cached_result:
+                logger.info(f'Результат обработки найден в кэше: {cached_result["s3path"]}.')
+                self.output_filename = cached_result['file_name']
+                self.s3path = cached_result['s3path']
+                return storage.share_file_from_bucket(self.s3path)
+
+        with admission.admit(self.file, self.admission_timeout, self.metrics):
+            if self.inline and not self.is_zip():
+                file_url = self.inline_processing()
+            elif self.stream_upload:
+                file_url = self.stream_processing()
+            else:
+                file_url = self.disk_processing()
+
+        # результат, возвращаемый в ответе, не загружается в хранилище и не кэшируется
+        if result_key and self.inline_result is None:
+            result_cache.set_result(result_key, self.s3path, self.output_filename)
+        return file_url
+
+    def disk_processing(self):
+        """
+        Обработка с сохранением результата в RESULTS_DIR и последующей загрузкой в S3-хранилище
+        :return: ссылка на скачивание файла
+        """
         processed_filepath = None
         if not os.path.exists(RESULTS_DIR):
             os.makedirs(RESULTS_DIR)
@@ -196,41 +743,240 @@ class FileProcessor:
                 processed_filepath = self.image_processing()
             self.output_filename = processed_filepath.split(os.sep)[-1]
 
-            s3path = self.upload_zip2s3(processed_filepath)
+            with self.metrics.stage('upload', os.path.getsize(processed_filepath)):
+                s3path = self.upload_zip2s3(processed_filepath)
+            self.s3path = f'image_processing/{self.output_filename}'
 
             return s3path
         finally:
             if processed_filepath:
                 os.remove(processed_filepath)
 
-    def zip_processing(self) -> str:
+    def stream_processing(self):
+        """
+        Обработка с потоковой загрузкой результата в S3-хранилище: архив записывается напрямую
+        в multipart-загрузку, готовые части загружаются в фоновом потоке, пока обрабатываются
+        следующие файлы, без временного файла в RESULTS_DIR
+        :return: ссылка на скачивание файла
+        """
+        if self.is_zip():
+            self.output_filename = self.get_output_zip_name()
+            self.s3path = f'image_processing/{self.output_filename}'
+            logger.info(f'Потоковая отправка файла {self.s3path} в хранилище...')
+            with storage.open_upload(self.s3path, os.getenv('S3_BUCKET_NAME')) as output_file:
+                self.write_zip(output_file)
+                # части архива загружаются во время обработки, замеряется ожидание загрузки оставшихся частей
+                upload_started = time.perf_counter()
+            self.metrics.add('upload', time.perf_counter() - upload_started, output_file.bytes_written)
+        else:
+            processed_image, self.output_filename = self.process_single_image()
+            return self.upload_processed_image(processed_image)
+
+        logger.info(f'Файл отправлен: {self.s3path}.')
+        return storage.share_file_from_bucket(self.s3path)
+
+    def inline_processing(self):
         """
-        Обработка zip-архива
+        Обработка одиночного изображения в памяти: результат не больше IMAGE_PROCESSING_INLINE_MAX_SIZE
+        возвращается в ответе (inline_result) без загрузки в хранилище, больший - загружается в хранилище
+        :return: ссылка на скачивание файла или None, если результат возвращается в ответе
+        """
+        processed_image, self.output_filename = self.process_single_image()
+        if processed_image.getbuffer().nbytes <= settings.IMAGE_PROCESSING_INLINE_MAX_SIZE:
+            logger.info(f'Результат {self.output_filename} возвращается в ответе.')
+            self.inline_result = processed_image
+            return None
+        return self.upload_processed_image(processed_image)
+
+    def upload_processed_image(self, processed_image: io.BytesIO):
+        """
+        Загрузка обработанного одиночного изображения в S3-хранилище из памяти
+        :param processed_image: обработанное изображение (имя файла - output_filename)
+        :return: ссылка на скачивание файла
+        """
+        self.s3path = f'image_processing/{self.output_filename}'
+        logger.info(f'Отправка файла {self.s3path} в хранилище...')
+        with self.metrics.stage('upload', processed_image.getbuffer().nbytes):
+            with storage.open_upload(self.s3path, os.getenv('S3_BUCKET_NAME')) as output_file:
+                output_file.write(processed_image.getbuffer())
+        logger.info(f'Файл отправлен: {self.s3path}.')
+        return storage.share_file_from_bucket(self.s3path)
+
+    def get_output_zip_name(self) -> str:
+        """
+        Формирует уникальное имя выходного zip-архива
         :return:
         """
         datatime_mark = datetime.now().strftime('%Y%m%d_%H%M%S-%f')
-        output_zip_name = f'{datatime_mark}_{self.file.name.replace(" ", "_")}'
-        output_zip_path = os.path.join(RESULTS_DIR, output_zip_name)
-
-        with ZipFile(self.file) as zipfile, ZipFile(output_zip_path, 'w') as output_zip:
-            for i in zipfile.infolist():
-                if i.filename.endswith(tuple(ALLOWED_EXTENSIONS)):
-                    image_processor = ImageProcessor(zipfile.read(i.filename), i.filename, self.request_data)
-                    file = image_processor.process_image()
-                    output_zip.writestr(self.encode_broken_name(image_processor.filename), file.getvalue())
-                else:
-                    output_zip.writestr(self.encode_broken_name(i.filename), zipfile.read(i.filename))
+        return f'{datatime_mark}_{self.file.name.replace(" ", "_")}'
+
+    def zip_processing(self) -> str:
+        """
+        Обработка zip-архива с сохранением результата в RESULTS_DIR
+        :return: путь к обработанному архиву
+        """
+        output_zip_path = os.path.join(RESULTS_DIR, self.get_output_zip_name())
+
+        with open(output_zip_path, 'wb') as output_file:
+            self.write_zip(output_file)
 
         return output_zip_path
 
-    def image_processing(self) -> str:
-        image_processor = ImageProcessor(self.file.read(), self.file.name, self.request_data)
-        prefix = str(datetime.now().timestamp()).replace('.', '') + '_'
+    def write_zip(self, output_file):
+        """
+        Обработка zip-архива с записью результата в файловый объект
+        :param output_file: файловый объект, доступный для записи (в т.ч. без поддержки seek)
+        """
+        with ZipFile(self.file) as zipfile, ZipFile(output_file, 'w') as output_zip:
+            infolist = zipfile.infolist()
+            self._start_progress(len(infolist))
+            duplicates = DuplicateEntries(infolist)
+            if self.workers > 1:
+                self._parallel_zip_processing(zipfile, output_zip, duplicates)
+            else:
+                for info in infolist:
+                    self._write_zip_entry(output_zip, *self._prepare_zip_entry(zipfile, info, duplicates,
+                                                                              process_zip_entry))
+
+    def _parallel_zip_processing(self, zipfile: ZipFile, output_zip: ZipFile, duplicates: 'DuplicateEntries'):
+        """
+        Обработка файлов zip-архива в пуле процессов. Результаты записываются в выходной архив
+        в исходном порядке файлов
+        :param zipfile: входной архив
+        :param output_zip: выходной архив
+        :param duplicates: поиск одинаковых файлов архива
+        """
+        pool = get_process_pool(self.workers)
+        logger.info(f'Параллельная обработка архива, процессов: {self.workers}...')
+        # очередь файлов в порядке архива (кортежи _prepare_zip_entry).
+        # Размер очереди ограничен, чтобы в памяти не находился весь распакованный архив
+        pending = deque()
+        max_pending = self.workers * 2
+        try:
+            for info in zipfile.infolist():
+                pending.append(self._prepare_zip_entry(zipfile, info, duplicates, pool.submit, process_zip_entry))
+
+                if len(pending) >= max_pending:
+                    self._write_zip_entry(output_zip, *pending.popleft())
+
+            while pending:
+                self._write_zip_entry(output_zip, *pending.popleft())
+        except BrokenProcessPool:
+            # процесс пула аварийно завершился - пул пересоздаётся при следующем запросе
+            discard_process_pool(self.workers, pool)
+            raise
+        finally:
+            for entry, *_ in pending:
+                if isinstance(entry, Future):
+                    entry.cancel()
+
+    def _prepare_zip_entry(self, zipfile: ZipFile, info: ZipInfo, duplicates: 'DuplicateEntries', run, *args):
+        """
+        Чтение файла архива и запуск его обработки. Одинаковые файлы обрабатываются один раз:
+        для повторов используется результат первого файла
+        :param zipfile: входной архив
+        :param info: файл архива
+        :param duplicates: поиск одинаковых файлов архива
+        :param run: функция запуска обработки run(*args, image_file, filename, params) - результат или Future
+        :return: кортеж (Future, ([(имя, содержимое)], None) или ZipEntryCopy, ключ кэша,
+        имя файла, имя одинакового обработанного файла)
+        """
+        if not info.filename.endswith(tuple(ALLOWED_EXTENSIONS)):
+            # остальные файлы копируются потоком при записи, без чтения в память
+            return ZipEntryCopy(zipfile, info), None, info.filename, None
+
+        image_file = zipfile.read(info)
+        duplicate_key, duplicate = duplicates.find(info, image_file)
+        if duplicate:
+            duplicate_filename, entry = duplicate
+            return entry, None, info.filename, duplicate_filename
+
+        cache_key, cached_entry = self._get_cached_entry(image_file, info.filename)
+        if cached_entry:
+            cache_key, entry = None, ([cached_entry], None)
+        else:
+            entry = run(*args, image_file, info.filename, self.processing_params)
+        duplicates.add(duplicate_key, info.filename, entry)
+        return entry, cache_key, info.filename, None
 
-        processed_image = image_processor.process_image()
-        processed_filename = image_processor.filename.replace(' ', '_')
-        processed_filename = prefix + processed_filename
+    def _get_cached_entry(self, image_file: bytes, filename: str):
+        """
+        Поиск обработанного файла архива в кэше
+        :param image_file: содержимое файла
+        :param filename: имя файла внутри архива
+        :return: кортеж (ключ кэша, (имя обработанного файла, содержимое) или None)
+        """
+        # при обработке в несколько вариантов кэшируется только результат целиком
+        if not self.use_cache or self.variants:
+            return None, None
+        cache_key = result_cache.entry_key(image_file, filename, self.request_data)
+        return cache_key, result_cache.get_entry(cache_key, filename)
+
+    def _write_zip_entry(self, output_zip: ZipFile, entry, cache_key: str = None, source_filename: str = None,
+                         duplicate_filename: str = None):
+        """
+        Запись обработанного файла в выходной архив
+        :param output_zip: выходной архив
+        :param entry: Future с результатом обработки, кортеж (список кортежей (имя файла, содержимое), стадии
+        обработки или None) или ZipEntryCopy для копирования без изменений
+        :param cache_key: ключ для сохранения результата обработки в кэш
+        :param source_filename: имя исходного файла внутри архива
+        :param duplicate_filename: имя одинакового файла, результат обработки которого используется
+        """
+        if isinstance(entry, ZipEntryCopy):
+            with self.metrics.stage('zip', entry.info.file_size):
+                self._copy_zip_entry(output_zip, entry)
+            self.metrics.add_entry(source_filename, None, 'copy')
+            self._advance_progress()
+            return
+
+        entries, stages = entry.result() if isinstance(entry, Future) else entry
+        if duplicate_filename:
+            entries = [(self.rename_duplicate(filename, duplicate_filename, source_filename), data)
+                       for filename, data in entries]
+            self.metrics.add_entry(source_filename, None, 'duplicate')
+        else:
+            self.metrics.add_entry(source_filename, stages, 'processed' if stages is not None else 'cache')
+        with self.metrics.stage('zip', sum(len(data) for _, data in entries)):
+            for filename, data in entries:
+                output_zip.writestr(self.encode_broken_name(filename), data)
+        if cache_key:
+            filename, data = entries[0]
+            result_cache.set_entry(cache_key, source_filename, filename, data)
+        self._advance_progress()
 
+    def _copy_zip_entry(self, output_zip: ZipFile, entry: 'ZipEntryCopy'):
+        """
+        Потоковое копирование файла в выходной архив блоками по ZIP_COPY_CHUNK_SIZE
+        """
+        output_info = ZipInfo(self.encode_broken_name(entry.info.filename), date_time=entry.info.date_time)
+        output_info.compress_type = output_zip.compression
+        output_info.external_attr = entry.info.external_attr
+        # по размеру определяется необходимость zip64
+        output_info.file_size = entry.info.file_size
+        if entry.info.is_dir():
+            output_zip.writestr(output_info, b'')
+            return
+        with entry.zipfile.open(entry.info) as source, output_zip.open(output_info, 'w') as destination:
+            shutil.copyfileobj(source, destination, ZIP_COPY_CHUNK_SIZE)
+
+    def _start_progress(self, entries_total: int):
+        self.entries_total = entries_total
+        self.entries_done = 0
+        if self.progress_callback:
+            self.progress_callback(self.entries_done, self.entries_total)
+
+    def _advance_progress(self):
+        self.entries_done += 1
+        if self.progress_callback:
+            self.progress_callback(self.entries_done, self.entries_total)
+
+    def image_processing(self) -> str:
+        """
+        Обработка одиночного изображения с сохранением результата в RESULTS_DIR
+        :return: путь к обработанному изображению
+        """
+        processed_image, processed_filename = self.process_single_image()
         processed_file_path = os.path.join(RESULTS_DIR, processed_filename)
 
         with open(processed_file_path, 'wb') as f:
@@ -238,6 +984,68 @@ class FileProcessor:
 
         return processed_file_path
 
+    def process_single_image(self) -> tuple[io.BytesIO, str]:
+        """
+        Обработка одиночного изображения в памяти
+        :return: кортеж (обработанное изображение, уникальное имя файла)
+        """
+        self._start_progress(1)
+        prefix = str(datetime.now().timestamp()).replace('.', '') + '_'
+
+        with self.open_source_data() as image_data:
+            image_processor = ImageProcessor(image_data, self.file.name, self.request_data)
+            if self.variants:
+                processed_image = self.pack_variants(image_processor.process_variants(self.variants))
+                processed_filename = image_processor.filename.rsplit('.', 1)[0] + '.zip'
+            else:
+                processed_image = image_processor.process_image()
+                processed_filename = image_processor.filename
+        self.metrics.add_entry(self.file.name, image_processor.timings.stages)
+        self._advance_progress()
+        processed_filename = prefix + processed_filename.replace(' ', '_')
+
+        return processed_image, processed_filename
+
+    @contextmanager
+    def open_source_data(self):
+        """
+        Содержимое загруженного файла без чтения в память процесса: файл на диске (TemporaryUploadedFile,
+        файл асинхронной задачи) отображается в память (mmap), файл в памяти передаётся как memoryview
+        :return: буфер с содержимым файла
+        """
+        try:
+            fileno = self.file.fileno()
+        except (AttributeError, OSError, ValueError):
+            fileno = None
+
+        if fileno is not None and os.fstat(fileno).st_size > 0:
+            with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as image_data:
+                yield image_data
+        elif isinstance(getattr(self.file, 'file', None), io.BytesIO):
+            image_data = self.file.file.getbuffer()
+            try:
+                yield image_data
+            finally:
+                # экспортированный буфер блокирует закрытие BytesIO
+                image_data.release()
+        else:
+            self.file.seek(0)
+            yield self.file.read()
+
+    @staticmethod
+    def pack_variants(variants: list[tuple[str, io.BytesIO]]) -> io.BytesIO:
+        """
+        Упаковка вариантов обработки изображения в zip-архив
+        :param variants: список кортежей (имя файла варианта, обработанный файл)
+        :return: zip-архив в памяти
+        """
+        output_file = io.BytesIO()
+        with ZipFile(output_file, 'w') as output_zip:
+            for filename, processed_file in variants:
+                output_zip.writestr(filename, processed_file.getvalue())
+        output_file.seek(0)
+        return output_file
+
     def is_zip(self):
         """
         Проверка на тип файла
@@ -246,6 +1054,21 @@ class FileProcessor:
         filename: str = self.file.name
         return filename.endswith('.zip')
 
+    @staticmethod
+    def rename_duplicate(processed_filename: str, duplicate_filename: str, source_filename: str) -> str:
+        """
+        Имя результата обработки для повтора файла: путь и имя файла-оригинала заменяются на путь
+        и имя повтора, изменения имени при обработке (расширение, суффикс варианта) сохраняются
+        :param processed_filename: имя результата обработки файла-оригинала
+        :param duplicate_filename: имя файла-оригинала внутри архива
+        :param source_filename: имя повтора внутри архива
+        :return:
+        """
+        duplicate_stem, source_stem = duplicate_filename.rsplit('.', 1)[0], source_filename.rsplit('.', 1)[0]
+        if processed_filename.startswith(duplicate_stem):
+            return source_stem + processed_filename[len(duplicate_stem):]
+        return source_filename
+
     def encode_broken_name(self, name):
         """
         Функция для корректного отображения кирилицы в названии zip-файлов
@@ -268,15 +1091,10 @@ class FileProcessor:
         logger.info(f'Отправка файла {filepath} в хранилище...')
         filename = filepath.split(os.sep)[-1]
         s3path = f'image_processing/{filename}'
-        for iteration in range(3):
-            try:
-                storage.upload_file(s3path, filepath, os.getenv('S3_BUCKET_NAME'))
-                logger.info(f'Файл отправлен: {s3path}.')
-                file_url = storage.share_file_from_bucket(s3path)
-                return file_url
-            except Exception as err:
-                logger.error(f'Не удалось отправить файл в хранилище: {err}')
-                if iteration - 1 == 2:
-                    raise IOError(f'Не удалось отправить файл в хранилище: {err}')
-                else:
-                    continue
+        try:
+            storage.upload_file(s3path, filepath, os.getenv('S3_BUCKET_NAME'))
+        except Exception as err:
+            logger.error(f'Не удалось отправить файл в хранилище: {err}')
+            raise IOError(f'Не удалось отправить файл в хранилище: {err}')
+        logger.info(f'Файл отправлен: {s3path}.')
+        return storage.share_file_from_bucket(s3path)
@@ -0,0 +1,254 @@
+"""
+Контроль допуска задач обработки изображений. Стоимость задачи - оценка кол-ва пикселей
+декодированных изображений по заголовкам файлов (до начала обработки). Ограничения:
+- бюджет пикселей одновременно обрабатываемых задач процесса;
+- кол-во одновременных тяжёлых задач узла (общие для процессов файлы-слоты с блокировкой fcntl);
+- небольшие одиночные изображения обрабатываются в отдельной быстрой полосе и не ждут архивы.
+Задача, не допущенная за время ожидания, отклоняется (HTTP 429 с заголовком Retry-After)
+"""
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from zipfile import ZipFile
+
+from django.conf import settings
+from PIL import Image
+
+from .metrics import StageTimings, get_average_duration
+
+try:
+    import fcntl
+except ImportError:
+    # блокировки файлов недоступны (Windows) - ограничение узла не применяется
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# папка файлов-слотов ограничения одновременных задач узла
+SLOTS_DIR = os.path.join(settings.BASE_DIR, 'media', 'image_processing_slots')
+# интервал проверки свободных слотов узла, сек
+SLOT_POLL_INTERVAL = 0.1
+# оценка кол-ва пикселей векторного файла (размер растеризации заранее неизвестен)
+VECTOR_PIXELS_ESTIMATE = 4_000_000
+# границы значения заголовка Retry-After, сек
+RETRY_AFTER_MIN = 1
+RETRY_AFTER_MAX = 60
+
+RASTER_EXTENSIONS = ('png', 'webp', 'jpg', 'jpeg')
+VECTOR_EXTENSIONS = ('svg', 'ai', 'eps')
+
+
+class AdmissionRejected(Exception):
+    """
+    Задача не допущена к обработке за время ожидания
+    """
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f'Обработчик перегружен, повторите запрос через {retry_after} сек')
+
+
+def get_extension(filename: str) -> str:
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def read_pixels(file, extension: str) -> int:
+    """
+    Кол-во пикселей изображения по заголовку файла (без декодирования)
+    :param file: файловый объект, позиция в начале файла
+    :param extension: расширение файла
+    :return: кол-во пикселей, 0 для файлов, не являющихся изображениями
+    """
+    if extension in VECTOR_EXTENSIONS:
+        return VECTOR_PIXELS_ESTIMATE
+    if extension not in RASTER_EXTENSIONS:
+        return 0
+    try:
+        with Image.open(file) as image:
+            return image.width * image.height
+    except Exception as err:
+        # повреждённый заголовок - ошибка будет получена при обработке
+        logger.warning(f'Не удалось прочитать заголовок изображения: {err}')
+        return 0
+
+
+def estimate_pixels(file) -> int:
+    """
+    Оценка стоимости задачи: суммарное кол-во пикселей изображений загруженного файла или zip-архива
+    :param file: загруженный файл
+    :return:
+    """
+    extension = get_extension(file.name)
+    file.seek(0)
+    try:
+        if extension != 'zip':
+            return read_pixels(file, extension)
+        pixels = 0
+        with ZipFile(file) as zipfile:
+            for info in zipfile.infolist():
+                entry_extension = get_extension(info.filename)
+                if info.is_dir() or entry_extension not in RASTER_EXTENSIONS + VECTOR_EXTENSIONS:
+                    continue
+                with zipfile.open(info) as entry:
+                    pixels += read_pixels(entry, entry_extension)
+        return pixels
+    finally:
+        file.seek(0)
+
+
+def get_retry_after() -> int:
+    """
+    Рекомендуемая задержка повторного запроса - средняя длительность задачи по гистограммам метрик
+    """
+    try:
+        average = get_average_duration('job_total')
+    except Exception as err:
+        logger.error(f'Не удалось получить среднюю длительность задачи: {err}')
+        average = None
+    if average is None:
+        return RETRY_AFTER_MIN
+    return min(max(math.ceil(average), RETRY_AFTER_MIN), RETRY_AFTER_MAX)
+
+
+class PixelBudget:
+    """
+    Бюджет пикселей одновременно обрабатываемых задач процесса. Задача дороже всего бюджета
+    допускается, когда других задач нет
+    """
+
+    def __init__(self, max_pixels: int):
+        self.max_pixels = max_pixels
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, pixels: int, deadline: float | None) -> bool:
+        """
+        :param pixels: стоимость задачи
+        :param deadline: крайний момент ожидания (time.monotonic) или None - без ограничения
+        :return: True, если задача допущена
+        """
+        with self._condition:
+            while self.used and self.used + pixels > self.max_pixels:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    return False
+                self._condition.wait(timeout)
+            self.used += pixels
+            return True
+
+    def release(self, pixels: int):
+        with self._condition:
+            self.used -= pixels
+            self._condition.notify_all()
+
+
+class NodeSlots:
+    """
+    Ограничение одновременных задач узла: задача удерживает эксклюзивную блокировку одного
+    из файлов-слотов, блокировка снимается ОС и при аварийном завершении процесса
+    """
+
+    def __init__(self, slots: int, slots_dir: str = SLOTS_DIR):
+        self.slots = slots if fcntl else 0
+        self.slots_dir = slots_dir
+        if slots and not fcntl:
+            logger.warning('Блокировки файлов недоступны, ограничение задач узла не применяется')
+
+    def acquire(self, deadline: float | None):
+        """
+        :param deadline: крайний момент ожидания (time.monotonic) или None - без ограничения
+        :return: файл занятого слота, None - ограничение не применяется, False - слот не получен
+        """
+        if not self.slots:
+            return None
+        os.makedirs(self.slots_dir, exist_ok=True)
+        while True:
+            for slot in range(self.slots):
+                slot_file = open(os.path.join(self.slots_dir, f'slot_{slot}.lock'), 'wb')
+                try:
+                    fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return slot_file
+                except BlockingIOError:
+                    slot_file.close()
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(SLOT_POLL_INTERVAL)
+
+    @staticmethod
+    def release(slot_file):
+        if slot_file:
+            fcntl.flock(slot_file, fcntl.LOCK_UN)
+            slot_file.close()
+
+
+class AdmissionController:
+    """
+    Допуск задач обработки: быстрая полоса для небольших одиночных изображений,
+    бюджет пикселей процесса и слоты узла - для остальных задач
+    """
+
+    def __init__(self, max_pixels: int, node_slots: int, fast_lane_pixels: int, fast_lane_slots: int):
+        """
+        :param max_pixels: бюджет пикселей процесса, 0 - без ограничения
+        :param node_slots: кол-во одновременных тяжёлых задач узла, 0 - без ограничения
+        :param fast_lane_pixels: максимальное кол-во пикселей изображения быстрой полосы
+        :param fast_lane_slots: кол-во одновременных задач быстрой полосы процесса
+        """
+        self.budget = PixelBudget(max_pixels) if max_pixels else None
+        self.node_slots = NodeSlots(node_slots)
+        self.fast_lane_pixels = fast_lane_pixels
+        self.fast_lane = threading.BoundedSemaphore(fast_lane_slots)
+
+    def is_fast_lane(self, file, pixels: int) -> bool:
+        return get_extension(file.name) != 'zip' and pixels <= self.fast_lane_pixels
+
+    @contextmanager
+    def admit(self, file, timeout: float | None, timings: StageTimings = None):
+        """
+        Допуск задачи к обработке на время контекста
+        :param file: загруженный файл
+        :param timeout: максимальное время ожидания, сек (None - без ограничения)
+        :param timings: замеры задачи, в них добавляется стадия admission (оценка и ожидание допуска)
+        :raises AdmissionRejected: задача не допущена за время ожидания
+        """
+        started = time.perf_counter()
+        pixels = estimate_pixels(file)
+        if self.is_fast_lane(file, pixels):
+            if not self.fast_lane.acquire(timeout=timeout):
+                raise AdmissionRejected(get_retry_after())
+            if timings:
+                timings.add('admission', time.perf_counter() - started)
+            try:
+                yield
+            finally:
+                self.fast_lane.release()
+            return
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.budget and not self.budget.acquire(pixels, deadline):
+            raise AdmissionRejected(get_retry_after())
+        try:
+            slot_file = self.node_slots.acquire(deadline)
+            if slot_file is False:
+                raise AdmissionRejected(get_retry_after())
+            if timings:
+                timings.add('admission', time.perf_counter() - started)
+            try:
+                logger.info(f'Задача допущена к обработке: {file.name}, {pixels} пикс.')
+                yield
+            finally:
+                self.node_slots.release(slot_file)
+        finally:
+            if self.budget:
+                self.budget.release(pixels)
+
+
+admission = AdmissionController(
+    max_pixels=settings.IMAGE_PROCESSING_MAX_PIXELS_IN_FLIGHT,
+    node_slots=settings.IMAGE_PROCESSING_NODE_SLOTS,
+    fast_lane_pixels=settings.IMAGE_PROCESSING_FAST_LANE_PIXELS,
+    fast_lane_slots=settings.IMAGE_PROCESSING_FAST_LANE_SLOTS,
+)
@@ -0,0 +1,321 @@
+"""
+Бенчмарк конвейера обработки изображений: синтетические входные данные, замеры стадий
+(декодирование, изменение размера, кодирование, zip, загрузка в хранилище) и сравнимый отчёт.
+Запуск - команда manage.py benchmark_image_processing (набор pipeline)
+"""
+import io
+import logging
+import math
+import platform
+import resource
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from unittest import mock
+from zipfile import ZipFile
+
+import PIL
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from cairosvg.parser import Tree
+
+from core.storage import create_storage
+from core.storage_backends import BaseStorage, InMemoryStorage
+from . import cache as cache_module
+from . import FileProcessor as file_processor_module
+from .FileProcessor import FileProcessor, ImageProcessor
+
+# форматы синтетических входных данных -> (расширение файла, формат pillow)
+INPUT_FORMATS = {
+    'png': ('png', 'PNG'),
+    'jpeg': ('jpg', 'JPEG'),
+    'webp': ('webp', 'WEBP'),
+    'svg': ('svg', None),
+}
+
+
+def make_photo(width: int, height: int, fmt: str = 'JPEG', quality: int = 90) -> bytes:
+    """
+    Синтетическое "фото": градиенты и шум, по сжатию и времени декодирования близко к реальным фотографиям
+    :return: закодированное изображение
+    """
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.ROTATE_180)))
+    output_file = io.BytesIO()
+    image.save(output_file, format=fmt, quality=quality)
+    return output_file.getvalue()
+
+
+def make_svg(width: int, height: int, shapes: int = 200) -> bytes:
+    """
+    Синтетическая векторная иллюстрация: градиентная заливка, фигуры и кривые
+    :param shapes: кол-во фигур (определяет время разбора и растеризации)
+    :return: svg-документ
+    """
+    elements = []
+    for i in range(shapes):
+        x, y = (i * 37) % width, (i * 53) % height
+        size = 5 + (i * 7) % max(width // 10, 6)
+        if i % 3 == 0:
+            elements.append(f'<circle cx="{x}" cy="{y}" r="{size}" fill="url(#g)" opacity="0.6"/>')
+        elif i % 3 == 1:
+            elements.append(f'<rect x="{x}" y="{y}" width="{size * 2}" height="{size}" fill="#{i * 4099 % 0xffffff:06x}"/>')
+        else:
+            elements.append(f'<path d="M{x} {y} C{x + size} {y - size} {x + 2 * size} {y + size} {x + 3 * size} {y}" '
+                            f'stroke="#{i * 911 % 0xffffff:06x}" stroke-width="3" fill="none"/>')
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        '<defs><linearGradient id="g"><stop offset="0" stop-color="#f80"/><stop offset="1" stop-color="#08f"/>'
+        f'</linearGradient></defs><rect width="{width}" height="{height}" fill="#eee"/>{"".join(elements)}</svg>'
+    ).encode()
+
+
+def make_input(fmt: str, width: int, height: int) -> bytes:
+    """
+    Синтетический входной файл заданного формата
+    :param fmt: ключ INPUT_FORMATS
+    :return:
+    """
+    if fmt == 'svg':
+        return make_svg(width, height)
+    return make_photo(width, height, INPUT_FORMATS[fmt][1])
+
+
+def make_archive(fmt: str, width: int, height: int, entries: int) -> bytes:
+    """
+    Zip-архив из одинаковых по размеру синтетических изображений (содержимое каждого файла уникально)
+    :param entries: кол-во файлов в архиве
+    :return:
+    """
+    output_file = io.BytesIO()
+    extension = INPUT_FORMATS[fmt][0]
+    with ZipFile(output_file, 'w') as output_zip:
+        for i in range(entries):
+            # уникальный размер - уникальное содержимое, чтобы кэш и дедупликация не искажали замеры
+            output_zip.writestr(f'images/{i:04d}.{extension}', make_input(fmt, width + i % 7, height))
+    return output_file.getvalue()
+
+
+@contextmanager
+def in_memory_storage(storage: BaseStorage = None):
+    """
+    Подменяет хранилище модулей обработки на время замеров
+    :param storage: хранилище, по-умолчанию InMemoryStorage (сеть исключается из замеров)
+    """
+    storage = storage or InMemoryStorage()
+    with mock.patch.object(file_processor_module, 'storage', storage), \
+            mock.patch.object(cache_module, 'storage', storage):
+        yield storage
+
+
+def peak_rss_mb() -> dict:
+    """
+    Пиковое потребление памяти (RSS) текущим процессом и завершёнными дочерними процессами
+    (процессы пула учитываются только после их завершения)
+    :return: словарь {'self', 'children'}, МБ
+    """
+    # ru_maxrss: Linux - килобайты, macOS - байты
+    divider = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divider, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divider, 1),
+    }
+
+
+def percentile(durations: list[float], percent: int) -> float:
+    """
+    Перцентиль методом ближайшего ранга (для малого числа повторов)
+    """
+    ordered = sorted(durations)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class BenchmarkSuite:
+    """
+    Набор замеров конвейера обработки. Каждый замер - кейс вида '<вход>/<стадия>', для которого
+    считаются медиана, p95, среднее время и пропускная способность
+    """
+
+    def __init__(self, formats: list[str], sizes: list[tuple[int, int]], archive_sizes: list[int],
+                 archive_entry_size: tuple[int, int], target_width: int, iterations: int, workers: int = None,
+                 storage_backend: str = 'memory'):
+        """
+        :param formats: форматы входных данных (ключи INPUT_FORMATS)
+        :param sizes: размеры одиночных изображений (ширина, высота)
+        :param archive_sizes: кол-во файлов в zip-архивах
+        :param archive_entry_size: размер изображений в архивах
+        :param target_width: ширина результата (с сохранением пропорций)
+        :param iterations: кол-во повторов каждого замера
+        :param workers: кол-во процессов обработки архивов, по-умолчанию settings.IMAGE_PROCESSING_WORKERS
+        :param storage_backend: хранилище результатов (STORAGE_BACKEND): memory - без сети,
+        minio или local - для замера стоимости загрузки в реальное хранилище
+        """
+        self.formats = formats
+        self.sizes = sizes
+        self.archive_sizes = archive_sizes
+        self.archive_entry_size = archive_entry_size
+        self.target_width = target_width
+        self.iterations = iterations
+        self.workers = workers or settings.IMAGE_PROCESSING_WORKERS
+        self.storage_backend = storage_backend
+        self.results = []
+
+    def request_data(self, fmt: str) -> dict:
+        """
+        Параметры обработки: уменьшение до target_width в том же формате (svg - растеризация в png)
+        """
+        return {'format': 'png' if fmt == 'svg' else fmt, 'quality': '85', 'resolution': False,
+                'proportion': True, 'toggle_switch': True, 'width': self.target_width, 'height': 0,
+                'vector': False, 'variants': []}
+
+    def run(self, progress=None) -> dict:
+        """
+        Выполнение всех замеров
+        :param progress: функция вывода хода выполнения progress(message)
+        :return: отчёт
+        """
+        progress = progress or (lambda message: None)
+        # логи обработки каждого изображения искажают замеры
+        logging.disable(logging.INFO)
+        try:
+            with in_memory_storage(create_storage(self.storage_backend)):
+                for fmt in self.formats:
+                    for width, height in self.sizes:
+                        progress(f'{fmt} {width}x{height}...')
+                        self.bench_image(fmt, width, height)
+                    for entries in self.archive_sizes:
+                        progress(f'{fmt} zip, файлов: {entries}...')
+                        self.bench_archive(fmt, entries)
+        finally:
+            logging.disable(logging.NOTSET)
+        return self.report()
+
+    def bench_image(self, fmt: str, width: int, height: int):
+        """
+        Стадии обработки одиночного изображения: decode, resize, encode, process (ImageProcessor целиком),
+        request (FileProcessor с загрузкой в хранилище)
+        """
+        extension = INPUT_FORMATS[fmt][0]
+        data = make_input(fmt, width, height)
+        filename = f'image.{extension}'
+        case = f'{fmt}-{width}x{height}'
+        size_mb = len(data) / 1024 / 1024
+
+        def new_processor():
+            return ImageProcessor(data, filename, self.request_data(fmt))
+
+        if fmt == 'svg':
+            self.measure(f'{case}/decode', lambda: Tree(bytestring=data), size_mb=size_mb)
+            self.measure(f'{case}/rasterize', lambda: new_processor()._vector2rastr(), size_mb=size_mb)
+        else:
+            def decode():
+                with Image.open(io.BytesIO(data)) as image:
+                    image.load()
+
+            self.measure(f'{case}/decode', decode, size_mb=size_mb)
+
+            with Image.open(io.BytesIO(data)) as image:
+                image.load()
+                target_size = (self.target_width, max(round(self.target_width * image.height / image.width), 1))
+                self.measure(f'{case}/resize', lambda: new_processor()._resize(image, target_size))
+                resized = image.resize(target_size)
+                self.measure(f'{case}/encode', lambda: new_processor()._save_rastr(resized))
+
+        self.measure(f'{case}/process', lambda: new_processor().process_image(), size_mb=size_mb)
+        self.measure(f'{case}/request', lambda: self.run_request(data, filename, fmt), size_mb=size_mb)
+
+    def bench_archive(self, fmt: str, entries: int):
+        """
+        Стадии обработки zip-архива: zip (обработка и запись архива в память), request (с загрузкой в хранилище)
+        """
+        width, height = self.archive_entry_size
+        data = make_archive(fmt, width, height, entries)
+        case = f'{fmt}-zip{entries}-{width}x{height}'
+        size_mb = len(data) / 1024 / 1024
+
+        def write_zip():
+            request_data = dict(self.request_data(fmt), file=SimpleUploadedFile('archive.zip', data))
+            FileProcessor(request_data, workers=self.workers, use_cache=False).write_zip(io.BytesIO())
+
+        self.measure(f'{case}/zip', write_zip, items=entries, size_mb=size_mb)
+        self.measure(f'{case}/request', lambda: self.run_request(data, 'archive.zip', fmt),
+                     items=entries, size_mb=size_mb)
+
+    def run_request(self, data: bytes, filename: str, fmt: str):
+        request_data = dict(self.request_data(fmt), file=SimpleUploadedFile(filename, data))
+        FileProcessor(request_data, workers=self.workers, use_cache=False).start_processing()
+
+    def measure(self, case: str, func, items: int = 1, size_mb: float = None):
+        """
+        Замер кейса: один прогрев и iterations повторов
+        :param case: имя кейса
+        :param func: замеряемая функция без аргументов
+        :param items: кол-во изображений, обрабатываемых за один вызов
+        :param size_mb: размер входных данных, МБ (для пропускной способности в МБ/с)
+        """
+        func()
+        durations = []
+        for _ in range(self.iterations):
+            started = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - started)
+
+        mean = statistics.mean(durations)
+        result = {
+            'case': case,
+            'p50_ms': round(statistics.median(durations) * 1000, 2),
+            'p95_ms': round(percentile(durations, 95) * 1000, 2),
+            'mean_ms': round(mean * 1000, 2),
+            'images_per_s': round(items / mean, 2),
+            'mb_per_s': round(size_mb / mean, 2) if size_mb else None,
+            # ru_maxrss не уменьшается: пик процесса к моменту окончания кейса
+            'peak_rss_mb': peak_rss_mb()['self'],
+        }
+        self.results.append(result)
+        return result
+
+    def report(self) -> dict:
+        return {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'pillow': PIL.__version__,
+                'platform': platform.platform(),
+                'workers': self.workers,
+                'iterations': self.iterations,
+                'target_width': self.target_width,
+                'downscale_mode': settings.IMAGE_PROCESSING_DOWNSCALE_MODE,
+                'storage_backend': self.storage_backend,
+            },
+            'results': self.results,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+
+def compare_reports(report: dict, baseline: dict, threshold: float) -> list[dict]:
+    """
+    Сравнение медианного времени кейсов с базовым отчётом
+    :param report: текущий отчёт
+    :param baseline: базовый отчёт (например, с предыдущего релиза)
+    :param threshold: допустимое замедление, процент
+    :return: список {'case', 'baseline_ms', 'current_ms', 'change_pct', 'regression'} для общих кейсов
+    """
+    baseline_results = {result['case']: result for result in baseline['results']}
+    comparison = []
+    for result in report['results']:
+        baseline_result = baseline_results.get(result['case'])
+        if not baseline_result or not baseline_result['p50_ms']:
+            continue
+        change = (result['p50_ms'] - baseline_result['p50_ms']) / baseline_result['p50_ms'] * 100
+        comparison.append({
+            'case': result['case'],
+            'baseline_ms': baseline_result['p50_ms'],
+            'current_ms': result['p50_ms'],
+            'change_pct': round(change, 1),
+            'regression': change > threshold,
+        })
+    return comparison
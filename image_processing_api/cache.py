@@ -0,0 +1,150 @@
+"""
+Кэш результатов обработки изображений, адресуемый по содержимому.
+Ключ - хэш входных данных и нормализованных параметров сериализатора Request:
+- результат целиком (ссылка на объект в S3-хранилище) - для повторно загруженных файлов и архивов;
+- обработанные файлы zip-архива - для архивов, изменённых частично
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.storage import storage
+
+logger = logging.getLogger(__name__)
+
+RESULT_KEY_PREFIX = 'image_processing:result:'
+ENTRY_KEY_PREFIX = 'image_processing:entry:'
+# запас до удаления объекта правилом жизненного цикла корзины: запись кэша должна истечь раньше объекта
+LIFECYCLE_SAFETY_MARGIN = timedelta(hours=1)
+# параметры запроса, не влияющие на результат обработки
+IGNORED_PARAMS = ('file', 'async_mode', 'timings', 'inline')
+
+
+def normalize_params(request_data) -> dict:
+    """
+    Приводит параметры обработки к каноническому виду: разные наборы параметров,
+    дающие одинаковый результат, дают одинаковый ключ кэша
+    :param request_data: параметры запроса (сериализатор Request)
+    :return:
+    """
+    params = {key: value for key, value in request_data.items() if key not in IGNORED_PARAMS}
+    fmt = str(params.get('format', '')).lower()
+    params['format'] = 'jpeg' if fmt == 'jpg' else fmt
+    params['quality'] = str(params.get('quality', '')).strip()
+    if not params.get('max_file_size'):
+        params.pop('max_file_size', None)
+
+    if params.get('resolution'):
+        # при сохранении исходного разрешения размеры не используются
+        for key in ('proportion', 'toggle_switch', 'width', 'height'):
+            params.pop(key, None)
+    elif params.get('proportion'):
+        # при сохранении пропорций используется только редактируемый размер
+        params.pop('height' if params.get('toggle_switch') else 'width', None)
+    return params
+
+
+def get_extension(filename: str) -> str:
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+class ResultCache:
+    def make_key(self, prefix: str, content_digest: str, filename: str, request_data) -> str:
+        params = json.dumps(normalize_params(request_data), sort_keys=True, default=str)
+        key_data = f'{content_digest}:{get_extension(filename)}:{params}'
+        return prefix + hashlib.sha256(key_data.encode()).hexdigest()
+
+    def result_key(self, file, request_data) -> str:
+        """
+        Ключ результата обработки загруженного файла
+        :param file: загруженный файл (django File)
+        :param request_data: параметры запроса
+        :return:
+        """
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        file.seek(0)
+        return self.make_key(RESULT_KEY_PREFIX, hasher.hexdigest(), file.name, request_data)
+
+    def entry_key(self, data: bytes, filename: str, request_data) -> str:
+        """
+        Ключ обработанного файла zip-архива
+        :param data: содержимое файла
+        :param filename: имя файла внутри архива
+        :param request_data: параметры запроса
+        :return:
+        """
+        return self.make_key(ENTRY_KEY_PREFIX, hashlib.sha256(data).hexdigest(), filename, request_data)
+
+    def get_result(self, key: str):
+        """
+        Возвращает закэшированный результат, если объект ещё существует в хранилище
+        :param key: ключ результата
+        :return: словарь {'s3path', 'file_name'} или None
+        """
+        result = cache.get(key)
+        if result is None:
+            return None
+        try:
+            if storage.object_exists(result['s3path']):
+                return result
+        except Exception as err:
+            logger.error(f'Не удалось проверить наличие файла {result["s3path"]} в хранилище: {err}')
+            return None
+        cache.delete(key)
+        return None
+
+    def set_result(self, key: str, s3path: str, file_name: str):
+        timeout = self.get_timeout(s3path)
+        if timeout > 0:
+            cache.set(key, {'s3path': s3path, 'file_name': file_name}, timeout=timeout)
+
+    def get_entry(self, key: str, filename: str):
+        """
+        :param key: ключ обработанного файла
+        :param filename: имя исходного файла внутри архива
+        :return: кортеж (имя обработанного файла, содержимое) или None
+        """
+        cached_entry = cache.get(key)
+        if cached_entry is None:
+            return None
+        extension, data = cached_entry
+        # расширение сохраняется в кэш, только если обработка его изменила
+        if extension is not None:
+            current_extension = filename.split('.')[-1]
+            filename = filename.replace(f'.{current_extension}', f'.{extension}')
+        return filename, data
+
+    def set_entry(self, key: str, source_filename: str, filename: str, data: bytes):
+        """
+        :param key: ключ обработанного файла
+        :param source_filename: имя исходного файла внутри архива
+        :param filename: имя обработанного файла
+        :param data: содержимое обработанного файла
+        """
+        if len(data) > settings.IMAGE_PROCESSING_CACHE_ENTRY_MAX_SIZE:
+            return
+        extension = None if filename == source_filename else filename.split('.')[-1]
+        cache.set(key, (extension, bytes(data)), timeout=settings.IMAGE_PROCESSING_CACHE_TTL)
+
+    @staticmethod
+    def get_timeout(s3path: str) -> float:
+        """
+        Время жизни записи кэша: не больше IMAGE_PROCESSING_CACHE_TTL и не дольше срока хранения
+        объекта по правилам жизненного цикла корзины
+        :param s3path: имя объекта в хранилище
+        :return: секунды
+        """
+        timeout = settings.IMAGE_PROCESSING_CACHE_TTL
+        expiration = storage.object_expiration(s3path)
+        if expiration is not None:
+            timeout = min(timeout, (expiration - LIFECYCLE_SAFETY_MARGIN).total_seconds())
+        return max(timeout, 0)
+
+
+result_cache = ResultCache()
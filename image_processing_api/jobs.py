@@ -0,0 +1,208 @@
+"""
+Асинхронная обработка изображений: загруженный файл сохраняется на диск, задача (ProcessingJob)
+выполняется фоновым пулом потоков, состояние задачи хранится в БД и доступно из любого процесса.
+Пул потоков существует только в процессе, принявшем задачу: процесс, выполняющий задачи, удерживает
+блокировку своего файла-владельца, задачи процесса, завершившегося без снятия блокировки (перезапуск,
+аварийное завершение), отмечаются ошибочными при запуске пула или командой recover_jobs
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections
+from django.db.models import Q
+
+from .FileProcessor import FileProcessor
+from .models import ProcessingJob
+
+try:
+    import fcntl
+except ImportError:
+    # блокировки файлов недоступны (Windows) - зависшие задачи не восстанавливаются
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# папка для хранения загруженных файлов до окончания обработки
+UPLOADS_DIR = os.path.join(settings.BASE_DIR, 'media', 'image_processing_uploads')
+# минимальный интервал между сохранениями прогресса задачи в БД, сек
+PROGRESS_SAVE_INTERVAL = 1
+
+# папка файлов-владельцев задач: процесс, выполняющий задачи, удерживает блокировку своего файла
+WORKERS_DIR = os.path.join(settings.BASE_DIR, 'media', 'image_processing_workers')
+# сообщение об ошибке задачи, процесс которой завершился до окончания обработки
+ORPHANED_JOB_ERROR = 'процесс обработки завершился до окончания задачи, повторите запрос'
+
+# параметры запроса, не сохраняемые в задаче: файл хранится отдельно, результат задачи всегда
+# загружается в хранилище (inline недоступен)
+JOB_EXCLUDED_PARAMETERS = ('file', 'inline')
+
+# идентификатор процесса-владельца задач: хост и случайная часть (pid повторно используется после перезапуска)
+WORKER_ID = f'{socket.gethostname()}:{uuid.uuid4().hex}'
+
+# пул потоков для выполнения задач, создаётся при первом обращении
+_executor = None
+_executor_lock = threading.Lock()
+# файл-владелец задач текущего процесса (блокировка удерживается до завершения процесса)
+_worker_lock_file = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            acquire_worker_lock()
+            recover_orphaned_jobs()
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_PROCESSING_JOB_WORKERS,
+                                           thread_name_prefix='image_processing_job')
+    return _executor
+
+
+def get_worker_lock_path(worker_id: str) -> str:
+    return os.path.join(WORKERS_DIR, worker_id.split(':', 1)[1] + '.lock')
+
+
+def acquire_worker_lock():
+    """
+    Блокировка файла-владельца задач текущего процесса, снимается ОС при завершении процесса
+    """
+    global _worker_lock_file
+    if not fcntl:
+        return
+    os.makedirs(WORKERS_DIR, exist_ok=True)
+    _worker_lock_file = open(get_worker_lock_path(WORKER_ID), 'wb')
+    fcntl.flock(_worker_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def is_worker_alive(worker_id: str) -> bool:
+    """
+    Выполняется ли процесс-владелец задач этого узла: его файл-владелец заблокирован
+    :param worker_id: идентификатор процесса (ProcessingJob.worker)
+    """
+    if worker_id == WORKER_ID:
+        return True
+    lock_path = get_worker_lock_path(worker_id)
+    if not os.path.exists(lock_path):
+        return False
+    with open(lock_path, 'ab') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        os.remove(lock_path)
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return False
+
+
+def recover_orphaned_jobs() -> int:
+    """
+    Отмечает ошибочными незавершённые задачи (в очереди и в обработке) завершившихся процессов этого узла
+    и удаляет их загруженные файлы. Задачи других узлов восстанавливаются на своих узлах, задачи без
+    процесса-владельца (созданные до его учёта) - на любом узле
+    :return: кол-во восстановленных задач
+    """
+    if not fcntl:
+        logger.warning('Блокировки файлов недоступны, зависшие задачи не восстанавливаются')
+        return 0
+    jobs = ProcessingJob.objects.filter(
+        Q(worker__startswith=f'{socket.gethostname()}:') | Q(worker__isnull=True),
+        status__in=(ProcessingJob.STATUS_QUEUED, ProcessingJob.STATUS_RUNNING),
+    ).only('id', 'worker', 'source_path')
+    orphaned = [job for job in jobs if job.worker is None or not is_worker_alive(job.worker)]
+    if not orphaned:
+        return 0
+
+    ProcessingJob.objects.filter(pk__in=[job.pk for job in orphaned]).update(
+        status=ProcessingJob.STATUS_FAILED, error_msg=ORPHANED_JOB_ERROR)
+    for job in orphaned:
+        if os.path.exists(job.source_path):
+            os.remove(job.source_path)
+    logger.warning(f'Задачи завершившихся процессов отмечены ошибочными: {[str(job.pk) for job in orphaned]}')
+    return len(orphaned)
+
+
+def submit_job(request_data) -> ProcessingJob:
+    """
+    Сохраняет загруженный файл и ставит задачу на обработку в очередь
+    :param request_data: проверенные параметры запроса (сериализатор Request)
+    :return: созданная задача
+    """
+    uploaded_file = request_data['file']
+    if not os.path.exists(UPLOADS_DIR):
+        os.makedirs(UPLOADS_DIR)
+
+    executor = get_executor()
+    job = ProcessingJob(
+        source_name=uploaded_file.name,
+        parameters={key: value for key, value in request_data.items() if key not in JOB_EXCLUDED_PARAMETERS},
+        worker=WORKER_ID
+    )
+    job.source_path = os.path.join(UPLOADS_DIR, f'{job.id}_{os.path.basename(uploaded_file.name)}')
+    with open(job.source_path, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+    job.save()
+
+    executor.submit(run_job, job.pk)
+    logger.info(f'Задача {job.pk} поставлена в очередь на обработку.')
+    return job
+
+
+def run_job(job_id):
+    """
+    Выполнение задачи в потоке пула
+    :param job_id: идентификатор задачи
+    """
+    close_old_connections()
+    job = None
+    try:
+        job = ProcessingJob.objects.get(pk=job_id)
+        job.status = ProcessingJob.STATUS_RUNNING
+        job.save(update_fields=['status', 'updated_at'])
+
+        with open(job.source_path, 'rb') as source:
+            request_data = dict(job.parameters, file=File(source, name=job.source_name))
+            file_processor = FileProcessor(request_data)
+            file_processor.progress_callback = JobProgress(job)
+            # задача уже в очереди пула - ожидает допуска к обработке без ограничения времени
+            file_processor.admission_timeout = None
+            file_url = file_processor.start_processing()
+
+        job.status = ProcessingJob.STATUS_DONE
+        job.file_name = file_processor.output_filename
+        job.file_url = file_url
+        job.entries_done = file_processor.entries_done
+        job.save(update_fields=['status', 'file_name', 'file_url', 'entries_done', 'updated_at'])
+        logger.info(f'Задача {job_id} обработана.')
+    except Exception as err:
+        logger.error(f'Ошибка обработки задачи {job_id}: {traceback.format_exc()}')
+        ProcessingJob.objects.filter(pk=job_id).update(status=ProcessingJob.STATUS_FAILED, error_msg=str(err))
+    finally:
+        if job and os.path.exists(job.source_path):
+            os.remove(job.source_path)
+        close_old_connections()
+
+
+class JobProgress:
+    """
+    Функция обратного вызова FileProcessor.progress_callback: сохраняет прогресс задачи в БД
+    не чаще, чем раз в PROGRESS_SAVE_INTERVAL секунд
+    """
+
+    def __init__(self, job: ProcessingJob):
+        self.job = job
+        self.saved_at = 0
+
+    def __call__(self, done: int, total: int):
+        now = time.monotonic()
+        if done and done != total and now - self.saved_at < PROGRESS_SAVE_INTERVAL:
+            return
+        self.saved_at = now
+        ProcessingJob.objects.filter(pk=self.job.pk).update(entries_done=done, entries_total=total)
@@ -0,0 +1,140 @@
+import json
+import logging
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from image_processing_api.benchmark import INPUT_FORMATS, BenchmarkSuite, compare_reports, make_photo
+from image_processing_api.FileProcessor import ImageProcessor, DOWNSCALE_REDUCING_GAPS
+
+
+def parse_size(size: str) -> tuple[int, int]:
+    width, height = size.lower().split('x')
+    return int(width), int(height)
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк обработки изображений. pipeline - стадии decode, resize, encode, zip и загрузка '
+            'в хранилище (по-умолчанию в памяти) на синтетических PNG, JPEG, WebP и SVG; '
+            'downscale - уменьшение JPEG-изображений в режимах IMAGE_PROCESSING_DOWNSCALE_MODE')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', default='pipeline', choices=['pipeline', 'downscale'],
+                            help='набор замеров (по-умолчанию pipeline)')
+        parser.add_argument('--iterations', type=int, default=5, help='кол-во повторов каждого замера')
+
+        pipeline = parser.add_argument_group('pipeline')
+        pipeline.add_argument('--formats', default=','.join(INPUT_FORMATS), help='форматы входных данных через запятую')
+        pipeline.add_argument('--sizes', default='640x480,1920x1280,6000x4000',
+                              help='размеры одиночных изображений через запятую, ШxВ')
+        pipeline.add_argument('--archive-sizes', default='10,50', help='кол-во файлов в zip-архивах через запятую')
+        pipeline.add_argument('--archive-entry-size', default='1280x853', help='размер изображений в архивах, ШxВ')
+        pipeline.add_argument('--target-width', type=int, default=320, help='ширина результата')
+        pipeline.add_argument('--workers', type=int, help='кол-во процессов обработки архивов')
+        pipeline.add_argument('--storage', default='memory', choices=['memory', 'local', 'minio'],
+                              help='хранилище результатов: memory - без сети, local или minio - замер реального '
+                                   'хранилища (по-умолчанию memory)')
+        pipeline.add_argument('--output', help='путь для сохранения отчёта в JSON')
+        pipeline.add_argument('--baseline', help='отчёт JSON для сравнения (например, с предыдущего релиза)')
+        pipeline.add_argument('--threshold', type=float, default=10.0,
+                              help='допустимое замедление медианы относительно baseline, процент')
+
+        downscale = parser.add_argument_group('downscale')
+        downscale.add_argument('--source-size', default='6000x4000', help='размер исходного изображения, ШxВ')
+        downscale.add_argument('--target-widths', default='320,1280', help='ширина результата через запятую')
+
+    def handle(self, *args, **options):
+        if options['suite'] == 'downscale':
+            self.run_downscale(options)
+        else:
+            self.run_pipeline(options)
+
+    def run_pipeline(self, options):
+        formats = [fmt.strip().lower() for fmt in options['formats'].split(',') if fmt.strip()]
+        unknown_formats = set(formats) - set(INPUT_FORMATS)
+        if unknown_formats:
+            raise CommandError(f'Неизвестные форматы: {", ".join(sorted(unknown_formats))}')
+
+        suite = BenchmarkSuite(
+            formats=formats,
+            sizes=[parse_size(size) for size in options['sizes'].split(',') if size],
+            archive_sizes=[int(entries) for entries in options['archive_sizes'].split(',') if entries],
+            archive_entry_size=parse_size(options['archive_entry_size']),
+            target_width=options['target_width'],
+            iterations=options['iterations'],
+            workers=options['workers'],
+            storage_backend=options['storage'],
+        )
+        report = suite.run(progress=self.stdout.write)
+        self.print_report(report)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'\nОтчёт сохранён: {options["output"]}')
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            comparison = compare_reports(report, baseline, options['threshold'])
+            self.print_comparison(comparison)
+            regressions = [row['case'] for row in comparison if row['regression']]
+            if regressions:
+                raise CommandError(f'Замедление более {options["threshold"]}%: {", ".join(regressions)}')
+
+    def print_report(self, report: dict):
+        self.stdout.write(f'\n{"кейс":<36}{"p50, мс":>10}{"p95, мс":>10}{"изобр./с":>10}{"МБ/с":>9}{"RSS, МБ":>9}')
+        for result in report['results']:
+            mb_per_s = '' if result['mb_per_s'] is None else f'{result["mb_per_s"]:.2f}'
+            self.stdout.write(f'{result["case"]:<36}{result["p50_ms"]:>10.1f}{result["p95_ms"]:>10.1f}'
+                              f'{result["images_per_s"]:>10.1f}{mb_per_s:>9}{result["peak_rss_mb"]:>9.1f}')
+        rss = report['peak_rss_mb']
+        self.stdout.write(f'\nПиковый RSS: процесс {rss["self"]} МБ, дочерние процессы {rss["children"]} МБ')
+
+    def print_comparison(self, comparison: list[dict]):
+        self.stdout.write(f'\n{"кейс":<36}{"было, мс":>10}{"стало, мс":>11}{"изменение":>11}')
+        for row in comparison:
+            mark = '  <- замедление' if row['regression'] else ''
+            self.stdout.write(f'{row["case"]:<36}{row["baseline_ms"]:>10.1f}{row["current_ms"]:>11.1f}'
+                              f'{row["change_pct"]:>+10.1f}%{mark}')
+
+    def run_downscale(self, options):
+        source_width, source_height = parse_size(options['source_size'])
+        target_widths = [int(width) for width in options['target_widths'].split(',')]
+        iterations = options['iterations']
+
+        self.stdout.write(f'Генерация исходного изображения {source_width}x{source_height}...')
+        photo = make_photo(source_width, source_height)
+
+        # логи обработки каждого изображения искажают замеры
+        logging.disable(logging.INFO)
+        try:
+            for target_width in target_widths:
+                self.stdout.write(f'\nJPEG {source_width}x{source_height} -> ширина {target_width}, '
+                                  f'повторов: {iterations}')
+                self.stdout.write(f'{"режим":<10}{"медиана, мс":>14}{"ускорение":>12}')
+                baseline = None
+                for mode in DOWNSCALE_REDUCING_GAPS:
+                    median = self.measure_downscale(photo, target_width, mode, iterations)
+                    baseline = baseline or median
+                    self.stdout.write(f'{mode:<10}{median * 1000:>14.1f}{baseline / median:>11.2f}x')
+        finally:
+            logging.disable(logging.NOTSET)
+
+    @staticmethod
+    def measure_downscale(photo: bytes, target_width: int, mode: str, iterations: int) -> float:
+        """
+        Медианное время полной обработки изображения ImageProcessor (декодирование, уменьшение, кодирование)
+        :return: секунды
+        """
+        request_data = {'format': 'jpeg', 'quality': '85', 'resolution': False, 'proportion': True,
+                        'toggle_switch': True, 'width': target_width, 'height': 0, 'vector': False}
+        durations = []
+        with override_settings(IMAGE_PROCESSING_DOWNSCALE_MODE=mode):
+            for _ in range(iterations):
+                started = time.perf_counter()
+                ImageProcessor(photo, 'photo.jpg', dict(request_data)).process_image()
+                durations.append(time.perf_counter() - started)
+        return statistics.median(durations)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from image_processing_api.jobs import recover_orphaned_jobs
+
+
+class Command(BaseCommand):
+    help = ('Отмечает ошибочными незавершённые асинхронные задачи обработки изображений процессов этого узла, '
+            'завершившихся до окончания обработки (перезапуск, аварийное завершение), и удаляет их загруженные '
+            'файлы. Выполняется при запуске узла до старта процессов приложения')
+
+    def handle(self, *args, **options):
+        recovered = recover_orphaned_jobs()
+        self.stdout.write(f'Восстановлено задач: {recovered}')
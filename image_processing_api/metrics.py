@@ -0,0 +1,182 @@
+"""
+Замеры стадий обработки изображений: длительность и объём данных каждой стадии для задачи
+и для каждого файла zip-архива. Замеры задач агрегируются в гистограммы в БД (StageHistogramBucket),
+общие для всех процессов и узлов
+"""
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import StageHistogramBucket
+
+logger = logging.getLogger(__name__)
+
+# верхние границы интервалов гистограмм, мс
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class StageTimings:
+    """
+    Длительности и объёмы данных стадий обработки. Повторные замеры одной стадии суммируются
+    """
+
+    def __init__(self):
+        # стадия -> {'ms': суммарная длительность, 'count': кол-во замеров, 'bytes': объём данных}
+        self.stages: dict[str, dict] = {}
+
+    @contextmanager
+    def stage(self, name: str, bytes_count: int = 0):
+        """
+        Замер стадии
+        :param name: название стадии
+        :param bytes_count: объём обработанных на стадии данных, байт
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started, bytes_count)
+
+    def add(self, name: str, duration: float, bytes_count: int = 0):
+        """
+        :param name: название стадии
+        :param duration: длительность, сек
+        :param bytes_count: объём данных, байт
+        """
+        stage = self.stages.setdefault(name, {'ms': 0.0, 'count': 0, 'bytes': 0})
+        stage['ms'] += duration * 1000
+        stage['count'] += 1
+        stage['bytes'] += bytes_count
+
+    def add_bytes(self, name: str, bytes_count: int):
+        """
+        Объём данных стадии, известный после её замера (например, размер результата кодирования)
+        """
+        self.stages.setdefault(name, {'ms': 0.0, 'count': 0, 'bytes': 0})['bytes'] += bytes_count
+
+    @staticmethod
+    def round_stages(stages: dict) -> dict:
+        return {name: dict(stage, ms=round(stage['ms'], 2)) for name, stage in stages.items()}
+
+    def as_dict(self) -> dict:
+        return self.round_stages(self.stages)
+
+
+class JobMetrics(StageTimings):
+    """
+    Замеры задачи обработки: стадии задачи (zip, upload, total) и стадии каждого обработанного файла
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.entries: list[dict] = []
+
+    def add_entry(self, filename: str, stages: dict | None, source: str = 'processed'):
+        """
+        :param filename: имя файла (внутри архива)
+        :param stages: стадии обработки файла (StageTimings.stages) или None, если файл не обрабатывался
+        :param source: processed - обработан, cache - взят из кэша, duplicate - повтор файла архива
+        """
+        self.entries.append({'file_name': filename, 'source': source, 'stages': stages or {}})
+
+    def server_timing(self) -> str:
+        """
+        Замеры в формате заголовка Server-Timing - для ответа с содержимым файла (inline),
+        в тело которого замеры не добавляются. Имена стадий - как в гистограммах (job_, entry_)
+        """
+        stages = [(f'job_{name}', stage) for name, stage in self.stages.items()]
+        stages += [(f'entry_{name}', stage) for entry in self.entries for name, stage in entry['stages'].items()]
+        return ', '.join(f'{name};dur={stage["ms"]:.2f}' for name, stage in stages)
+
+    def as_dict(self) -> dict:
+        return {
+            'stages': super().as_dict(),
+            'entries': [dict(entry, stages=self.round_stages(entry['stages'])) for entry in self.entries],
+        }
+
+
+def get_bucket(duration_ms: float) -> str:
+    for bound in HISTOGRAM_BUCKETS_MS:
+        if duration_ms <= bound:
+            return str(bound)
+    return 'inf'
+
+
+def record_histograms(metrics: JobMetrics):
+    """
+    Добавление замеров задачи в гистограммы. Стадии задачи учитываются с префиксом job_,
+    стадии файлов - с префиксом entry_, одно наблюдение - одна задача или один файл
+    :param metrics: замеры задачи
+    """
+    if not settings.IMAGE_PROCESSING_METRICS:
+        return
+    observations = [(f'job_{name}', stage) for name, stage in metrics.stages.items()]
+    observations += [(f'entry_{name}', stage) for entry in metrics.entries for name, stage in entry['stages'].items()]
+
+    # агрегация в памяти: (стадия, интервал) -> [кол-во, длительность, мкс, объём данных]
+    counters = defaultdict(lambda: [0, 0, 0])
+    for name, stage in observations:
+        counter = counters[name, get_bucket(stage['ms'])]
+        counter[0] += 1
+        counter[1] += int(stage['ms'] * 1000)
+        counter[2] += stage['bytes']
+    if not counters:
+        return
+
+    try:
+        with transaction.atomic():
+            # недостающие строки создаются одним запросом, одновременная вставка другим процессом не ошибка
+            StageHistogramBucket.objects.bulk_create(
+                [StageHistogramBucket(stage=stage, bucket=bucket) for stage, bucket in counters],
+                ignore_conflicts=True,
+            )
+            # строки обновляются в одном порядке во всех процессах (без взаимных блокировок)
+            for (stage, bucket), (count, sum_us, bytes_count) in sorted(counters.items()):
+                StageHistogramBucket.objects.filter(stage=stage, bucket=bucket).update(
+                    count=F('count') + count, sum_us=F('sum_us') + sum_us, bytes=F('bytes') + bytes_count)
+    except Exception as err:
+        logger.error(f'Не удалось сохранить метрики обработки: {err}')
+
+
+def get_histograms() -> dict:
+    """
+    Гистограммы длительности стадий
+    :return: стадия -> {'buckets': {верхняя граница, мс: кол-во наблюдений (накопительно)},
+    'count', 'sum_ms', 'bytes'}
+    """
+    rows = defaultdict(dict)
+    for row in StageHistogramBucket.objects.all():
+        rows[row.stage][row.bucket] = row
+    bounds = [str(bound) for bound in HISTOGRAM_BUCKETS_MS] + ['inf']
+
+    histograms = {}
+    for name in sorted(rows):
+        buckets, cumulative = {}, 0
+        for bound in bounds:
+            row = rows[name].get(bound)
+            cumulative += row.count if row else 0
+            buckets[bound] = cumulative
+        histograms[name] = {
+            'buckets': buckets,
+            'count': cumulative,
+            'sum_ms': round(sum(row.sum_us for row in rows[name].values()) / 1000, 2),
+            'bytes': sum(row.bytes for row in rows[name].values()),
+        }
+    return histograms
+
+
+def get_average_duration(stage: str) -> float | None:
+    """
+    Средняя длительность стадии по гистограммам
+    :param stage: стадия (с префиксом job_ или entry_)
+    :return: секунды или None, если наблюдений нет
+    """
+    totals = StageHistogramBucket.objects.filter(stage=stage).aggregate(count=Sum('count'), sum_us=Sum('sum_us'))
+    if not totals['count']:
+        return None
+    return totals['sum_us'] / totals['count'] / 1_000_000
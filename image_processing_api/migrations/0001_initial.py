@@ -0,0 +1,37 @@
+# Generated by Django 5.2.10 on 2026-10-17 10:00
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.UUIDField(db_comment='Идентификатор задачи', default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Обрабатывается'), ('done', 'Обработано'), ('failed', 'Ошибка обработки')], db_comment='Статус задачи', default='queued', max_length=20)),
+                ('source_name', models.TextField(db_comment='Исходное имя загруженного файла')),
+                ('source_path', models.TextField(db_comment='Путь к сохранённому загруженному файлу')),
+                ('parameters', models.JSONField(db_comment='Параметры обработки (сериализатор Request без файла)')),
+                ('entries_total', models.IntegerField(db_comment='Кол-во файлов для обработки', default=0)),
+                ('entries_done', models.IntegerField(db_comment='Кол-во обработанных файлов', default=0)),
+                ('file_name', models.TextField(db_comment='Имя файла результата', null=True)),
+                ('file_url', models.TextField(db_comment='Ссылка на скачивание результата', null=True)),
+                ('error_msg', models.TextField(db_comment='Сообщение об ошибке обработки', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_comment='Дата-время создания задачи')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_comment='Дата-время последнего обновления задачи')),
+            ],
+            options={
+                'db_table': 'image_processing_job',
+                'db_table_comment': 'Задачи асинхронной обработки изображений',
+            },
+        ),
+    ]
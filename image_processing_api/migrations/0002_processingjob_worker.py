@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-17 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_processing_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='worker',
+            field=models.TextField(db_comment='Процесс, выполняющий задачу: хост и идентификатор процесса', null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.10 on 2026-10-17 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_processing_api', '0002_processingjob_worker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageHistogramBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(db_comment='Стадия обработки: job_* - задачи, entry_* - файлы', max_length=100)),
+                ('bucket', models.CharField(db_comment='Верхняя граница интервала, мс (inf - без границы)', max_length=20)),
+                ('count', models.BigIntegerField(db_comment='Кол-во наблюдений', default=0)),
+                ('sum_us', models.BigIntegerField(db_comment='Суммарная длительность наблюдений, мкс', default=0)),
+                ('bytes', models.BigIntegerField(db_comment='Суммарный объём данных наблюдений, байт', default=0)),
+            ],
+            options={
+                'db_table': 'image_processing_stage_histogram',
+                'db_table_comment': 'Гистограммы длительности стадий обработки изображений',
+                'constraints': [models.UniqueConstraint(fields=('stage', 'bucket'), name='image_processing_stage_histogram_bucket')],
+            },
+        ),
+    ]
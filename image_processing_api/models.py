@@ -1,3 +1,67 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class ProcessingJob(models.Model):
+    """
+    Задача асинхронной обработки изображения или zip-архива
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Обрабатывается'),
+        (STATUS_DONE, 'Обработано'),
+        (STATUS_FAILED, 'Ошибка обработки'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, db_comment='Идентификатор задачи')
+    status = models.CharField(max_length=20, choices=STATUSES, default=STATUS_QUEUED, db_comment='Статус задачи')
+    source_name = models.TextField(db_comment='Исходное имя загруженного файла')
+    source_path = models.TextField(db_comment='Путь к сохранённому загруженному файлу')
+    parameters = models.JSONField(db_comment='Параметры обработки (сериализатор Request без файла)')
+    entries_total = models.IntegerField(default=0, db_comment='Кол-во файлов для обработки')
+    entries_done = models.IntegerField(default=0, db_comment='Кол-во обработанных файлов')
+    file_name = models.TextField(null=True, db_comment='Имя файла результата')
+    file_url = models.TextField(null=True, db_comment='Ссылка на скачивание результата')
+    error_msg = models.TextField(null=True, db_comment='Сообщение об ошибке обработки')
+    worker = models.TextField(null=True, db_comment='Процесс, выполняющий задачу: хост и идентификатор процесса')
+    created_at = models.DateTimeField(auto_now_add=True, db_comment='Дата-время создания задачи')
+    updated_at = models.DateTimeField(auto_now=True, db_comment='Дата-время последнего обновления задачи')
+
+    class Meta:
+        db_table = 'image_processing_job'
+        db_table_comment = 'Задачи асинхронной обработки изображений'
+
+    @property
+    def progress(self) -> int:
+        """
+        Прогресс обработки, процент
+        """
+        if self.status == self.STATUS_DONE:
+            return 100
+        if not self.entries_total:
+            return 0
+        return int(self.entries_done / self.entries_total * 100)
+
+
+class StageHistogramBucket(models.Model):
+    """
+    Интервал гистограммы длительности стадии обработки изображений. Наблюдения всех процессов
+    накапливаются в одной строке на интервал (атомарное увеличение счётчиков в БД)
+    """
+    stage = models.CharField(max_length=100, db_comment='Стадия обработки: job_* - задачи, entry_* - файлы')
+    bucket = models.CharField(max_length=20, db_comment='Верхняя граница интервала, мс (inf - без границы)')
+    count = models.BigIntegerField(default=0, db_comment='Кол-во наблюдений')
+    sum_us = models.BigIntegerField(default=0, db_comment='Суммарная длительность наблюдений, мкс')
+    bytes = models.BigIntegerField(default=0, db_comment='Суммарный объём данных наблюдений, байт')
+
+    class Meta:
+        db_table = 'image_processing_stage_histogram'
+        db_table_comment = 'Гистограммы длительности стадий обработки изображений'
+        constraints = [
+            models.UniqueConstraint(fields=['stage', 'bucket'], name='image_processing_stage_histogram_bucket'),
+        ]
@@ -1,3 +1,4 @@
+import json
 import os
 
 from rest_framework import serializers
@@ -5,6 +6,22 @@ from django.core.validators import FileExtensionValidator
 from dotenv import load_dotenv
 
 ALLOWED_EXTENSIONS = ['png', 'webp', 'jpg', 'jpeg', 'svg', 'ai', 'eps', 'zip']
+# максимальное кол-во вариантов обработки одного изображения
+MAX_VARIANTS = 12
+
+
+class Variant(serializers.Serializer):
+    """
+    Вариант обработки изображения. Незаданные параметры берутся из основного запроса
+    """
+    format = serializers.CharField(required=False)
+    quality = serializers.CharField(required=False)
+    resolution = serializers.BooleanField(required=False)
+    proportion = serializers.BooleanField(required=False)
+    toggle_switch = serializers.BooleanField(required=False)
+    height = serializers.IntegerField(required=False, min_value=1)
+    width = serializers.IntegerField(required=False, min_value=1)
+    max_file_size = serializers.IntegerField(required=False, min_value=1)
 
 
 class Request(serializers.Serializer):
@@ -20,3 +37,45 @@ class Request(serializers.Serializer):
     height = serializers.IntegerField()
     width = serializers.IntegerField()
     vector = serializers.BooleanField()
+    # максимальный размер обработанного файла, байт: для JPEG и WebP подбирается наибольшее качество
+    # (не выше quality), при котором файл не превышает заданный размер
+    max_file_size = serializers.IntegerField(required=False, allow_null=True, min_value=1, default=None)
+    # асинхронная обработка: ответ с идентификатором задачи, результат - через /jobs/<job_id>/
+    async_mode = serializers.BooleanField(default=False)
+    # вернуть результат обработки одиночного изображения в теле ответа, если он не больше
+    # IMAGE_PROCESSING_INLINE_MAX_SIZE (иначе - ссылка на скачивание из хранилища)
+    inline = serializers.BooleanField(default=False)
+    # добавить в ответ замеры стадий обработки (задачи и каждого файла архива)
+    timings = serializers.BooleanField(default=False)
+    # варианты обработки (размер, формат, качество): изображение декодируется один раз,
+    # результат - zip-архив со всеми вариантами. JSON-список объектов Variant
+    variants = serializers.JSONField(required=False, default=list)
+
+    def validate(self, attrs):
+        # результат асинхронной задачи всегда загружается в хранилище и возвращается ссылкой
+        if attrs.get('async_mode') and attrs.get('inline'):
+            raise serializers.ValidationError({'inline': 'Недоступно при асинхронной обработке (async_mode)'})
+        return attrs
+
+    def validate_variants(self, value):
+        if isinstance(value, str):
+            # список вариантов, переданный строкой в теле JSON-запроса
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise serializers.ValidationError('Неверный формат JSON')
+        if not value:
+            return []
+        if not isinstance(value, list):
+            raise serializers.ValidationError('Ожидается список вариантов')
+        if len(value) > MAX_VARIANTS:
+            raise serializers.ValidationError(f'Допустимо не более {MAX_VARIANTS} вариантов')
+
+        variants = Variant(data=value, many=True)
+        if not variants.is_valid():
+            raise serializers.ValidationError([
+                f'вариант {i + 1}: ' + '; '.join(f'{field} - {", ".join(map(str, messages))}'
+                                                 for field, messages in errors.items())
+                for i, errors in enumerate(variants.errors) if errors
+            ])
+        return [dict(variant) for variant in variants.validated_data]
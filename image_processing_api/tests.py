@@ -1,3 +1,409 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from zipfile import ZipFile
 
-# Create your tests here.
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from cairosvg.parser import Tree
+
+from .admission import AdmissionController, AdmissionRejected, NodeSlots, PixelBudget
+from .FileProcessor import FileProcessor, ImageProcessor, QUALITY_SEARCH_MIN, process_zip_entry
+from .jobs import submit_job
+from .metrics import JobMetrics, get_histograms, record_histograms
+from .serializers import Request
+
+# svg с заливкой шаблоном (<pattern>): cairosvg изменяет узел шаблона при отрисовке
+PATTERN_SVG = b'''<svg xmlns="http://www.w3.org/2000/svg" width="40" height="40">
+  <defs>
+    <pattern id="fill" width="0.5" height="0.5">
+      <rect width="20" height="20" fill="#ff0000"/>
+    </pattern>
+  </defs>
+  <rect width="40" height="40" fill="url(#fill)"/>
+</svg>'''
+
+
+class SvgVariantsTests(SimpleTestCase):
+    def request_data(self, **params):
+        return {'format': 'png', 'quality': '100', 'resolution': True, 'proportion': False,
+                'toggle_switch': False, 'width': 40, 'height': 40, 'vector': False, 'max_file_size': None,
+                **params}
+
+    def test_pattern_rendered_in_every_variant(self):
+        processor = ImageProcessor(PATTERN_SVG, 'pattern.svg', self.request_data())
+        results = processor.process_variants([{}, {}, {'resolution': False, 'width': 20, 'height': 20}])
+
+        images = [Image.open(processed_file).convert('RGBA') for _, processed_file in results]
+        self.assertEqual(images[0].tobytes(), images[1].tobytes())
+        for image in images:
+            self.assertEqual(image.getpixel((image.width // 2, image.height // 2)), (255, 0, 0, 255))
+        # разобранный документ не изменяется при отрисовке
+        self.assertEqual(processor.svg_tree.children[0].children[0].tag, 'pattern')
+
+    def test_tree_copied_only_for_repeated_renders(self):
+        with mock.patch('image_processing_api.FileProcessor.SVGSurface') as surface:
+            processor = ImageProcessor(PATTERN_SVG, 'pattern.svg', self.request_data(format='original'))
+            processor.process_image()
+            self.assertIs(surface.call_args.args[0], processor.svg_tree)
+            self.assertNotIn('svg_copy', processor.timings.stages)
+
+            surface.reset_mock()
+            processor = ImageProcessor(PATTERN_SVG, 'pattern.svg', self.request_data(format='original'))
+            processor.process_variants([{}, {}, {}])
+            trees = [call.args[0] for call in surface.call_args_list]
+
+        self.assertEqual(processor.timings.stages['svg_copy']['count'], 2)
+        self.assertIsNot(trees[0], processor.svg_tree)
+        self.assertIsNot(trees[1], processor.svg_tree)
+        self.assertIs(trees[2], processor.svg_tree)
+
+
+def svg(attributes: str = '') -> bytes:
+    return f'<svg xmlns="http://www.w3.org/2000/svg" {attributes}><rect width="10" height="10"/></svg>'.encode()
+
+
+class SvgSizeTests(SimpleTestCase):
+    def request_data(self, **params):
+        return {'format': 'png', 'quality': '100', 'resolution': False, 'proportion': True,
+                'toggle_switch': True, 'width': 200, 'height': 100, 'vector': False, 'max_file_size': None,
+                **params}
+
+    def target_size(self, svg_data: bytes, **params):
+        processor = ImageProcessor(svg_data, 'image.svg', self.request_data(**params))
+        return processor._get_target_size(*processor._get_svg_size(Tree(bytestring=svg_data)))
+
+    def test_decimal_size(self):
+        self.assertEqual(self.target_size(svg('width="100.5" height="50"')), (200, 99))
+
+    def test_unit_size(self):
+        self.assertEqual(self.target_size(svg('width="595.28pt" height="841.9pt"')), (200, 282))
+        self.assertEqual(self.target_size(svg('width="210mm" height="297mm"'), toggle_switch=False), (70, 100))
+
+    def test_percent_size_uses_view_box(self):
+        self.assertEqual(self.target_size(svg('width="100%" height="100%" viewBox="0 0 40 10"')), (200, 50))
+
+    def test_dimensionless_svg(self):
+        self.assertEqual(self.target_size(svg()), (200, 100))
+
+        processor = ImageProcessor(svg(), 'image.svg', self.request_data())
+        with Image.open(processor.process_image()) as image:
+            self.assertEqual(image.size, (200, 100))
+
+
+def png(size=(20, 10), color=(255, 0, 0)) -> bytes:
+    output_file = io.BytesIO()
+    Image.new('RGB', size, color).save(output_file, format='png')
+    return output_file.getvalue()
+
+
+def request_form(**params) -> dict:
+    return {'file': SimpleUploadedFile('image.png', png()), 'format': 'png', 'quality': '90',
+            'resolution': 'true', 'proportion': 'false', 'toggle_switch': 'false', 'width': '20',
+            'height': '10', 'vector': 'false', **params}
+
+
+def jpeg(size=(20, 10), quality: int = 80) -> bytes:
+    output_file = io.BytesIO()
+    Image.new('RGB', size, (255, 0, 0)).save(output_file, format='jpeg', quality=quality)
+    return output_file.getvalue()
+
+
+@override_settings(IMAGE_PROCESSING_PASS_THROUGH=True)
+class PassThroughTests(SimpleTestCase):
+    def request_data(self, **params):
+        return {'format': 'png', 'quality': '90', 'resolution': True, 'proportion': False,
+                'toggle_switch': False, 'width': 20, 'height': 10, 'vector': False, 'max_file_size': None,
+                **params}
+
+    def process(self, image_data: bytes, filename: str = 'image.png', **params) -> tuple[ImageProcessor, bytes]:
+        processor = ImageProcessor(image_data, filename, self.request_data(**params))
+        return processor, processor.process_image().getvalue()
+
+    def assert_passed_through(self, image_data: bytes, filename: str = 'image.png', **params):
+        processor, result = self.process(image_data, filename, **params)
+        self.assertIn('pass_through', processor.timings.stages)
+        self.assertEqual(result, image_data)
+
+    def assert_processed(self, image_data: bytes, filename: str = 'image.png', **params):
+        processor, result = self.process(image_data, filename, **params)
+        self.assertNotIn('pass_through', processor.timings.stages)
+        self.assertIn('encode', processor.timings.stages)
+
+    def test_original_bytes_returned(self):
+        self.assert_passed_through(png())
+        # размер из запроса совпадает с исходным
+        self.assert_passed_through(png(), resolution=False)
+        self.assert_passed_through(png(), format='original')
+
+    def test_jpeg_quality_not_above_requested(self):
+        self.assert_passed_through(jpeg(quality=80), 'image.jpg', format='jpeg', quality='90')
+        self.assert_processed(jpeg(quality=80), 'image.jpg', format='jpeg', quality='50')
+
+    def test_skipped_for_resize(self):
+        self.assert_processed(png(), resolution=False, width=10, height=5)
+
+    def test_skipped_for_format_change(self):
+        self.assert_processed(png(), format='jpeg')
+        self.assert_processed(jpeg(), 'image.jpg', format='png')
+
+    def test_skipped_for_max_file_size(self):
+        image_data = png()
+        self.assert_processed(image_data, max_file_size=len(image_data) - 1)
+        self.assert_passed_through(image_data, max_file_size=len(image_data))
+
+    def test_skipped_when_disabled(self):
+        with self.settings(IMAGE_PROCESSING_PASS_THROUGH=False):
+            self.assert_processed(png())
+
+    def test_variants(self):
+        image_data = png()
+        processor = ImageProcessor(image_data, 'image.png', self.request_data())
+        results = processor.process_variants([{}, {'resolution': False, 'width': 10, 'height': 5}])
+
+        self.assertEqual(results[0][1].getvalue(), image_data)
+        self.assertEqual(processor.timings.stages['pass_through']['count'], 1)
+        with Image.open(results[1][1]) as image:
+            self.assertEqual(image.size, (10, 5))
+
+
+def noise(size=(64, 64)) -> Image.Image:
+    # шум плохо сжимается: размер файла заметно зависит от качества
+    return Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+
+
+class QualitySearchTests(SimpleTestCase):
+    def request_data(self, **params):
+        return {'format': 'jpeg', 'quality': '95', 'resolution': True, 'proportion': False,
+                'toggle_switch': False, 'width': 64, 'height': 64, 'vector': False, 'max_file_size': None,
+                **params}
+
+    def encoded_size(self, image: Image.Image, quality: int) -> int:
+        output_file = io.BytesIO()
+        image.save(output_file, format='jpeg', quality=quality)
+        return output_file.tell()
+
+    def test_output_fits_limit(self):
+        image = noise()
+        max_file_size = self.encoded_size(image, 50)
+        processor = ImageProcessor(b'', 'image.png', self.request_data(max_file_size=max_file_size))
+
+        output_file = processor._save_rastr(image)
+
+        self.assertLessEqual(output_file.getbuffer().nbytes, max_file_size)
+        with Image.open(output_file) as result:
+            self.assertEqual(result.format, 'JPEG')
+        # подобрано наибольшее подходящее качество, не ниже того, при котором был задан предел
+        self.assertGreaterEqual(output_file.getbuffer().nbytes, max_file_size * 0.95)
+        # бинарный поиск: запрошенное качество и не более log2(95) проходов
+        self.assertLessEqual(processor.timings.stages['encode']['count'], 8)
+
+    def test_minimum_quality_does_not_fit(self):
+        image = noise()
+        processor = ImageProcessor(b'', 'image.png', self.request_data(max_file_size=100))
+
+        with self.assertLogs('', 'WARNING') as logs:
+            output_file = processor._save_rastr(image)
+
+        self.assertEqual(output_file.getbuffer().nbytes, self.encoded_size(image, QUALITY_SEARCH_MIN))
+        self.assertIn(f'минимальном качестве {QUALITY_SEARCH_MIN}%', '\n'.join(logs.output))
+
+    def test_under_limit_encoded_once(self):
+        image = noise()
+        processor = ImageProcessor(b'', 'image.png', self.request_data(max_file_size=10 ** 7))
+
+        output_file = processor._save_rastr(image)
+
+        self.assertEqual(output_file.getbuffer().nbytes, self.encoded_size(image, 95))
+        self.assertEqual(processor.timings.stages['encode']['count'], 1)
+
+    def test_lossless_format_not_searched(self):
+        processor = ImageProcessor(b'', 'image.png', self.request_data(format='png', max_file_size=100))
+
+        with self.assertLogs('', 'WARNING'):
+            output_file = processor._save_rastr(noise())
+
+        self.assertGreater(output_file.getbuffer().nbytes, 100)
+        self.assertEqual(processor.timings.stages['encode']['count'], 1)
+
+
+def zip_file(files: list[tuple[str, bytes]]) -> SimpleUploadedFile:
+    output_file = io.BytesIO()
+    with ZipFile(output_file, 'w') as output_zip:
+        for filename, data in files:
+            output_zip.writestr(filename, data)
+    return SimpleUploadedFile('images.zip', output_file.getvalue())
+
+
+class ZipProcessingTests(SimpleTestCase):
+    def request_data(self, files: list[tuple[str, bytes]], **params):
+        return {'file': zip_file(files), 'format': 'jpeg', 'quality': '90', 'resolution': False,
+                'proportion': False, 'toggle_switch': False, 'width': 10, 'height': 5, 'vector': False,
+                'max_file_size': None, **params}
+
+    def write_zip(self, files: list[tuple[str, bytes]], workers: int = 1) -> tuple[FileProcessor, dict, mock.Mock]:
+        """
+        :return: кортеж (обработчик, содержимое файлов выходного архива по именам, вызовы process_zip_entry)
+        """
+        processor = FileProcessor(self.request_data(files), workers=workers, use_cache=False)
+        output_file = io.BytesIO()
+        # пул потоков вместо пула процессов: порядок записи и обработка повторов не зависят от вида пула
+        with mock.patch('image_processing_api.FileProcessor.process_zip_entry', wraps=process_zip_entry) as run, \
+                ThreadPoolExecutor(max(workers, 1)) as pool, \
+                mock.patch('image_processing_api.FileProcessor.get_process_pool', return_value=pool):
+            processor.write_zip(output_file)
+        with ZipFile(output_file) as output_zip:
+            return processor, {name: output_zip.read(name) for name in output_zip.namelist()}, run
+
+    def test_duplicates_copied_not_reprocessed(self):
+        image_data = png()
+        files = [('a.png', image_data), ('dir/b.png', image_data), ('c.png', png(color=(0, 0, 255))),
+                 ('d.png', image_data)]
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                processor, output, run = self.write_zip(files, workers)
+
+                self.assertEqual(sorted(call.args[1] for call in run.call_args_list), ['a.png', 'c.png'])
+                self.assertEqual(list(output), ['a.jpeg', 'dir/b.jpeg', 'c.jpeg', 'd.jpeg'])
+                self.assertEqual(output['dir/b.jpeg'], output['a.jpeg'])
+                self.assertEqual(output['d.jpeg'], output['a.jpeg'])
+                self.assertEqual([entry['source'] for entry in processor.metrics.entries],
+                                 ['processed', 'duplicate', 'processed', 'duplicate'])
+
+    def test_parallel_output_matches_serial(self):
+        files = [(f'image_{i}.png', png(size=(20 + i, 10), color=(i * 20, 0, 0))) for i in range(10)]
+        files[4:4] = [('readme.txt', b'text'), ('image_0_copy.png', files[0][1])]
+
+        _, serial_output, _ = self.write_zip(files, workers=1)
+        _, parallel_output, _ = self.write_zip(files, workers=3)
+
+        # файлы записываются в исходном порядке архива независимо от порядка завершения обработки
+        self.assertEqual(list(parallel_output), list(serial_output))
+        self.assertEqual(parallel_output, serial_output)
+        self.assertEqual(serial_output['readme.txt'], b'text')
+
+
+class AsyncInlineTests(TestCase):
+    def test_inline_rejected_with_async_mode(self):
+        data = Request(data=request_form(async_mode='true', inline='true'))
+        self.assertFalse(data.is_valid())
+        self.assertIn('inline', data.errors)
+
+    def test_job_parameters_exclude_inline(self):
+        data = Request(data=request_form(async_mode='true'))
+        self.assertTrue(data.is_valid(), data.errors)
+
+        with mock.patch('image_processing_api.jobs.get_executor') as get_executor:
+            job = submit_job({**data.validated_data, 'inline': True})
+        self.addCleanup(os.remove, job.source_path)
+
+        get_executor.return_value.submit.assert_called_once()
+        self.assertNotIn('inline', job.parameters)
+        self.assertNotIn('file', job.parameters)
+
+
+class MetricsTests(TestCase):
+    def test_histograms_accumulate_observations(self):
+        for duration in (0.002, 0.002, 0.2):
+            metrics = JobMetrics()
+            metrics.add('total', duration, 100)
+            metrics.add_entry('image.png', {'decode': {'ms': 3.0, 'count': 1, 'bytes': 10}})
+            record_histograms(metrics)
+
+        histograms = get_histograms()
+        self.assertEqual(histograms['job_total']['count'], 3)
+        self.assertEqual(histograms['job_total']['buckets']['5'], 2)
+        self.assertEqual(histograms['job_total']['buckets']['250'], 3)
+        self.assertEqual(histograms['job_total']['bytes'], 300)
+        self.assertEqual(histograms['job_total']['sum_ms'], 204.0)
+        self.assertEqual(histograms['entry_decode']['count'], 3)
+
+    def test_inline_result_recorded(self):
+        response = self.client.post('/api/image_processing/', request_form(inline='true', timings='true'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('job_total;dur=', response['Server-Timing'])
+        self.assertEqual(get_histograms()['job_total']['count'], 1)
+
+
+class AdmissionTests(TestCase):
+    def controller(self, max_pixels: int = 300, node_slots: int = 0) -> AdmissionController:
+        # быстрая полоса отключена: одиночные изображения проходят через бюджет и слоты узла
+        controller = AdmissionController(max_pixels, 0, fast_lane_pixels=0, fast_lane_slots=1)
+        if node_slots:
+            slots_dir = tempfile.TemporaryDirectory()
+            self.addCleanup(slots_dir.cleanup)
+            controller.node_slots = NodeSlots(node_slots, slots_dir.name)
+        return controller
+
+    @staticmethod
+    def image(size=(20, 10)) -> SimpleUploadedFile:
+        return SimpleUploadedFile('image.png', png(size))
+
+    def test_budget(self):
+        budget = PixelBudget(300)
+        self.assertTrue(budget.acquire(200, None))
+        self.assertTrue(budget.acquire(100, None))
+        self.assertFalse(budget.acquire(1, time.monotonic()))
+        budget.release(200)
+        budget.release(100)
+        # задача дороже всего бюджета допускается, когда других задач нет
+        self.assertTrue(budget.acquire(1000, time.monotonic()))
+
+    def test_rejected_when_budget_exceeded(self):
+        controller = self.controller()
+        with controller.admit(self.image(), 0):
+            with self.assertRaises(AdmissionRejected) as ctx:
+                with controller.admit(self.image(), 0):
+                    pass
+        self.assertEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(controller.budget.used, 0)
+
+    def test_rejected_when_node_slots_busy(self):
+        controller = self.controller(max_pixels=0, node_slots=1)
+        with controller.admit(self.image(), 0):
+            with self.assertRaises(AdmissionRejected):
+                with controller.admit(self.image(), 0):
+                    pass
+
+    def test_released_when_processing_raises(self):
+        controller = self.controller(node_slots=1)
+        with self.assertRaises(ValueError):
+            with controller.admit(self.image(), 0):
+                raise ValueError('ошибка обработки')
+
+        self.assertEqual(controller.budget.used, 0)
+        with controller.admit(self.image(), 0):
+            self.assertEqual(controller.budget.used, 200)
+
+    def test_fast_lane_released_when_processing_raises(self):
+        controller = AdmissionController(0, 0, fast_lane_pixels=1000, fast_lane_slots=1)
+        with self.assertRaises(ValueError):
+            with controller.admit(self.image(), 0):
+                raise ValueError('ошибка обработки')
+
+        with controller.admit(self.image(), 0):
+            with self.assertRaises(AdmissionRejected):
+                with controller.admit(self.image(), 0):
+                    pass
+
+    def test_view_returns_retry_after(self):
+        metrics = JobMetrics()
+        metrics.add('total', 3.2)
+        record_histograms(metrics)
+        controller = self.controller()
+        # бюджет занят другой задачей
+        controller.budget.acquire(300, None)
+
+        with mock.patch('image_processing_api.FileProcessor.admission', controller), \
+                self.settings(IMAGE_PROCESSING_ADMISSION_TIMEOUT=0):
+            response = self.client.post('/api/image_processing/', request_form())
+
+        self.assertEqual(response.status_code, 429)
+        # средняя длительность задачи, округлённая вверх
+        self.assertEqual(response['Retry-After'], '4')
+        self.assertIn('message', response.json())
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import NewRequest
+from .views import NewRequest, JobStatus, ProcessingMetrics
 
 urlpatterns = [
     path('', NewRequest.as_view()),
+    path('jobs/<uuid:job_id>/', JobStatus.as_view()),
+    path('metrics/', ProcessingMetrics.as_view()),
 ]
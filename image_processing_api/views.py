@@ -8,7 +8,14 @@ from rest_framework import serializers
 from drf_spectacular.utils import extend_schema, inline_serializer
 from dotenv import load_dotenv
 
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+
 from .serializers import Request
+from .models import ProcessingJob
+from .jobs import submit_job
+from .admission import AdmissionRejected
+from .metrics import get_histograms
 from image_processing_api.FileProcessor import FileProcessor
 
 load_dotenv()
@@ -34,7 +41,18 @@ class NewRequest(APIView):
                 name='SuccessResponse',
                 fields={
                     "file_name": serializers.CharField(help_text='имя файла'),
-                    "file_url": serializers.CharField(help_text='путь для скачивания файла')
+                    "file_url": serializers.CharField(help_text='путь для скачивания файла'),
+                    "timings": serializers.JSONField(help_text='замеры стадий обработки (при timings=true): '
+                                                               'stages - стадии задачи, entries - стадии файлов')
+                },
+                help_text='при inline=true и небольшом результате - содержимое обработанного файла, '
+                          'замеры стадий (timings=true) - в заголовке Server-Timing'
+            ),
+            202: inline_serializer(
+                name='JobCreatedResponse',
+                fields={
+                    "job_id": serializers.UUIDField(help_text='идентификатор задачи (при async_mode=true)'),
+                    "status": serializers.CharField(help_text='статус задачи')
                 }
             ),
             400: inline_serializer(
@@ -42,6 +60,13 @@ class NewRequest(APIView):
                 fields={
                     "message": serializers.CharField(help_text='описание ошибки')
                 }
+            ),
+            429: inline_serializer(
+                name='OverloadedResponse',
+                fields={
+                    "message": serializers.CharField(help_text='обработчик перегружен, повторите запрос '
+                                                               'через время из заголовка Retry-After, сек')
+                }
             )
         })
     def post(self, request):
@@ -49,17 +74,93 @@ class NewRequest(APIView):
             data = Request(data=request.data)
             if data.is_valid():
                 print(data.validated_data)
+                if data.validated_data['async_mode']:
+                    job = submit_job(data.validated_data)
+                    return Response({"job_id": job.pk, "status": job.status}, status=status.HTTP_202_ACCEPTED)
+
                 file_processor = FileProcessor(data.validated_data)
                 file_url = file_processor.start_processing()
                 logger.info('Обработка завершена.')
-                return Response({
+                if file_processor.inline_result is not None:
+                    response = FileResponse(file_processor.inline_result, filename=file_processor.output_filename)
+                    if data.validated_data['timings']:
+                        response['Server-Timing'] = file_processor.metrics.server_timing()
+                    return response
+                response = {
                     "file_name": file_processor.output_filename,
                     "file_url": file_url
-                })
+                }
+                if data.validated_data['timings']:
+                    response['timings'] = file_processor.metrics.as_dict()
+                return Response(response)
             else:
                 return Response({'message': 'Ошибка валидации',
                                  'detail': {k: ', '.join(v) for k, v in data.errors.items()}},
                                 status=status.HTTP_400_BAD_REQUEST)
+        except AdmissionRejected as err:
+            logger.warning(f'Запрос отклонён: {err}')
+            return Response({"message": str(err)}, status=status.HTTP_429_TOO_MANY_REQUESTS,
+                            headers={'Retry-After': str(err.retry_after)})
         except Exception as err:
             print(traceback.format_exc())
             return Response({"message": f"Ошибка сервера: {err}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class JobStatus(APIView):
+    """
+    Возвращает состояние асинхронной задачи обработки
+    """
+
+    @extend_schema(
+        tags=['image_processing'],
+        summary='статус задачи обработки изображений',
+        responses={
+            200: inline_serializer(
+                name='JobStatusResponse',
+                fields={
+                    "job_id": serializers.UUIDField(help_text='идентификатор задачи'),
+                    "status": serializers.CharField(help_text='статус задачи: queued, running, done, failed'),
+                    "progress": serializers.IntegerField(help_text='прогресс обработки, процент'),
+                    "entries_total": serializers.IntegerField(help_text='кол-во файлов для обработки'),
+                    "entries_done": serializers.IntegerField(help_text='кол-во обработанных файлов'),
+                    "file_name": serializers.CharField(help_text='имя файла'),
+                    "file_url": serializers.CharField(help_text='путь для скачивания файла'),
+                    "message": serializers.CharField(help_text='описание ошибки')
+                }
+            )
+        })
+    def get(self, request, job_id):
+        job = get_object_or_404(ProcessingJob, pk=job_id)
+        return Response({
+            "job_id": job.pk,
+            "status": job.status,
+            "progress": job.progress,
+            "entries_total": job.entries_total,
+            "entries_done": job.entries_done,
+            "file_name": job.file_name,
+            "file_url": job.file_url,
+            "message": f"Ошибка сервера: {job.error_msg}" if job.error_msg else None
+        })
+
+
+class ProcessingMetrics(APIView):
+    """
+    Гистограммы длительности стадий обработки изображений
+    """
+
+    @extend_schema(
+        tags=['image_processing'],
+        summary='метрики обработчика изображений',
+        responses={
+            200: inline_serializer(
+                name='ProcessingMetricsResponse',
+                fields={
+                    "histograms": serializers.JSONField(
+                        help_text='стадия (job_* - задачи, entry_* - файлы) -> buckets (верхняя граница '
+                                  'интервала, мс: накопительное кол-во наблюдений), count, sum_ms, bytes'
+                    )
+                }
+            )
+        })
+    def get(self, request):
+        return Response({"histograms": get_histograms()})
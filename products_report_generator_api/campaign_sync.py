@@ -0,0 +1,157 @@
+"""
+Синхронизация дерева наборов групп, групп и кампаний ЯД глобальной кампании с данными фронтенда.
+Текущее дерево загружается из БД один раз, вставки, обновления и удаления вычисляются в памяти
+и применяются пакетно: одним запросом bulk_create, bulk_update и delete на таблицу
+"""
+import logging
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+
+from .models import GlobalCampaign, GroupSets, CampaignGroup, YdCampaign
+
+# обновляемые поля моделей дерева
+GROUP_SET_FIELDS = ('group_set_serial_number', 'name')
+GROUP_FIELDS = ('group_serial_number', 'name', 'group_set')
+YD_CAMPAIGN_FIELDS = ('yd_campaign_serial_number', 'name', 'yd_campaign_id', 'campaign_group')
+
+logger = logging.getLogger(__name__)
+
+
+def conflict(message: str) -> APIException:
+    exc = APIException({'message': message})
+    exc.status_code = status.HTTP_409_CONFLICT
+    return exc
+
+
+def validate_names(group_sets):
+    """
+    Проверка уникальности имён наборов групп внутри кампании и имён групп внутри набора групп
+    :param group_sets: наборы групп, полученные с фронтенда
+    :raises APIException: 409 при повторяющемся имени
+    """
+    group_set_names = set()
+    for group_set in group_sets:
+        if group_set['name'] in group_set_names:
+            raise conflict(f"Набор групп с наименованием '{group_set['name']}' уже существует для данной кампании.")
+        group_set_names.add(group_set['name'])
+
+        group_names = set()
+        for group in group_set['groups']:
+            if group['name'] in group_names:
+                raise conflict(f"Группа с наименованием '{group['name']}' уже существует "
+                               f"в наборе групп '{group_set['name']}'.")
+            group_names.add(group['name'])
+
+
+def get_existing(objects: dict, pk, model_name: str):
+    """
+    Объект дерева кампании по ID, полученному с фронтенда
+    :param objects: объекты дерева из БД по ID
+    :param pk: ID объекта; пустой ID (None, 0) - новый объект
+    :param model_name: название объекта для сообщения об ошибке
+    :raises NotFound: объект с данным ID не принадлежит кампании
+    """
+    if not pk:
+        return None
+    if pk not in objects:
+        raise NotFound({'message': f'{model_name} с ID {pk} не найден(а) в данной глобальной кампании.'})
+    return objects[pk]
+
+
+def apply_values(obj, values: dict, changed: list, created: list):
+    """
+    Заполнение полей объекта: новый объект добавляется в created, существующий - в changed,
+    если значение хотя бы одного поля изменилось
+    """
+    if obj.pk is None:
+        for field, value in values.items():
+            setattr(obj, field, value)
+        created.append(obj)
+    elif any(getattr(obj, field) != value for field, value in values.items()):
+        for field, value in values.items():
+            setattr(obj, field, value)
+        changed.append(obj)
+
+
+def sync_campaign_group_items(group_sets, campaign_obj: GlobalCampaign):
+    """
+    Приведение наборов групп, групп и кампаний ЯД глобальной кампании к состоянию с фронтенда.
+    Объекты, которые есть в БД, но не пришли в запросе, считаются удалёнными на фронтенде.
+    Вызывается внутри транзакции
+    :param group_sets: наборы групп, полученные с фронтенда
+    :param campaign_obj: вновь созданный или обновляемый объект модели GlobalCampaign
+    :raises APIException: 409 при повторяющемся имени набора групп или группы
+    :raises NotFound: переданный ID не принадлежит дереву кампании
+    """
+    validate_names(group_sets)
+
+    # текущее дерево кампании - по запросу на уровень
+    bd_group_sets = {obj.pk: obj for obj in GroupSets.objects.filter(global_campaign=campaign_obj)}
+    bd_groups = {obj.pk: obj for obj in CampaignGroup.objects.filter(group_set__global_campaign=campaign_obj)}
+    bd_yd_campaigns = {obj.pk: obj for obj in
+                       YdCampaign.objects.filter(campaign_group__group_set__global_campaign=campaign_obj)}
+
+    group_sets_changed, group_sets_created = [], []
+    groups_changed, groups_created = [], []
+    yd_campaigns_changed, yd_campaigns_created = [], []
+    # группы запроса вместе с объектами групп и их наборов: новые дочерние объекты связываются
+    # с родителями после вставки родителей, когда у тех появляется ID
+    group_items = []
+
+    for group_set in group_sets:
+        group_set_obj = get_existing(bd_group_sets, group_set['group_set_id'], 'Набор групп') or GroupSets()
+        apply_values(group_set_obj, {
+            'group_set_serial_number': group_set['group_set_serial_number'],
+            'name': group_set['name'],
+            'global_campaign_id': campaign_obj.pk,
+        }, group_sets_changed, group_sets_created)
+
+        for group in group_set['groups']:
+            group_obj = get_existing(bd_groups, group['group_id'], 'Группа') or CampaignGroup()
+            group_items.append((group_obj, group_set_obj, group))
+            # проверка ID кампаний ЯД до изменения БД
+            for yd_campaign in group['campaigns']:
+                get_existing(bd_yd_campaigns, yd_campaign['campaign_id'], 'Кампания ЯД')
+
+    # удаление объектов, которые не пришли в запросе (сначала дочерние)
+    deleted_yd_campaign_ids = bd_yd_campaigns.keys() - {
+        yd_campaign['campaign_id'] for _, _, group in group_items for yd_campaign in group['campaigns']}
+    deleted_group_ids = bd_groups.keys() - {group['group_id'] for _, _, group in group_items}
+    deleted_group_set_ids = bd_group_sets.keys() - {group_set['group_set_id'] for group_set in group_sets}
+    if deleted_yd_campaign_ids:
+        YdCampaign.objects.filter(pk__in=deleted_yd_campaign_ids).delete()
+        logger.info(f'Удаленные кампании ЯД глобальной кампании {campaign_obj.pk}: {sorted(deleted_yd_campaign_ids)}')
+    if deleted_group_ids:
+        CampaignGroup.objects.filter(pk__in=deleted_group_ids).delete()
+        logger.info(f'Удаленные группы глобальной кампании {campaign_obj.pk}: {sorted(deleted_group_ids)}')
+    if deleted_group_set_ids:
+        GroupSets.objects.filter(pk__in=deleted_group_set_ids).delete()
+        logger.info(f'Удаленные наборы групп глобальной кампании {campaign_obj.pk}: {sorted(deleted_group_set_ids)}')
+
+    # наборы групп
+    GroupSets.objects.bulk_update(group_sets_changed, GROUP_SET_FIELDS)
+    GroupSets.objects.bulk_create(group_sets_created)
+
+    # группы - ID наборов групп известны после вставки
+    for group_obj, group_set_obj, group in group_items:
+        apply_values(group_obj, {
+            'group_serial_number': group['group_serial_number'],
+            'name': group['name'],
+            'group_set_id': group_set_obj.pk,
+        }, groups_changed, groups_created)
+    CampaignGroup.objects.bulk_update(groups_changed, GROUP_FIELDS)
+    CampaignGroup.objects.bulk_create(groups_created)
+
+    # кампании ЯД - ID групп известны после вставки
+    for group_obj, _, group in group_items:
+        for yd_campaign in group['campaigns']:
+            yd_campaign_obj = get_existing(bd_yd_campaigns, yd_campaign['campaign_id'], 'Кампания ЯД') or YdCampaign()
+            apply_values(yd_campaign_obj, {
+                'yd_campaign_serial_number': yd_campaign['yd_campaign_serial_number'],
+                'name': yd_campaign['campaign_name'],
+                'yd_campaign_id': str(yd_campaign['yd_campaign_id']),
+                'campaign_group_id': group_obj.pk,
+            }, yd_campaigns_changed, yd_campaigns_created)
+    YdCampaign.objects.bulk_update(yd_campaigns_changed, YD_CAMPAIGN_FIELDS)
+    YdCampaign.objects.bulk_create(yd_campaigns_created)
@@ -0,0 +1,123 @@
+"""
+Запись иерархических справочников (справочник -> группы -> элементы: действия или цели).
+Элементы справочника хранятся плоской таблицей и идентифицируются ключом
+(справочник, порядковый номер группы, порядковый номер элемента). Имена групп и элементов
+проверяются в памяти до записи в БД, строки записываются пакетно по разности с текущим состоянием
+"""
+import logging
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Action, Purpose
+
+# размер пакета запросов bulk_create / bulk_update
+BULK_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class HandbookWriter:
+    """
+    Запись элементов справочника одной модели (Action, Purpose)
+    """
+
+    def __init__(self, model, handbook_field: str, item_serial_field: str, item_name_field: str,
+                 group_names_conflict: str, item_names_conflict: str):
+        """
+        :param model: модель элементов справочника
+        :param handbook_field: поле модели со ссылкой на справочник
+        :param item_serial_field: поле модели с порядковым номером элемента внутри группы
+        :param item_name_field: поле модели с именем элемента (уникально внутри группы)
+        :param group_names_conflict: сообщение об ошибке при повторяющихся именах групп
+        :param item_names_conflict: сообщение об ошибке при повторяющихся именах элементов в группе
+        """
+        self.model = model
+        self.handbook_field = handbook_field
+        self.item_serial_field = item_serial_field
+        self.item_name_field = item_name_field
+        self.group_names_conflict = group_names_conflict
+        self.item_names_conflict = item_names_conflict
+
+    def key(self, row) -> tuple:
+        """
+        Ключ элемента: (порядковый номер группы, порядковый номер элемента)
+        :param row: словарь значений полей модели или объект модели
+        """
+        if isinstance(row, dict):
+            return row['group_serial_number'], row[self.item_serial_field]
+        return row.group_serial_number, getattr(row, self.item_serial_field)
+
+    def conflict(self, message: str) -> APIException:
+        exc = APIException(detail={'message': message})
+        exc.status_code = status.HTTP_409_CONFLICT
+        return exc
+
+    def prepare(self, rows) -> dict:
+        """
+        Проверка имён групп и элементов до записи в БД. Повторный ключ заменяет предыдущую строку
+        :param rows: словари значений полей модели (group_serial_number, group_name, порядковый номер
+        и имя элемента, остальные поля) для всех элементов справочника
+        :return: строки по ключам элементов
+        :raises APIException: 409 при повторяющихся именах групп или элементов в группе
+        """
+        items = {self.key(row): row for row in rows}
+
+        group_names = {row['group_serial_number']: row['group_name'] for row in items.values()}
+        if len(group_names) > len(set(group_names.values())):
+            raise self.conflict(self.group_names_conflict)
+
+        item_names = [(row['group_serial_number'], row[self.item_name_field]) for row in items.values()]
+        if len(item_names) > len(set(item_names)):
+            raise self.conflict(self.item_names_conflict)
+        return items
+
+    def write(self, handbook_obj, items: dict, update: bool):
+        """
+        Запись элементов справочника: изменённые строки обновляются, новые вставляются, строки,
+        которые не пришли в запросе, удаляются одним запросом. Вызывается внутри транзакции
+        :param handbook_obj: сохранённый объект справочника
+        :param items: строки по ключам элементов (результат prepare)
+        :param update: справочник уже существует в БД (у нового справочника нет элементов)
+        """
+        existing, to_delete_ids = {}, set()
+        if update:
+            for obj in self.model.objects.filter(**{self.handbook_field: handbook_obj}):
+                # строки с повторяющимся ключом удаляются
+                if self.key(obj) in existing or self.key(obj) not in items:
+                    to_delete_ids.add(obj.pk)
+                else:
+                    existing[self.key(obj)] = obj
+
+        changed, created = [], []
+        for key, row in items.items():
+            obj = existing.get(key)
+            if obj is None:
+                created.append(self.model(**{self.handbook_field: handbook_obj}, **row))
+            elif any(getattr(obj, field) != value for field, value in row.items()):
+                for field, value in row.items():
+                    setattr(obj, field, value)
+                changed.append(obj)
+
+        if to_delete_ids:
+            logger.info(f'Удаленные элементы справочника {self.model.__name__} {handbook_obj.pk}: '
+                        f'{sorted(to_delete_ids)}')
+            self.model.objects.filter(pk__in=to_delete_ids).delete()
+        if changed:
+            update_fields = [field for field in next(iter(items.values()))
+                             if field not in ('group_serial_number', self.item_serial_field)]
+            self.model.objects.bulk_update(changed, update_fields, batch_size=BULK_BATCH_SIZE)
+        self.model.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+
+
+action_writer = HandbookWriter(
+    Action, handbook_field='specification_action', item_serial_field='action_serial_number', item_name_field='name',
+    group_names_conflict='Ошибка сохранения - названия групп действий не должны повторяться.',
+    item_names_conflict='Ошибка сохранения - названия действий в группе не должны повторяться.',
+)
+purpose_writer = HandbookWriter(
+    Purpose, handbook_field='purpose_specification', item_serial_field='purpose_serial_number',
+    item_name_field='final_name',
+    group_names_conflict='Ошибка сохранения - названия групп целей не должны повторяться.',
+    item_names_conflict='Ошибка сохранения - названия целей в группе не должны повторяться.',
+)
@@ -1,3 +1,401 @@
+from datetime import datetime, timedelta, timezone
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from rest_framework.exceptions import APIException
+from rest_framework.test import APIClient
+
+from .handbook_writer import action_writer
+from .models import (Product, GlobalCampaign, SpecificationAction, SpecificationPurpose, Status, Report, GroupSets,
+                     CampaignGroup, YdCampaign, Action)
+
+
+class CampaignStatsTestCase(TestCase):
+    """
+    Модели приложения неуправляемые (таблицы схемы campaign_stats создаются вне Django),
+    поэтому таблицы создаются в тестовой БД внутри транзакции класса и откатываются вместе с ней
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        app_models = list(apps.get_app_config('products_report_generator_api').get_models())
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA IF NOT EXISTS campaign_stats')
+        try:
+            for model in app_models:
+                model._meta.managed = True
+            with connection.schema_editor() as editor:
+                for model in app_models:
+                    editor.create_model(model)
+        finally:
+            for model in app_models:
+                model._meta.managed = False
+
+
+class CreateReportDataTests(CampaignStatsTestCase):
+    url = '/api/products_report_generator/reports/create_data/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Status.objects.bulk_create([Status(id=status_id, name=f'status {status_id}') for status_id in range(3)])
+
+    def create_products(self, count: int):
+        now = datetime.now(timezone.utc)
+        for i in range(count):
+            product = Product.objects.create(name=f'product {i}', ym_counter='1', yd_login='login',
+                                             links=['https://example.com'], user_id=1)
+            campaign = GlobalCampaign.objects.create(product=product, yd_login='login', name=f'campaign {i}',
+                                                     started_at=now, ended_at=now, user_id=1)
+            action = SpecificationAction.objects.create(product=product, name=f'actions {i}', number=1, user_id=1)
+            purpose = SpecificationPurpose.objects.create(product=product, name=f'goals {i}', number=1, user_id=1)
+            Report.objects.create(user_id=1, status_id=2, product=product, global_campaign=campaign,
+                                  specification_action=action, specification_purpose=purpose,
+                                  from_datetime=now, to_datetime=now, filepath=f'reports/report_{i}.xlsx')
+
+    def assert_query_count(self, products_count: int):
+        self.create_products(products_count)
+        # продукты и по одному запросу на каждую связь: справочники действий, целей, кампании, отчёты
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        products = response.json()['products']
+        self.assertEqual(len(products), products_count)
+        for product in products:
+            self.assertEqual(len(product['actions_handbooks']), 1)
+            self.assertEqual(len(product['goals_handbooks']), 1)
+            self.assertEqual(len(product['campaigns']), 1)
+            self.assertEqual(len(product['previous_reports']), 1)
+
+    def test_query_count_single_product(self):
+        self.assert_query_count(1)
+
+    def test_query_count_does_not_depend_on_products(self):
+        self.assert_query_count(25)
+
+
+class CampaignSyncTests(CampaignStatsTestCase):
+    url = '/api/products_report_generator/campaigns/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user('user')
+        cls.product = Product.objects.create(name='product', ym_counter='1', yd_login='login',
+                                             links=['https://example.com'], user_id=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def make_group_sets(group_sets_count: int = 1, groups_count: int = 2, yd_campaigns_count: int = 2):
+        """
+        Новое дерево кампании в формате запроса фронтенда: объекты без ID
+        """
+        return [{
+            'group_set_id': None,
+            'group_set_serial_number': set_number,
+            'name': f'набор {set_number}',
+            'groups': [{
+                'group_id': None,
+                'group_serial_number': group_number,
+                'name': f'группа {group_number}',
+                'campaigns': [{
+                    'campaign_id': None,
+                    'yd_campaign_serial_number': yd_number,
+                    'yd_campaign_id': 1000 * set_number + 100 * group_number + yd_number,
+                    'campaign_name': f'кампания {group_number}.{yd_number}',
+                } for yd_number in range(yd_campaigns_count)],
+            } for group_number in range(groups_count)],
+        } for set_number in range(group_sets_count)]
+
+    def post(self, group_sets, campaign_id=None, name: str = 'кампания'):
+        return self.client.post(self.url, {
+            'campaign_id': campaign_id,
+            'campaign_name': name,
+            'product_id': self.product.pk,
+            'period_start': '2025-01-01',
+            'period_end': '2025-02-01',
+            'group_sets': group_sets,
+        }, format='json')
+
+    def get_group_sets(self, campaign_id: int):
+        """
+        Дерево кампании из ответа на редактирование в формате запроса фронтенда
+        """
+        response = self.client.get(f'{self.url}{campaign_id}/')
+        self.assertEqual(response.status_code, 200)
+        group_sets = response.json()['group_sets']
+        for group_set in group_sets:
+            for group in group_set['groups']:
+                for yd_campaign in group['campaigns']:
+                    yd_campaign['yd_campaign_id'] = int(yd_campaign['yd_campaign_id'])
+        return group_sets
+
+    def create_campaign(self, **kwargs) -> int:
+        response = self.post(self.make_group_sets(**kwargs))
+        self.assertEqual(response.status_code, 200, response.content)
+        return GlobalCampaign.objects.get(name='кампания').pk
+
+    def test_create(self):
+        campaign_id = self.create_campaign(group_sets_count=2)
+
+        self.assertEqual(GlobalCampaign.objects.get(pk=campaign_id).user_id, self.user.pk)
+        self.assertEqual((GroupSets.objects.count(), CampaignGroup.objects.count(), YdCampaign.objects.count()),
+                         (2, 4, 8))
+        group_sets = self.get_group_sets(campaign_id)
+        self.assertEqual([group_set['name'] for group_set in group_sets], ['набор 0', 'набор 1'])
+        self.assertEqual([yd_campaign['yd_campaign_id'] for yd_campaign in group_sets[1]['groups'][1]['campaigns']],
+                         [1100, 1101])
+
+    def test_rename(self):
+        campaign_id = self.create_campaign()
+        group_sets = self.get_group_sets(campaign_id)
+        group_sets[0]['name'] = 'новый набор'
+        group_sets[0]['groups'][0]['name'] = 'новая группа'
+        group_sets[0]['groups'][1]['campaigns'][0]['campaign_name'] = 'новая кампания'
+
+        response = self.post(group_sets, campaign_id)
+
+        self.assertEqual(response.status_code, 200, response.content)
+        # объекты обновлены на месте: ID сохраняются
+        self.assertEqual(self.get_group_sets(campaign_id), group_sets)
+
+    def test_remove_child(self):
+        campaign_id = self.create_campaign()
+        group_sets = self.get_group_sets(campaign_id)
+        removed_group = group_sets[0]['groups'].pop(0)
+        removed_yd_campaign = group_sets[0]['groups'][0]['campaigns'].pop()
+
+        with self.assertLogs('products_report_generator_api.campaign_sync', 'INFO') as logs:
+            response = self.post(group_sets, campaign_id)
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_group_sets(campaign_id), group_sets)
+        self.assertFalse(CampaignGroup.objects.filter(pk=removed_group['group_id']).exists())
+        removed_yd_campaign_ids = [removed_yd_campaign['campaign_id']] + [
+            yd_campaign['campaign_id'] for yd_campaign in removed_group['campaigns']]
+        self.assertFalse(YdCampaign.objects.filter(pk__in=removed_yd_campaign_ids).exists())
+        self.assertIn(str(removed_group['group_id']), '\n'.join(logs.output))
+
+    def test_move_between_groups(self):
+        campaign_id = self.create_campaign()
+        group_sets = self.get_group_sets(campaign_id)
+        source, target = group_sets[0]['groups']
+        moved = source['campaigns'].pop()
+        target['campaigns'].append(moved)
+
+        response = self.post(group_sets, campaign_id)
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(YdCampaign.objects.get(pk=moved['campaign_id']).campaign_group_id, target['group_id'])
+        self.assertEqual(YdCampaign.objects.count(), 4)
+
+    def test_unknown_id(self):
+        campaign_id = self.create_campaign()
+        group_sets = self.get_group_sets(campaign_id)
+        group_sets[0]['name'] = 'новый набор'
+        group_sets[0]['groups'][0]['group_id'] = 999999
+
+        response = self.post(group_sets, campaign_id)
+
+        self.assertEqual(response.status_code, 404)
+        # изменения запроса откатываются вместе с транзакцией
+        self.assertEqual(GroupSets.objects.get().name, 'набор 0')
+
+    def test_duplicate_name(self):
+        campaign_id = self.create_campaign()
+        group_sets = self.get_group_sets(campaign_id)
+        group_sets[0]['groups'][1]['name'] = group_sets[0]['groups'][0]['name']
+
+        response = self.post(group_sets, campaign_id)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(set(CampaignGroup.objects.values_list('name', flat=True)), {'группа 0', 'группа 1'})
+
+    def assert_update_query_count(self, groups_count: int):
+        campaign_id = self.create_campaign(groups_count=groups_count)
+        group_sets = self.get_group_sets(campaign_id)
+        group_sets[0]['name'] = 'новый набор'
+        for group in group_sets[0]['groups']:
+            group['name'] += ' (изменена)'
+            group['campaigns'][0]['campaign_name'] += ' (изменена)'
+            group['campaigns'].pop()
+            group['campaigns'].append({'campaign_id': None, 'yd_campaign_serial_number': 5,
+                                       'yd_campaign_id': 5, 'campaign_name': 'новая кампания'})
+
+        # кампания: проверка имени, продукт, кампания, сохранение; дерево: загрузка по запросу на уровень,
+        # удаление, обновление и вставка - по запросу на таблицу; 4 запроса точек сохранения транзакций
+        with self.assertNumQueries(16):
+            response = self.post(group_sets, campaign_id)
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_group_sets(campaign_id)[0]['groups'][-1]['campaigns'][-1]['campaign_name'],
+                         'новая кампания')
+
+    def test_update_query_count_single_group(self):
+        self.assert_update_query_count(1)
+
+    def test_update_query_count_does_not_depend_on_groups(self):
+        self.assert_update_query_count(25)
+
+
+class HandbookWriterTests(CampaignStatsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        product = Product.objects.create(name='product', ym_counter='1', yd_login='login',
+                                         links=['https://example.com'], user_id=1)
+        cls.handbook = SpecificationAction.objects.create(product=product, name='actions', number=0, user_id=1)
+
+    @staticmethod
+    def row(group: int, number: int, name: str, group_name: str = None, params1: str = 'param') -> dict:
+        return dict(group_serial_number=group, group_name=f'группа {group}' if group_name is None else group_name,
+                    action_serial_number=number, name=name, params1=params1)
+
+    def write(self, rows, update: bool = True):
+        action_writer.write(self.handbook, action_writer.prepare(rows), update=update)
+
+    def actions(self) -> dict:
+        return {action_writer.key(obj): obj for obj in Action.objects.filter(specification_action=self.handbook)}
+
+    def assert_conflict(self, rows):
+        with self.assertRaises(APIException) as ctx:
+            action_writer.prepare(rows)
+        self.assertEqual(ctx.exception.status_code, 409)
+
+    def test_prepare_duplicate_group_names(self):
+        self.assert_conflict([self.row(0, 0, 'действие', group_name='группа'),
+                              self.row(1, 0, 'действие', group_name='группа')])
+
+    def test_prepare_duplicate_item_names(self):
+        self.assert_conflict([self.row(0, 0, 'действие'), self.row(0, 1, 'действие')])
+        # имена элементов уникальны только внутри группы
+        items = action_writer.prepare([self.row(0, 0, 'действие'), self.row(1, 0, 'действие')])
+        self.assertEqual(list(items), [(0, 0), (1, 0)])
+
+    def test_prepare_empty_names(self):
+        self.assert_conflict([self.row(0, 0, ''), self.row(0, 1, '')])
+        self.assert_conflict([self.row(0, 0, 'действие', group_name=''), self.row(1, 0, 'действие', group_name='')])
+        self.assertEqual(action_writer.prepare([]), {})
+
+    def test_prepare_repeated_key(self):
+        # повторный ключ заменяет предыдущую строку
+        items = action_writer.prepare([self.row(0, 0, 'старое'), self.row(0, 0, 'новое')])
+        self.assertEqual(items[(0, 0)]['name'], 'новое')
+
+    def test_write_add(self):
+        self.write([self.row(0, 0, 'действие 0'), self.row(0, 1, 'действие 1')], update=False)
+        self.write([self.row(0, 0, 'действие 0'), self.row(0, 1, 'действие 1'), self.row(1, 0, 'действие 2')])
+
+        actions = self.actions()
+        self.assertEqual(sorted(actions), [(0, 0), (0, 1), (1, 0)])
+        self.assertEqual(actions[(1, 0)].group_name, 'группа 1')
+
+    def test_write_rename(self):
+        self.write([self.row(0, 0, 'действие 0'), self.row(0, 1, 'действие 1')], update=False)
+        ids = {key: obj.pk for key, obj in self.actions().items()}
+
+        self.write([self.row(0, 0, 'новое действие', group_name='новая группа', params1='новый параметр'),
+                    self.row(0, 1, 'действие 1', group_name='новая группа')])
+
+        actions = self.actions()
+        # строки обновляются на месте
+        self.assertEqual({key: obj.pk for key, obj in actions.items()}, ids)
+        self.assertEqual((actions[(0, 0)].name, actions[(0, 0)].params1), ('новое действие', 'новый параметр'))
+        self.assertEqual({obj.group_name for obj in actions.values()}, {'новая группа'})
+
+    def test_write_remove(self):
+        self.write([self.row(0, 0, 'действие 0'), self.row(0, 1, 'действие 1'), self.row(1, 0, 'действие 2')],
+                   update=False)
+        removed_ids = [obj.pk for key, obj in self.actions().items() if key != (0, 0)]
+
+        with self.assertLogs('products_report_generator_api.handbook_writer', 'INFO') as logs:
+            self.write([self.row(0, 0, 'действие 0')])
+
+        self.assertEqual(list(self.actions()), [(0, 0)])
+        self.assertIn(str(sorted(removed_ids)), logs.output[0])
+
+
+class ReportsTests(CampaignStatsTestCase):
+    url = '/api/products_report_generator/reports/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Status.objects.bulk_create([Status(id=status_id, name=f'status {status_id}') for status_id in range(3)])
+        cls.now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        cls.products = []
+        for i in range(2):
+            product = Product.objects.create(name=f'product {i}', ym_counter='1', yd_login='login',
+                                             links=['https://example.com'], user_id=1)
+            product.campaign = GlobalCampaign.objects.create(product=product, yd_login='login', name=f'campaign {i}',
+                                                             started_at=cls.now, ended_at=cls.now, user_id=1)
+            product.action = SpecificationAction.objects.create(product=product, name=f'actions {i}', number=1,
+                                                                user_id=1)
+            product.purpose = SpecificationPurpose.objects.create(product=product, name=f'goals {i}', number=1,
+                                                                  user_id=1)
+            cls.products.append(product)
+
+    def create_report(self, product_index: int = 0, status_id: int = 2, hours: int = 0, **kwargs) -> Report:
+        product = self.products[product_index]
+        report = Report.objects.create(user_id=1, status_id=status_id, product=product,
+                                       global_campaign=product.campaign, specification_action=product.action,
+                                       specification_purpose=product.purpose, from_datetime=self.now,
+                                       to_datetime=self.now, **kwargs)
+        # created_datetime заполняется при создании (auto_now_add)
+        Report.objects.filter(pk=report.pk).update(created_datetime=self.now + timedelta(hours=hours))
+        return report
+
+    def get_all_pages(self, **params) -> list[int]:
+        """
+        ID отчётов всех страниц по ссылкам next
+        """
+        report_ids = []
+        response = self.client.get(self.url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            report_ids.extend(report['report_id'] for report in data['reports'])
+            if not data['next']:
+                return report_ids
+            response = self.client.get(data['next'])
+
+    def test_cursor_ordering(self):
+        # отчёты с одинаковым временем создания упорядочиваются по ID
+        reports = [(hours, self.create_report(hours=hours).pk) for hours in (1, 3, 3, 2, 3, 1, 0)]
+        expected = [report_id for _, report_id in sorted(reports, reverse=True)]
+
+        self.assertEqual(self.get_all_pages(page_size=3), expected)
+        self.assertEqual(self.get_all_pages(), expected)
+
+    def test_previous_page(self):
+        for hours in range(5):
+            self.create_report(hours=hours)
+        first_page = self.client.get(self.url, {'page_size': 2}).json()
+        second_page = self.client.get(first_page['next']).json()
+
+        self.assertIsNone(first_page['previous'])
+        previous_page = self.client.get(second_page['previous']).json()
+        self.assertEqual(previous_page['reports'], first_page['reports'])
+
+    def test_filters(self):
+        report = self.create_report(product_index=0, status_id=1)
+        self.create_report(product_index=0, status_id=2)
+        other_product_report = self.create_report(product_index=1, status_id=1, hours=1)
+        self.create_report(product_index=1, status_id=1, to_delete=True)
+
+        self.assertEqual(len(self.get_all_pages()), 3)
+        self.assertEqual(self.get_all_pages(product_id=self.products[1].pk), [other_product_report.pk])
+        self.assertEqual(self.get_all_pages(status=1), [other_product_report.pk, report.pk])
+        self.assertEqual(self.get_all_pages(product_id=self.products[0].pk, status=1), [report.pk])
+        self.assertEqual(self.get_all_pages(status=0), [])
 
-# Create your tests here.
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'product_id': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'status': '1.5'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'invalid'}).status_code, 400)
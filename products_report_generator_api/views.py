@@ -5,22 +5,25 @@ import sys
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.exceptions import APIException
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.pagination import CursorPagination
 
 from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
-from django.db.models import ObjectDoesNotExist
+from django.db.models import ObjectDoesNotExist, Prefetch
 from django.db import transaction
 from django.shortcuts import get_object_or_404, Http404
 
 import requests
 
 from .models import Product, GlobalCampaign, Report, SpecificationAction, SpecificationPurpose, Status, \
-    SheetsForForming, YdCampaign, Action, Purpose, GroupSets, CampaignGroup
+    SheetsForForming, Action, Purpose
 from .serializers import NewReport, NewProduct, NewCampaign, NewActionHandbook, NewGoalHandbook
+from .campaign_sync import sync_campaign_group_items
+from .handbook_writer import action_writer, purpose_writer
 
 from core.settings import YM_AUTH_TOKEN, YD_AUTH_TOKEN, BASE_DIR, ACCESS_KEY, BUCKET_NAME
-from core.minio_storage import storage
+from core.storage import storage
 
 
 def error_formatter(serializer_errors):
@@ -53,7 +56,7 @@ class FormatterMixin:
             'created': report_obj.created_datetime.date(),
             'period_start': report_obj.from_datetime.date(),
             'period_end': report_obj.to_datetime.date(),
-            'status': report_obj.status.id,
+            'status': report_obj.status_id,
             'file_url': storage.share_file_from_bucket(report_obj.filepath) if report_obj.filepath else None
         }
 
@@ -93,14 +96,46 @@ class FormatterMixin:
         }
 
 
+class ReportsPagination(CursorPagination):
+    """
+    Постраничная выдача отчётов по курсору (keyset): страница выбирается условием по created_datetime,
+    время ответа не зависит от номера страницы и объёма истории отчётов
+    """
+    ordering = ('-created_datetime', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
 # Create your views here.
 class Reports(APIView, FormatterMixin):
     def get(self, request):
         """
-        Возврат данных для отображения карточек существующих отчётов
+        Возврат данных для отображения карточек существующих отчётов.
+        Параметры запроса: product_id, status - фильтры, cursor - курсор страницы (из ссылок next, previous),
+        page_size - размер страницы
         """
         try:
-            result = {'reports': map(self.report_form, Report.objects.filter(to_delete=False))}
+            reports = Report.objects.filter(to_delete=False).select_related('product', 'global_campaign')
+            try:
+                if request.query_params.get('product_id'):
+                    reports = reports.filter(product_id=int(request.query_params['product_id']))
+                if request.query_params.get('status'):
+                    reports = reports.filter(status_id=int(request.query_params['status']))
+            except ValueError:
+                return Response({'message': 'Параметры product_id и status должны быть целыми числами'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            paginator = ReportsPagination()
+            try:
+                page = paginator.paginate_queryset(reports, request, view=self)
+            except NotFound:
+                return Response({'message': 'Неверный курсор страницы'}, status=status.HTTP_400_BAD_REQUEST)
+            result = {
+                'reports': [self.report_form(report_obj) for report_obj in page],
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link()
+            }
             return Response(result)
         except Exception as err:
             return Response({'message': f'Ошибка получения отчётов: {str(err)}'},
@@ -166,25 +201,31 @@ class CreateReportData(APIView, FormatterMixin):
         Возвращает сопутствующие данные, требуемые для создания нового отчёта
         """
         try:
-            products = Product.objects.filter(to_delete=False)
+            # связанные объекты всех продуктов загружаются отдельными запросами (по одному на связь),
+            # кол-во запросов не зависит от кол-ва продуктов
+            products = Product.objects.filter(to_delete=False).only('pk', 'name').prefetch_related(
+                Prefetch('specificationaction_set', to_attr='actions_handbooks',
+                         queryset=SpecificationAction.objects.filter(to_delete=False).only('pk', 'name', 'product_id')),
+                Prefetch('specificationpurpose_set', to_attr='goals_handbooks',
+                         queryset=SpecificationPurpose.objects.filter(to_delete=False).only('pk', 'name',
+                                                                                            'product_id')),
+                Prefetch('globalcampaign_set', to_attr='campaigns',
+                         queryset=GlobalCampaign.objects.filter(to_delete=False).only('pk', 'name', 'started_at',
+                                                                                      'ended_at', 'product_id')),
+                Prefetch('report_set', to_attr='previous_reports',
+                         queryset=Report.objects.filter(to_delete=False, status_id=2, filepath__isnull=False).only(
+                             'pk', 'filepath', 'product_id')),
+            )
 
             # индивидуальная схема ответа для страницы создания отчёта
             product_formatter = lambda product_obj: {
                 "product_id": product_obj.pk,
                 "products_name": product_obj.name,
-                "actions_handbooks": [
-                    self.action_handbook_form(obj) for obj in
-                    product_obj.specificationaction_set.filter(to_delete=False)
-                ],
-                "goals_handbooks": [
-                    self.goal_handbook_form(obj) for obj in product_obj.specificationpurpose_set.filter(to_delete=False)
-                ],
-                "campaigns": [
-                    self.campaign_form(obj) for obj in product_obj.globalcampaign_set.filter(to_delete=False)
-                ],
+                "actions_handbooks": [self.action_handbook_form(obj) for obj in product_obj.actions_handbooks],
+                "goals_handbooks": [self.goal_handbook_form(obj) for obj in product_obj.goals_handbooks],
+                "campaigns": [self.campaign_form(obj) for obj in product_obj.campaigns],
                 "previous_reports": [
-                    self.previous_report_form(report_obj) for report_obj in
-                    product_obj.report_set.filter(to_delete=False, status_id=2, filepath__isnull=False)
+                    self.previous_report_form(report_obj) for report_obj in product_obj.previous_reports
                 ]
             }
 
@@ -378,101 +419,7 @@ class Campaigns(APIView, FormatterMixin):
         :param campaign_obj: вновь созданный или обновляемый объект модели GlobalCampaign
         :param update: флаг (bool) классифицирующий операцию (обновление или создание объекта)
         """
-        # удаление лишних наборов групп
-        # ID наборов групп которые пользователь обновляет
-        input_group_set_ids = set([gr_set['group_set_id'] for gr_set in group_sets if gr_set['group_set_id']])
-        # ID наборов групп из БД
-        bd_group_sets_ids = set([set_obj.pk for set_obj in campaign_obj.groupsets_set.all()])
-        # ID групп которые есть в БД но были удалены пользователем на стороне фронтенда (не пришли в запросе)
-        not_return_group_sets_ids = bd_group_sets_ids.difference(input_group_set_ids)
-        # ID наборов групп, которые не возвращены с клиента считаются удалёнными на фронтенде
-        # и соответственно удаляются из базы данных
-        if not_return_group_sets_ids:
-            # удаление наборов групп с ID из not_return_group_sets_ids
-            GroupSets.objects.filter(pk__in=not_return_group_sets_ids).delete()
-            print('Удаленные наборы групп:', not_return_group_sets_ids)
-
-        # функционал заполнения наборов групп, групп, и кампаний ЯД для объекта campaign_obj
-        # парсинг наборов групп
-        for group_set in group_sets:
-            # если у campaign_obj уже существует набор групп с данным именем, возбуждается исключение
-            if GroupSets.objects.filter(global_campaign=campaign_obj, name=group_set['name']).exclude(
-                    pk=group_set['group_set_id']).exists():
-                exc = APIException(
-                    {
-                        'message': f"Набор групп с наименованием '{group_set['name']}' уже существует для данной кампании."})
-                exc.status_code = status.HTTP_409_CONFLICT
-                raise exc
-
-            # если набор групп редактируется, извлекаем существующий набор групп из БД
-            if group_set['group_set_id']:
-                new_group_set = get_object_or_404(GroupSets, pk=group_set['group_set_id'])
-
-                # алгоритм удаления групп из БД для данного набора групп, которые были удалены пользователем со стороны фронтенда
-                # ID групп, которые пользователь обновил
-                input_group_ids = {group['group_id'] for group in group_set['groups'] if group['group_id']}
-                # ID групп из БД
-                bd_group_ids = {campaign_group_obj.pk for campaign_group_obj in new_group_set.campaigngroup_set.all()}
-                # ID групп, удаленных пользователем (на основе разности множеств)
-                not_return_groups_ids = bd_group_ids.difference(input_group_ids)
-                # удаление групп с ID из not_return_groups_ids
-                if not_return_groups_ids:
-                    new_group_set.campaigngroup_set.filter(pk__in=not_return_groups_ids).delete()
-                    print('Удаленные группы:', not_return_groups_ids)
-            # если создаётся новый набор групп
-            else:
-                new_group_set = GroupSets()
-
-            new_group_set.group_set_serial_number = group_set['group_set_serial_number']
-            new_group_set.name = group_set['name']
-            new_group_set.global_campaign = campaign_obj
-            new_group_set.save()
-
-            # парсинг групп из набора групп
-            for group in group_set['groups']:
-                # если у campaign_obj уже существует группа с данным именем возбуждается исключение
-                if CampaignGroup.objects.filter(group_set=new_group_set, name=group['name']).exclude(
-                        pk=group['group_id']).exists():
-                    exc = APIException(detail={
-                        'message': f"Группа с наименованием '{group['name']}' уже существует в наборе групп '{new_group_set.name}'."})
-                    exc.status_code = status.HTTP_409_CONFLICT
-                    raise exc
-
-                if group['group_id']:
-                    new_group = get_object_or_404(CampaignGroup, pk=group['group_id'])
-
-                    # удаление избыточных кампаний ЯД (те что есть в БД, но не пришли в запросе после редактирования)
-                    # получение множества ID кампаний ЯД отредактированных пользователей на фронтенде
-                    input_yd_campaign_ids = {yd_campaign['campaign_id'] for yd_campaign in group['campaigns'] if
-                                             yd_campaign['campaign_id']}
-                    # получение множества ID кампаний ЯД из БД
-                    bd_yd_campaign_ids = {yd_campaign_obj.pk for yd_campaign_obj in new_group.ydcampaign_set.all()}
-                    # разность множеств - получаем ID кампаний ЯД которые есть в БД, но не вернулись с фронтенда
-                    not_return_yd_campaigns_ids = bd_yd_campaign_ids.difference(input_yd_campaign_ids)
-                    # удаление кампаний ЯД если они не вернулись с фронтента после редактирования (т.е были удалены)
-                    if not_return_yd_campaigns_ids:
-                        print('Удаленные кампании ЯД:', not_return_yd_campaigns_ids)
-                        YdCampaign.objects.filter(pk__in=not_return_yd_campaigns_ids).delete()
-                else:
-                    new_group = CampaignGroup()
-
-                new_group.group_serial_number = group['group_serial_number']
-                new_group.name = group['name']
-                new_group.group_set = new_group_set
-                new_group.save()
-
-                # парсинг кампаний ЯД из группы
-                for yd_campaign in group['campaigns']:
-                    if yd_campaign['campaign_id']:
-                        new_yd_campaign = get_object_or_404(YdCampaign, pk=yd_campaign['campaign_id'])
-                    else:
-                        new_yd_campaign = YdCampaign()
-
-                    new_yd_campaign.yd_campaign_serial_number = yd_campaign['yd_campaign_serial_number']
-                    new_yd_campaign.name = yd_campaign['campaign_name']
-                    new_yd_campaign.yd_campaign_id = yd_campaign['yd_campaign_id']
-                    new_yd_campaign.campaign_group = new_group
-                    new_yd_campaign.save()
+        sync_campaign_group_items(group_sets, campaign_obj)
         return Response({'message': f'Глобальная кампания успешно {"обновлена" if update else "создана"}.'})
 
 
@@ -481,27 +428,37 @@ class CampaignToEdit(APIView, FormatterMixin):
         result = super().campaign_form(campaign_obj)
         result['product_id'] = campaign_obj.product_id
 
-        # получение ID ЯД кампаний, которые были закреплены за глобальной кампанией для отображения на фронтенде
-        yd_campaigns_objects = (YdCampaign.objects.filter(campaign_group__group_set__global_campaign=campaign_obj))
-        result['YD_campaigns_ids_active'] = [yd_campaign_obj.yd_campaign_id for yd_campaign_obj in yd_campaigns_objects]
+        # дерево наборов групп, групп и кампаний ЯД загружается тремя запросами (по одному на уровень)
+        group_sets = campaign_obj.groupsets_set.prefetch_related(
+            Prefetch('campaigngroup_set', to_attr='groups'),
+            Prefetch('groups__ydcampaign_set', to_attr='yd_campaigns'),
+        )
 
+        # ID ЯД кампаний, которые были закреплены за глобальной кампанией, для отображения на фронтенде
+        yd_campaigns_ids_active = result['YD_campaigns_ids_active'] = []
         # запролнение наборов групп, групп и кампаний ЯД для данной глобальной кампании
-        result['group_sets'] = [{
-            'group_set_id': group_set_obj.pk,
-            'group_set_serial_number': group_set_obj.group_set_serial_number,
-            'name': group_set_obj.name,
-            'groups': [{
-                'group_id': group_obj.pk,
-                'group_serial_number': group_obj.group_serial_number,
-                'name': group_obj.name,
-                'campaigns': [{
-                    'campaign_id': yd_campaign_obj.pk,
-                    'yd_campaign_serial_number': yd_campaign_obj.yd_campaign_serial_number,
-                    'yd_campaign_id': yd_campaign_obj.yd_campaign_id,
-                    'campaign_name': yd_campaign_obj.name
-                } for yd_campaign_obj in group_obj.ydcampaign_set.all()]
-            } for group_obj in group_set_obj.campaigngroup_set.all()]
-        } for group_set_obj in campaign_obj.groupsets_set.all()]
+        result['group_sets'] = []
+        for group_set_obj in group_sets:
+            groups = []
+            for group_obj in group_set_obj.groups:
+                groups.append({
+                    'group_id': group_obj.pk,
+                    'group_serial_number': group_obj.group_serial_number,
+                    'name': group_obj.name,
+                    'campaigns': [{
+                        'campaign_id': yd_campaign_obj.pk,
+                        'yd_campaign_serial_number': yd_campaign_obj.yd_campaign_serial_number,
+                        'yd_campaign_id': yd_campaign_obj.yd_campaign_id,
+                        'campaign_name': yd_campaign_obj.name
+                    } for yd_campaign_obj in group_obj.yd_campaigns]
+                })
+                yd_campaigns_ids_active.extend(yd_campaign_obj.yd_campaign_id for yd_campaign_obj in group_obj.yd_campaigns)
+            result['group_sets'].append({
+                'group_set_id': group_set_obj.pk,
+                'group_set_serial_number': group_set_obj.group_set_serial_number,
+                'name': group_set_obj.name,
+                'groups': groups
+            })
         return result
 
     def get(self, request, campaign_id):
@@ -568,8 +525,6 @@ class ActionsHandbooks(APIView, FormatterMixin):
             # если обновляется существующий объект
             if exist_handbook_id:
                 new_action_handbook = get_object_or_404(SpecificationAction, pk=exist_handbook_id, to_delete=False)
-                # множество для отслеживания ID созданных или отредактированых наборов действий / действий
-                edited_or_created_objects_ids = set()
             # если создаётся новый объект
             else:
                 new_action_handbook = SpecificationAction()
@@ -580,64 +535,28 @@ class ActionsHandbooks(APIView, FormatterMixin):
             new_action_handbook.number = actions_count
 
             try:
+                # строки действий справочника: группы действий хранятся в строках действий
+                action_rows = [dict(
+                    group_serial_number=action_group['action_group_serial_number'],
+                    group_name=action_group['action_group_name'],
+                    action_serial_number=action['action_serial_number'],
+                    name=action['name'],
+                    params1=action['parameters']['param1'],
+                    params2=action['parameters']['param2'],
+                    params3=action['parameters']['param3'],
+                    params4=action['parameters']['param4'],
+                    params5=action['parameters']['param5'],
+                    params6=action['parameters']['param6'],
+                    params7=action['parameters']['param7'],
+                    params8=action['parameters']['param8'],
+                    params9=action['parameters']['param9'],
+                    params10=action['parameters']['param10']
+                ) for action_group in action_groups for action in action_group['actions']]
+                # проверка наличия дублирующихся имён групп или имён действий до записи в БД
+                actions = action_writer.prepare(action_rows)
                 new_action_handbook.save()
-                # парсинг групп действий
-                for action_group in action_groups:
-                    actions = action_group['actions']
-                    group_serial_number = action_group['action_group_serial_number']
-                    action_group_name = action_group['action_group_name']
-
-                    # парсинг действий в группе действий
-                    for action in actions:
-
-                        obj, created = Action.objects.update_or_create(
-                            specification_action=new_action_handbook,
-                            group_serial_number=group_serial_number,
-                            action_serial_number=action['action_serial_number'],
-                            defaults=dict(
-                                group_name=action_group_name,
-                                name=action['name'],
-                                params1=action['parameters']['param1'],
-                                params2=action['parameters']['param2'],
-                                params3=action['parameters']['param3'],
-                                params4=action['parameters']['param4'],
-                                params5=action['parameters']['param5'],
-                                params6=action['parameters']['param6'],
-                                params7=action['parameters']['param7'],
-                                params8=action['parameters']['param8'],
-                                params9=action['parameters']['param9'],
-                                params10=action['parameters']['param10']
-                            )
-                        )
-                        # если происходит обновление, добавляем идентификатор обновляемого объекта в отслеживаемые
-                        if exist_handbook_id:
-                            edited_or_created_objects_ids.add(obj.pk)
-
-                # если обновляется существующий объект - чистим бд от лишних групп действий / действий по этому объекту
-                if exist_handbook_id:
-                    exist_obj_ids = {action_obj.pk for action_obj in new_action_handbook.action_set.all()}
-                    action_to_delete_ids = exist_obj_ids.difference(edited_or_created_objects_ids)
-                    print('Удаленные действия / группы действий:', action_to_delete_ids)
-                    Action.objects.filter(pk__in=action_to_delete_ids).delete()
-
-                # проверка наличия дублирующихся имён групп или имён действий
-                actions_obj = Action.objects.filter(specification_action=new_action_handbook)
-                # список имён групп для данного справочника
-                action_groups_names = actions_obj.distinct('group_serial_number').values_list('group_name', flat=True)
-                # список кортежей (номер группы, имя действия) для данного справочника
-                actions_names = actions_obj.values_list('group_serial_number', 'name')
-
-                # если кол-во элементов query_set > кол-ва элементов множества значит есть повторения имён
-                if action_groups_names.count() > len(set(action_groups_names)):
-                    exc = APIException(
-                        detail={'message': 'Ошибка сохранения - названия групп действий не должны повторяться.'})
-                    exc.status_code = status.HTTP_409_CONFLICT
-                    raise exc
-                elif actions_names.count() > len(set(actions_names)):
-                    exc = APIException(
-                        detail={'message': 'Ошибка сохранения - названия действий в группе не должны повторяться.'})
-                    exc.status_code = status.HTTP_409_CONFLICT
-                    raise exc
+                # запись действий, удаление действий / групп действий, которые не пришли в запросе
+                action_writer.write(new_action_handbook, actions, update=bool(exist_handbook_id))
 
                 return Response(
                     {'message': f'Справочник действий успешно {"обновлён" if exist_handbook_id else "создан"}.'})
@@ -751,8 +670,6 @@ class GoalsHandbooks(APIView, FormatterMixin):
             # если обновляем существующий объект
             if exist_handbook_id:
                 new_goal_handbook = get_object_or_404(SpecificationPurpose, pk=exist_handbook_id, to_delete=False)
-                # множество для отслеживания ID созданных или отредактированых наборов целей / целей
-                edited_or_created_objects_ids = set()
             # если создаётся новый объект
             else:
                 new_goal_handbook = SpecificationPurpose()
@@ -764,56 +681,20 @@ class GoalsHandbooks(APIView, FormatterMixin):
             new_goal_handbook.number = purpose_count
 
             try:
+                # строки целей справочника: группы целей хранятся в строках целей
+                purpose_rows = [{
+                    'group_serial_number': group['purpose_group_serial_number'],
+                    'group_name': group['purpose_group_name'],
+                    'purpose_serial_number': purpose['purpose_serial_number'],
+                    'purpose_id': purpose['purpose_id'],
+                    'ym_name': purpose['ym_name'],
+                    'final_name': purpose['final_name']
+                } for group in purpose_group for purpose in group['purposes']]
+                # проверка наличия дублирующихся имён групп или имён целей до записи в БД
+                purposes = purpose_writer.prepare(purpose_rows)
                 new_goal_handbook.save()
-                # парсинг групп целей
-                for group in purpose_group:
-                    purposes = group['purposes']
-                    purpose_group_serial_number = group['purpose_group_serial_number']
-                    # парсинг целей в группе
-                    for purpose in purposes:
-                        obj, created = Purpose.objects.update_or_create(
-                            purpose_specification=new_goal_handbook,
-                            group_serial_number=purpose_group_serial_number,
-                            purpose_serial_number=purpose['purpose_serial_number'],
-                            defaults={
-                                'group_name': group['purpose_group_name'],
-                                'purpose_id': purpose['purpose_id'],
-                                'ym_name': purpose['ym_name'],
-                                'final_name': purpose['final_name']}
-                        )
-                        # если редактируется существующий справочник целей
-                        if exist_handbook_id:
-                            # добавляем ID отредактированного / созданного объекта цели в множество редактируемых объектов
-                            edited_or_created_objects_ids.add(obj.pk)
-
-                # если редактируется существующий справочник целей - очищаем БД от лишних групп целей (если имеются)
-                if exist_handbook_id:
-                    # получаем множество существующих ID целей из БД
-                    exist_purpose_obj_ids = {purpose_obj.pk for purpose_obj in new_goal_handbook.purpose_set.all()}
-                    # получаем ID целей, которые не вернулись с фронтенда (были удалены) путём разности множеств
-                    purpose_to_delete_ids = exist_purpose_obj_ids.difference(edited_or_created_objects_ids)
-                    print('Удалённые группы целей / цели:', purpose_to_delete_ids)
-                    # Удалёем лишние цели которые не вернулись с фронтенда из БД
-                    Purpose.objects.filter(pk__in=purpose_to_delete_ids).delete()
-
-                # проверка наличия дублирующихся имён групп или имён целей
-                goals_obj = Purpose.objects.filter(purpose_specification=new_goal_handbook)
-                # список имён целей для данного справочника
-                goal_groups_names = goals_obj.distinct('group_serial_number').values_list('group_name', flat=True)
-                # список кортежей (номер группы, имя цели) для данного справочника
-                actions_names = goals_obj.values_list('group_serial_number', 'final_name')
-
-                # если кол-во элементов query_set > кол-ва элементов множества значит есть повторения имён
-                if goal_groups_names.count() > len(set(goal_groups_names)):
-                    exc = APIException(
-                        detail={'message': 'Ошибка сохранения - названия групп целей не должны повторяться.'})
-                    exc.status_code = status.HTTP_409_CONFLICT
-                    raise exc
-                elif actions_names.count() > len(set(actions_names)):
-                    exc = APIException(
-                        detail={'message': 'Ошибка сохранения - названия целей в группе не должны повторяться.'})
-                    exc.status_code = status.HTTP_409_CONFLICT
-                    raise exc
+                # запись целей, удаление целей / групп целей, которые не пришли с фронтенда
+                purpose_writer.write(new_goal_handbook, purposes, update=bool(exist_handbook_id))
 
                 # возрат сообщения об обновлении (created=False) или создании (created=True) объекта obj
                 return Response(
@@ -975,10 +856,7 @@ class YDCampaigns(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def load_cookies_from_minio(self, bucket_name=BUCKET_NAME, object_name="cookies_for_campaigns/user_1_cookies.json"):
-        response = storage.client.get_object(bucket_name, object_name)
-        data = response.read().decode("utf-8")
-        response.close()
-        response.release_conn()
+        data = storage.get_object(object_name, bucket_name).decode("utf-8")
         return json.loads(data)
 
     def update_headers_with_csrf(self, headers: dict, cookies: dict) -> dict:
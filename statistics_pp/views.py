@@ -12,7 +12,7 @@ from rest_framework.pagination import PageNumberPagination
 
 from .serializers import ProviderParameters, NewSegment
 from .models import Metric, RegionCodifier, OKPD2Codifier, Segment, OKPD2, Process, Region
-from core.minio_storage import storage
+from core.storage import storage
 
 
 # Create your views here.